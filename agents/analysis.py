@@ -2,22 +2,51 @@
 Analysis Agent - Analyzes research facts to provide insights and comparisons
 """
 
-from langchain.prompts import ChatPromptTemplate
+from typing import AsyncIterator, Iterator
+from core.prompts import ChatPrompt
+from core.budget import fit_facts, format_facts, output_cap, remaining_budget
+from config import ANALYSIS_PROMPT_BUDGET, MAX_ANALYSIS_LENGTH
 
-ANALYSIS_PROMPT = ChatPromptTemplate.from_messages([
+ANALYSIS_PROMPT = ChatPrompt.from_messages([
     ("system", "You are Analysis. Using ReAct, reason step-by-step but return only the final analysis.\n"
                "Compare tradeoffs, address constraints, and be specific."),
-    ("human", "Question: {question}\nFacts: {facts}")
+    ("human", "Question: {question}\nFacts:\n{facts}")
 ])
 
 def analyze_facts(question: str, facts: list, llm) -> str:
     """Analyze research facts using the analysis agent."""
-    messages = ANALYSIS_PROMPT.format_messages(
-        question=question,
-        facts=facts
-    )
+    messages = _analysis_messages(question, facts)
     
-    response = llm.invoke(messages)
+    response = llm.invoke(messages, **output_cap(MAX_ANALYSIS_LENGTH))
     analysis = getattr(response, "content", str(response)).strip()
     
-    return analysis 
\ No newline at end of file
+    return analysis
+
+async def aanalyze_facts(question: str, facts: list, llm) -> str:
+    """Async version of analyze_facts using llm.ainvoke."""
+    messages = _analysis_messages(question, facts)
+    
+    response = await llm.ainvoke(messages, **output_cap(MAX_ANALYSIS_LENGTH))
+    return getattr(response, "content", str(response)).strip()
+
+def stream_analysis(question: str, facts: list, llm) -> Iterator[str]:
+    """Yield the analysis text chunk by chunk using llm.stream."""
+    messages = _analysis_messages(question, facts)
+    
+    for chunk in llm.stream(messages, **output_cap(MAX_ANALYSIS_LENGTH)):
+        yield getattr(chunk, "content", str(chunk))
+
+async def astream_analysis(question: str, facts: list, llm) -> AsyncIterator[str]:
+    """Async version of stream_analysis using llm.astream."""
+    messages = _analysis_messages(question, facts)
+    
+    async for chunk in llm.astream(messages, **output_cap(MAX_ANALYSIS_LENGTH)):
+        yield getattr(chunk, "content", str(chunk))
+
+def _analysis_messages(question: str, facts: list):
+    """Build the analysis prompt with the most relevant facts that fit the budget."""
+    budget = remaining_budget(ANALYSIS_PROMPT, ANALYSIS_PROMPT_BUDGET, "facts", question=question)
+    return ANALYSIS_PROMPT.format_messages(
+        question=question,
+        facts=format_facts(fit_facts(facts, budget, question))
+    )
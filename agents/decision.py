@@ -2,21 +2,50 @@
 Decision Agent - Makes final recommendations based on analysis
 """
 
-from langchain.prompts import ChatPromptTemplate
+from typing import AsyncIterator, Iterator
+from core.prompts import ChatPrompt
+from core.budget import output_cap, remaining_budget, truncate_to_budget
+from config import DECISION_PROMPT_BUDGET, MAX_DECISION_LENGTH
 
-DECISION_PROMPT = ChatPromptTemplate.from_messages([
+DECISION_PROMPT = ChatPrompt.from_messages([
     ("system", "You are Decision. Produce a concise, actionable recommendation with a short rationale and 2–3 caveats."),
     ("human", "Question: {question}\nAnalysis: {analysis}")
 ])
 
 def make_decision(question: str, analysis: str, llm) -> str:
     """Make a decision using the decision agent."""
-    messages = DECISION_PROMPT.format_messages(
-        question=question,
-        analysis=analysis
-    )
+    messages = _decision_messages(question, analysis)
     
-    response = llm.invoke(messages)
+    response = llm.invoke(messages, **output_cap(MAX_DECISION_LENGTH))
     decision = getattr(response, "content", str(response)).strip()
     
-    return decision 
\ No newline at end of file
+    return decision
+
+async def amake_decision(question: str, analysis: str, llm) -> str:
+    """Async version of make_decision using llm.ainvoke."""
+    messages = _decision_messages(question, analysis)
+    
+    response = await llm.ainvoke(messages, **output_cap(MAX_DECISION_LENGTH))
+    return getattr(response, "content", str(response)).strip()
+
+def stream_decision(question: str, analysis: str, llm) -> Iterator[str]:
+    """Yield the decision text chunk by chunk using llm.stream."""
+    messages = _decision_messages(question, analysis)
+    
+    for chunk in llm.stream(messages, **output_cap(MAX_DECISION_LENGTH)):
+        yield getattr(chunk, "content", str(chunk))
+
+async def astream_decision(question: str, analysis: str, llm) -> AsyncIterator[str]:
+    """Async version of stream_decision using llm.astream."""
+    messages = _decision_messages(question, analysis)
+    
+    async for chunk in llm.astream(messages, **output_cap(MAX_DECISION_LENGTH)):
+        yield getattr(chunk, "content", str(chunk))
+
+def _decision_messages(question: str, analysis: str):
+    """Build the decision prompt, trimming the analysis to the stage budget."""
+    budget = remaining_budget(DECISION_PROMPT, DECISION_PROMPT_BUDGET, "analysis", question=question)
+    return DECISION_PROMPT.format_messages(
+        question=question,
+        analysis=truncate_to_budget(analysis, budget)
+    )
@@ -0,0 +1,81 @@
+"""
+Fused Agent - Runs perception, research, analysis and decision in a single LLM call
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+from core.prompts import ChatPrompt
+from core.budget import fit_facts, format_facts, output_cap, remaining_budget
+from core.tracing import record_fallback
+from config import MAX_ANALYSIS_LENGTH, MAX_DECISION_LENGTH, RESEARCH_PROMPT_BUDGET
+
+# Output tokens for the intent, entities, facts and JSON around analysis and decision
+FUSED_OUTPUT_OVERHEAD = 256
+
+FUSED_PROMPT = ChatPrompt.from_messages([
+    ("system", "You are a research assistant that answers in one pass.\n"
+               "1. Extract the user intent (compare, recommend, explain or factual) and key entities.\n"
+               "2. Gather 3–6 concise, verifiable facts (use the local KB where relevant).\n"
+               "3. Analyze the tradeoffs specific to the question.\n"
+               "4. Give a concise, actionable recommendation with a short rationale and 2–3 caveats.\n"
+               "Return ONLY a JSON object with keys: intent (string), entities (array of strings), "
+               "normalized_question (string), facts (array of strings), analysis (string), decision (string)."),
+    ("human", "Question: {question}\n\nHere is a tiny local KB you may use:\n{kb}")
+])
+
+def run_fused(question: str, kb_items: List[str], llm) -> Optional[Dict[str, Any]]:
+    """Answer the question with one call; None when the output cannot be parsed."""
+    messages = _fused_messages(question, kb_items)
+    raw = llm.invoke(messages, **fused_output_cap())
+    return _parse_or_record(getattr(raw, "content", str(raw)), question)
+
+async def arun_fused(question: str, kb_items: List[str], llm) -> Optional[Dict[str, Any]]:
+    """Async version of run_fused using llm.ainvoke."""
+    messages = _fused_messages(question, kb_items)
+    raw = await llm.ainvoke(messages, **fused_output_cap())
+    return _parse_or_record(getattr(raw, "content", str(raw)), question)
+
+def fused_output_cap() -> dict:
+    """The analysis and decision caps combined, plus room for the other fields; uncapped if either is."""
+    if MAX_ANALYSIS_LENGTH <= 0 or MAX_DECISION_LENGTH <= 0:
+        return {}
+    return output_cap(MAX_ANALYSIS_LENGTH + MAX_DECISION_LENGTH + FUSED_OUTPUT_OVERHEAD)
+
+def _fused_messages(question: str, kb_items: List[str]):
+    """Build the fused prompt with the knowledge base facts that fit the research budget."""
+    budget = remaining_budget(FUSED_PROMPT, RESEARCH_PROMPT_BUDGET, "kb", question=question)
+    return FUSED_PROMPT.format_messages(question=question, kb=format_facts(fit_facts(kb_items, budget)))
+
+def _parse_or_record(content: str, question: str) -> Optional[Dict[str, Any]]:
+    result = parse_fused(content, question)
+    if result is None:
+        record_fallback("fused_json")
+    return result
+
+def parse_fused(content: str, question: str) -> Optional[Dict[str, Any]]:
+    """Map the fused JSON onto Memory keys, or return None if it is unusable."""
+    # Tolerate code fences or chatter around the JSON object
+    start, end = content.find("{"), content.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+
+    decision = data.get("decision")
+    facts = data.get("facts", [])
+    entities = data.get("entities", [])
+    if not isinstance(decision, str) or not decision.strip():
+        return None
+    if not isinstance(facts, list) or not isinstance(entities, list):
+        return None
+
+    return {
+        "intent": data.get("intent") or "general_query",
+        "entities": [str(e) for e in entities],
+        "normalized_question": data.get("normalized_question") or question,
+        "research_facts": [str(f) for f in facts],
+        "analysis": str(data.get("analysis") or ""),
+        "decision": decision.strip(),
+    }
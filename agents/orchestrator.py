@@ -2,9 +2,9 @@
 Orchestrator Agent - Coordinates the workflow between different specialist agents
 """
 
-from langchain.prompts import ChatPromptTemplate
+from core.prompts import ChatPrompt
 
-ORCHESTRATOR_PROMPT = ChatPromptTemplate.from_messages([
+ORCHESTRATOR_PROMPT = ChatPrompt.from_messages([
     ("system", "You are the Orchestrator. Given perception (intent, entities) and STM, choose next step.\n"
                "Options: research, analysis, decision, done.\n"
                "Rules:\n"
@@ -16,18 +16,50 @@ ORCHESTRATOR_PROMPT = ChatPromptTemplate.from_messages([
     ("human", "intent={intent}\nentities={entities}\nresearch_facts={research_facts}\nanalysis={analysis}\ndecision={decision}")
 ])
 
+# Intents answered straight from research facts, without an analysis pass
+FACTUAL_INTENTS = {"factual", "factual_query", "fact", "lookup", "definition"}
+
+def route_next_step(state: dict) -> str:
+    """Choose the next step from state alone, without an LLM round trip.
+
+    Applies the same rules as ORCHESTRATOR_PROMPT; ``step`` holds the last
+    completed stage so an empty research result still moves the run forward.
+    Simple factual intents skip analysis and go straight to decision.
+    """
+    if state.get("decision") is not None:
+        return "done"
+    if state.get("analysis") is not None:
+        return "decision"
+    if state.get("research_facts") or state.get("step") == "research":
+        if str(state.get("intent") or "").lower() in FACTUAL_INTENTS:
+            return "decision"
+        return "analysis"
+    return "research"
+
 def decide_next_step(state: dict, llm) -> str:
-    """Decide which agent should run next based on current state."""
-    messages = ORCHESTRATOR_PROMPT.format_messages(
+    """Decide which agent should run next based on current state (LLM-driven)."""
+    messages = _orchestrator_messages(state)
+    step = llm.invoke(messages).content.strip().lower()
+    return _validate_step(step, state)
+
+async def adecide_next_step(state: dict, llm) -> str:
+    """Async version of decide_next_step using llm.ainvoke."""
+    messages = _orchestrator_messages(state)
+    step = (await llm.ainvoke(messages)).content.strip().lower()
+    return _validate_step(step, state)
+
+def _orchestrator_messages(state: dict):
+    """Format the orchestrator prompt from the current state."""
+    return ORCHESTRATOR_PROMPT.format_messages(
         intent=state.get("intent"),
         entities=state.get("entities"),
         research_facts=state.get("research_facts", []),
         analysis=state.get("analysis"),
         decision=state.get("decision"),
     )
-    
-    step = llm.invoke(messages).content.strip().lower()
-    
+
+def _validate_step(step: str, state: dict) -> str:
+    """Validate the chosen step, falling back to state-based rules."""
     # Validate and fallback logic
     if step not in {"research", "analysis", "decision", "done"}:
         if not state.get("research_facts"):
@@ -39,4 +71,4 @@ def decide_next_step(state: dict, llm) -> str:
         else:
             step = "done"
     
-    return step 
\ No newline at end of file
+    return step
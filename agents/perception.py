@@ -3,22 +3,112 @@ Perception Agent - Extracts user intent and key entities from input
 """
 
 import json
-from typing import Dict, List, Any
-from langchain.prompts import ChatPromptTemplate
+import re
+from typing import Dict, List, Any, Optional, Tuple
+from core.prompts import ChatPrompt
+from core.gazetteer import entity_gazetteer
+from core.tracing import record_fallback, record_fast_path
+from config import ENABLE_PERCEPTION_FAST_PATH, PERCEPTION_FAST_PATH_CONFIDENCE
 
-PERCEPTION_PROMPT = ChatPromptTemplate.from_messages([
+PERCEPTION_PROMPT = ChatPrompt.from_messages([
     ("system", "You are Perception. Extract user intent and key entities.\n"
                "Return compact JSON with keys: intent, entities (array), normalized_question.\n"
+               "Use a short intent label such as compare, recommend, explain or factual.\n"
                "Be concise and do not include any extra commentary."),
     ("human", "{question}")
 ])
 
-def extract_intent_and_entities(question: str, llm) -> Dict[str, Any]:
-    """Extract intent and entities from user question using the perception agent."""
-    messages = PERCEPTION_PROMPT.format_messages(question=question)
+# Follow-up questions in a session: earlier turns let perception resolve references
+FOLLOWUP_PROMPT = ChatPrompt.from_messages([
+    ("system", "You are Perception. Extract user intent and key entities.\n"
+               "Return compact JSON with keys: intent, entities (array), normalized_question.\n"
+               "Use a short intent label such as compare, recommend, explain or factual.\n"
+               "Resolve references to the conversation so normalized_question and entities stand on their own.\n"
+               "Be concise and do not include any extra commentary."),
+    ("human", "Conversation so far:\n{context}\n\nQuestion: {question}")
+])
+
+# Intent cues checked in order; the first that matches wins
+INTENT_RULES = [
+    ("compare", re.compile(r"\b(vs\.?|versus|compare[sd]?|comparison|difference|better than)\b|\bor\b")),
+    ("recommend", re.compile(r"\b(best|recommend\w*|should|which|choose|top)\b")),
+    ("explain", re.compile(r"\b(how|why|explain\w*|describe|what is|what are)\b")),
+]
+
+# Words that point back into the conversation; a follow-up using them needs FOLLOWUP_PROMPT
+ANAPHORA = re.compile(r"\b(it|its|it's|that|this|those|these|they|them|their|one|ones|former|latter|same|"
+                      r"above|earlier|previous|instead|also|too|what about|how about)\b")
+
+def local_perception(question: str) -> Tuple[Dict[str, Any], float]:
+    """Rule-based perception: KB entity gazetteer plus intent cues, no LLM call.
+
+    Returns the same dict shape as the LLM path and a confidence in [0, 1].
+    Confidence is high only when the cue and the entities agree, e.g. a
+    comparison that names at least two known entities.
+    """
+    gazetteer = entity_gazetteer()
+    entities = gazetteer.entities(question) if gazetteer is not None else []
+    lowered = question.lower()
+    intent = next((name for name, pattern in INTENT_RULES if pattern.search(lowered)), None)
+    if not entities:
+        confidence = 0.0
+    elif intent == "compare":
+        confidence = 0.9 if len(entities) >= 2 else 0.4
+    elif intent is not None:
+        confidence = 0.8
+    else:
+        confidence = 0.5
+    result = {
+        "intent": intent or "factual",
+        "entities": entities,
+        "normalized_question": " ".join(question.split()),
+    }
+    return result, confidence
+
+def _fast_path(question: str, context: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """The local result when it is confident enough to skip the LLM, else None.
+
+    Inside a session a question that refers back to earlier turns always
+    goes to the LLM, which resolves the reference against ``context``.
+    """
+    if not ENABLE_PERCEPTION_FAST_PATH:
+        return None
+    if context and ANAPHORA.search(question.lower()):
+        return None
+    result, confidence = local_perception(question)
+    hit = confidence >= PERCEPTION_FAST_PATH_CONFIDENCE
+    record_fast_path("perception", hit)
+    return result if hit else None
+
+def extract_intent_and_entities(question: str, llm, context: Optional[str] = None) -> Dict[str, Any]:
+    """Extract intent and entities from user question using the perception agent.
+
+    ``context`` (earlier turns of a session) lets follow-ups such as "and
+    its battery life?" be rewritten into a standalone question.
+    """
+    local = _fast_path(question, context)
+    if local is not None:
+        return local
+    messages = _perception_messages(question, context)
     raw = llm.invoke(messages)
-    content = getattr(raw, "content", str(raw))
-    
+    return _parse_perception(getattr(raw, "content", str(raw)), question)
+
+async def aextract_intent_and_entities(question: str, llm, context: Optional[str] = None) -> Dict[str, Any]:
+    """Async version of extract_intent_and_entities using llm.ainvoke."""
+    local = _fast_path(question, context)
+    if local is not None:
+        return local
+    messages = _perception_messages(question, context)
+    raw = await llm.ainvoke(messages)
+    return _parse_perception(getattr(raw, "content", str(raw)), question)
+
+def _perception_messages(question: str, context: Optional[str]):
+    if context:
+        return FOLLOWUP_PROMPT.format_messages(context=context, question=question)
+    return PERCEPTION_PROMPT.format_messages(question=question)
+
+def _parse_perception(content: str, question: str) -> Dict[str, Any]:
+    """Parse the perception JSON, falling back to a generic query."""
     try:
         data = json.loads(content)
         return {
@@ -28,6 +118,7 @@ def extract_intent_and_entities(question: str, llm) -> Dict[str, Any]:
         }
     except Exception:
         # Fallback if JSON parsing fails
+        record_fallback("perception_json")
         return {
             "intent": "general_query",
             "entities": [],
@@ -2,17 +2,48 @@
 Research Agent - Gathers facts and information relevant to the user's query
 """
 
+import asyncio
+import contextvars
+import hashlib
 import json
-from typing import List
-from langchain.prompts import ChatPromptTemplate
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Iterator, List, Optional, Set
+from core.prompts import ChatPrompt
+from core.knowledge_base import get_knowledge_base, tokenize
+from core.gazetteer import entity_gazetteer
+from core.json_stream import FactStreamParser
+from core.tracing import record_fallback, record_fast_path
+from core.embeddings import get_dense_index, hybrid_search
+from core.budget import fit_facts, format_facts, remaining_budget
+from config import MAX_RESEARCH_FACTS, RETRIEVAL_MODE, RESEARCH_PROMPT_BUDGET
+from config import ENABLE_RESEARCH_FANOUT, RESEARCH_FANOUT_MAX_ENTITIES, ENABLE_KB_PREFETCH
 
-RESEARCH_PROMPT = ChatPromptTemplate.from_messages([
+RESEARCH_PROMPT = ChatPrompt.from_messages([
     ("system", "You are Research. Use tools + reasoning to gather 3–6 concise, factual bullets relevant to the question.\n"
                "Prefer concrete, verifiable facts. Output as a JSON array of strings."),
-    ("human", "Question: {question}\nEntities: {entities}\n\nHere is a tiny local KB you may use: {kb}")
+    ("human", "Question: {question}\nEntities: {entities}\n\nHere is a tiny local KB you may use:\n{kb}")
 ])
 
-# Knowledge base for research
+# One call per entity when research fans out; the facts are merged afterwards
+ENTITY_RESEARCH_PROMPT = ChatPrompt.from_messages([
+    ("system", "You are Research. Use tools + reasoning to gather 2–4 concise, factual bullets about one entity,\n"
+               "as it bears on the question. Prefer concrete, verifiable facts. Output as a JSON array of strings."),
+    ("human", "Question: {question}\nEntity: {entity}\n\nHere is a tiny local KB you may use:\n{kb}")
+])
+
+# Sync fan-out calls and speculative KB lookups run here
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="research")
+
+# KB lookups started during perception, by normalized query; the oldest are
+# dropped when runs never reach research (answer cache hits, failures)
+_prefetched: "OrderedDict[str, Future]" = OrderedDict()
+_prefetched_lock = threading.Lock()
+MAX_PREFETCHED = 256
+
+# Built-in knowledge base, used when KNOWLEDGE_BASE_PATH is disabled or missing
 KNOWLEDGE_BASE = {
     "macbook comparison": [
         "MacBook Air (M3) has fanless design; quieter but can throttle under sustained loads.",
@@ -34,36 +65,271 @@ KNOWLEDGE_BASE = {
 }
 
 def gather_research(question: str, entities: List[str], llm) -> List[str]:
-    """Gather research facts using the research agent."""
-    # Determine relevant knowledge base
+    """Gather research facts using the research agent.
+
+    Questions naming 2 to RESEARCH_FANOUT_MAX_ENTITIES entities get one
+    concurrent call per entity, each with its own KB slice, merged by
+    ``merge_facts``. The stage then takes as long as the slowest entity
+    instead of one call writing about all of them.
+    """
+    if _fans_out(entities):
+        futures = [_executor.submit(contextvars.copy_context().run, _research_entity, question, entity, entities, llm)
+                   for entity in entities]
+        return _merge_results(question, [_outcome(f) for f in futures])
+    messages = _research_messages(question, entities, _prefetched_kb_facts(_kb_query(question, entities), question))
+    raw = llm.invoke(messages)
+    return _parse_facts(getattr(raw, "content", str(raw)))
+
+async def agather_research(question: str, entities: List[str], llm) -> List[str]:
+    """Async version of gather_research using llm.ainvoke."""
+    if _fans_out(entities):
+        results = await asyncio.gather(*(_aresearch_entity(question, entity, entities, llm) for entity in entities),
+                                       return_exceptions=True)
+        return _merge_results(question, results)
+    messages = _research_messages(question, entities, await _aprefetched_kb_facts(_kb_query(question, entities), question))
+    raw = await llm.ainvoke(messages)
+    return _parse_facts(getattr(raw, "content", str(raw)))
+
+def merge_facts(fact_lists: List[List[Any]], question: str, limit: int = MAX_RESEARCH_FACTS) -> List[Any]:
+    """Merge per-entity research into one list of at most ``limit`` facts.
+
+    Facts with the same words (case and punctuation ignored) are kept once.
+    Entities take turns: each entity's first fact, then each entity's second
+    and so on, so every entity is represented. Within a round, facts sharing
+    more terms with the question come first.
+    """
+    terms = set(tokenize(question))
+    seen: Set[str] = set()
+    merged: List[Any] = []
+    for rank in range(max(map(len, fact_lists), default=0)):
+        round_facts = [facts[rank] for facts in fact_lists if rank < len(facts)]
+        round_facts.sort(key=lambda fact: -len(terms.intersection(tokenize(str(fact)))))
+        for fact in round_facts:
+            key = " ".join(tokenize(str(fact))) or str(fact).strip().lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(fact)
+            if len(merged) == limit:
+                return merged
+    return merged
+
+def stream_research(question: str, entities: List[str], llm) -> Iterator[Any]:
+    """Yield research facts one by one as the streamed output completes them.
+
+    Once the JSON array closes the fact list is final, so whatever follows it
+    (typically a closing code fence) is drained in a background thread
+    instead of delaying the stage. Draining still lets the response cache
+    and token accounting see the full completion. The gain is earlier
+    ``fact`` events for listeners, not a shorter critical path: analysis
+    needs the complete list.
+    """
+    if _fans_out(entities):
+        # Per-entity calls finish together at the merge, so facts arrive in one burst
+        yield from gather_research(question, entities, llm)
+        return
+    parser = FactStreamParser(MAX_RESEARCH_FACTS)
+    messages = _research_messages(question, entities, _prefetched_kb_facts(_kb_query(question, entities), question))
+    chunks = iter(llm.stream(messages))
+    for chunk in chunks:
+        yield from parser.feed(getattr(chunk, "content", str(chunk)))
+        if parser.done:
+            threading.Thread(target=contextvars.copy_context().run, args=(_drain, chunks), daemon=True).start()
+            return
+    yield from parser.close()
+    _record_parse_fallback(parser)
+
+async def astream_research(question: str, entities: List[str], llm) -> AsyncIterator[Any]:
+    """Async version of stream_research; the tail is drained in a background task."""
+    if _fans_out(entities):
+        for fact in await agather_research(question, entities, llm):
+            yield fact
+        return
+    parser = FactStreamParser(MAX_RESEARCH_FACTS)
+    messages = _research_messages(question, entities, await _aprefetched_kb_facts(_kb_query(question, entities), question))
+    chunks = llm.astream(messages).__aiter__()
+    async for chunk in chunks:
+        for fact in parser.feed(getattr(chunk, "content", str(chunk))):
+            yield fact
+        if parser.done:
+            task = asyncio.ensure_future(_adrain(chunks))
+            _drains.add(task)
+            task.add_done_callback(_drains.discard)
+            return
+    for fact in parser.close():
+        yield fact
+    _record_parse_fallback(parser)
+
+def prefetch_kb_facts(question: str) -> None:
+    """Start retrieving KB facts for the raw question in the background.
+
+    Called while perception is still running. When the gazetteer finds
+    entities research will fan out over, one lookup per entity is started,
+    else one for the whole question. Research picks a result up when it
+    asks for the same query, which is the case when the normalized question
+    equals the raw one (up to case and whitespace) and perception finds
+    the same entities.
+    """
+    if not ENABLE_KB_PREFETCH:
+        return
+    gazetteer = entity_gazetteer()
+    entities = gazetteer.entities(question) if gazetteer is not None else []
+    if _fans_out(entities):
+        queries = [_entity_kb_query(question, entity, entities) for entity in entities]
+    else:
+        queries = [_kb_query(question, [])]
+    with _prefetched_lock:
+        for query in queries:
+            key = _query_key(query)
+            if key not in _prefetched:
+                _prefetched[key] = _executor.submit(contextvars.copy_context().run, _retrieve, query, question)
+        while len(_prefetched) > MAX_PREFETCHED:
+            _prefetched.popitem(last=False)
+
+def retrieve_kb_facts(question: str, entities: List[str]) -> List[str]:
+    """Return the knowledge base facts most relevant to the question and entities."""
+    return _retrieve(_kb_query(question, entities), question)
+
+def _retrieve(query: str, question: str) -> List[str]:
+    kb = get_knowledge_base()
+    if kb is not None:
+        dense = get_dense_index() if RETRIEVAL_MODE in ("dense", "hybrid") else None
+        if dense is not None and RETRIEVAL_MODE == "dense":
+            kb_items = [kb.facts[i] for i, _ in dense.search_scored(query, MAX_RESEARCH_FACTS)]
+        else:
+            kb_items = hybrid_search(kb, dense, query, MAX_RESEARCH_FACTS)
+        return kb_items or KNOWLEDGE_BASE["general"]
+    
+    # Fallback: pick a built-in topic by keyword
     kb_key = "macbook comparison" if "macbook" in question.lower() else (
         "python web frameworks" if "python" in question.lower() and "framework" in question.lower() else "general"
     )
-    kb_items = KNOWLEDGE_BASE.get(kb_key, KNOWLEDGE_BASE["general"])
-    
-    messages = RESEARCH_PROMPT.format_messages(
+    return KNOWLEDGE_BASE.get(kb_key, KNOWLEDGE_BASE["general"])
+
+def kb_fingerprint() -> str:
+    """Identify the fact corpus research draws on, so derived answers can be invalidated."""
+    kb = get_knowledge_base()
+    if kb is not None:
+        return kb.fingerprint
+    return "builtin:" + hashlib.sha256(json.dumps(KNOWLEDGE_BASE, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _take_prefetched(query: str) -> Optional[Future]:
+    if not ENABLE_KB_PREFETCH:
+        return None
+    with _prefetched_lock:
+        prefetched = _prefetched.pop(_query_key(query), None)
+    record_fast_path("kb_prefetch", prefetched is not None)
+    return prefetched
+
+def _prefetched_kb_facts(query: str, question: str) -> List[str]:
+    """KB facts for ``query``, reusing a lookup ``prefetch_kb_facts`` started for it."""
+    prefetched = _take_prefetched(query)
+    if prefetched is None:
+        return _retrieve(query, question)
+    return prefetched.result()
+
+async def _aprefetched_kb_facts(query: str, question: str) -> List[str]:
+    """Async version of _prefetched_kb_facts; waits for the lookup without blocking the loop."""
+    prefetched = _take_prefetched(query)
+    if prefetched is None:
+        return _retrieve(query, question)
+    return await asyncio.wrap_future(prefetched)
+
+def _kb_query(question: str, entities: List[str]) -> str:
+    """The retrieval query: the question plus any entity it does not already mention."""
+    lowered = question.lower()
+    return " ".join([question, *(e for e in entities if e.lower() not in lowered)])
+
+def _entity_kb_query(question: str, entity: str, entities: List[str]) -> str:
+    """One fan-out entity's retrieval query: the entity, then the question without any entity names."""
+    rest = question
+    for name in sorted(entities, key=len, reverse=True):
+        rest = re.sub(re.escape(name), " ", rest, flags=re.IGNORECASE)
+    return " ".join([entity, *rest.split()])
+
+def _query_key(query: str) -> str:
+    return " ".join(query.lower().rstrip("?").split())
+
+def _fans_out(entities: List[str]) -> bool:
+    return ENABLE_RESEARCH_FANOUT and 2 <= len(entities) <= RESEARCH_FANOUT_MAX_ENTITIES
+
+def _entity_slice(facts: List[str], entity: str, entities: List[str]) -> List[str]:
+    """Drop facts that name only other fan-out entities; those belong to their own slices."""
+    mine = entity.lower()
+    others = [e.lower() for e in entities if e.lower() != mine]
+    kept = [f for f in facts if mine in f.lower() or not any(o in f.lower() for o in others)]
+    return kept or facts
+
+def _entity_messages(question: str, entity: str, kb_facts: List[str]):
+    budget = remaining_budget(ENTITY_RESEARCH_PROMPT, RESEARCH_PROMPT_BUDGET, "kb", question=question, entity=entity)
+    return ENTITY_RESEARCH_PROMPT.format_messages(
+        question=question,
+        entity=entity,
+        kb=format_facts(fit_facts(kb_facts, budget))
+    )
+
+def _research_entity(question: str, entity: str, entities: List[str], llm) -> List[Any]:
+    kb_facts = _entity_slice(_prefetched_kb_facts(_entity_kb_query(question, entity, entities), question),
+                             entity, entities)
+    raw = llm.invoke(_entity_messages(question, entity, kb_facts))
+    return _parse_facts(getattr(raw, "content", str(raw)))
+
+async def _aresearch_entity(question: str, entity: str, entities: List[str], llm) -> List[Any]:
+    kb_facts = _entity_slice(await _aprefetched_kb_facts(_entity_kb_query(question, entity, entities), question),
+                             entity, entities)
+    raw = await llm.ainvoke(_entity_messages(question, entity, kb_facts))
+    return _parse_facts(getattr(raw, "content", str(raw)))
+
+def _outcome(future: Future) -> Any:
+    """A fan-out call's facts, or the exception it raised."""
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+def _merge_results(question: str, results: List[Any]) -> List[Any]:
+    """Merge the entities that were researched; fail only when none were."""
+    fact_lists = [r for r in results if not isinstance(r, BaseException)]
+    if not fact_lists:
+        raise next(r for r in results if isinstance(r, BaseException))
+    if len(fact_lists) < len(results):
+        record_fallback("research_fanout_partial")
+    return merge_facts(fact_lists, question)
+
+def _research_messages(question: str, entities: List[str], kb_facts: List[str]):
+    """Build the research prompt with the relevant knowledge base slice that fits the budget."""
+    budget = remaining_budget(RESEARCH_PROMPT, RESEARCH_PROMPT_BUDGET, "kb", question=question, entities=entities)
+    return RESEARCH_PROMPT.format_messages(
         question=question, 
         entities=entities, 
-        kb=kb_items
+        kb=format_facts(fit_facts(kb_facts, budget))
     )
-    
-    raw = llm.invoke(messages)
-    content = getattr(raw, "content", str(raw))
-    
+
+def _parse_facts(content: str) -> List[Any]:
+    """Parse the research output as a JSON array, falling back to line scraping."""
+    parser = FactStreamParser(MAX_RESEARCH_FACTS)
+    facts = parser.feed(content) + parser.close()
+    _record_parse_fallback(parser)
+    return facts
+
+def _record_parse_fallback(parser: FactStreamParser) -> None:
+    if not parser.done:
+        record_fallback("research_partial" if parser.in_array else "research_lines")
+
+# Tail drains still running, referenced so they are not garbage collected
+_drains: Set["asyncio.Task"] = set()
+
+def _drain(chunks: Iterator[Any]) -> None:
+    try:
+        for _ in chunks:
+            pass
+    except Exception:
+        # The facts are already complete; a failure in the tail changes nothing
+        pass
+
+async def _adrain(chunks: AsyncIterator[Any]) -> None:
     try:
-        facts = json.loads(content)
-        if not isinstance(facts, list):
-            raise ValueError("Expected list of facts")
-        return facts
+        async for _ in chunks:
+            pass
     except Exception:
-        # Fallback: extract facts from text
-        lines = content.split("\n")
-        facts = []
-        for line in lines:
-            line = line.strip()
-            if line and line.startswith(("-", "•", "*")):
-                facts.append(line.lstrip("- • *").strip())
-            elif line and len(line) > 20:  # Reasonable fact length
-                facts.append(line)
-        
-        return facts[:6]  # Limit to 6 facts 
\ No newline at end of file
+        pass
@@ -0,0 +1,25 @@
+"""
+Summarizer Agent - Folds older conversation turns into a rolling session summary
+"""
+
+from core.prompts import ChatPrompt
+from core.budget import output_cap, truncate_to_budget
+
+SUMMARY_PROMPT = ChatPrompt.from_messages([
+    ("system", "You are Summarizer. Update the running summary of a conversation with the new exchanges.\n"
+               "Keep the entities discussed, the user's constraints and the recommendations given.\n"
+               "Return only the updated summary as a few short sentences."),
+    ("human", "Summary so far:\n{summary}\n\nNew exchanges:\n{turns}")
+])
+
+def summarize_turns(summary: str, turns: str, llm, budget: int) -> str:
+    """Return ``summary`` extended with ``turns``, within ``budget`` tokens."""
+    messages = SUMMARY_PROMPT.format_messages(summary=summary or "(empty)", turns=turns)
+    response = llm.invoke(messages, **output_cap(budget))
+    return truncate_to_budget(getattr(response, "content", str(response)).strip(), budget)
+
+async def asummarize_turns(summary: str, turns: str, llm, budget: int) -> str:
+    """Async version of summarize_turns using llm.ainvoke."""
+    messages = SUMMARY_PROMPT.format_messages(summary=summary or "(empty)", turns=turns)
+    response = await llm.ainvoke(messages, **output_cap(budget))
+    return truncate_to_budget(getattr(response, "content", str(response)).strip(), budget)
@@ -0,0 +1,87 @@
+"""
+Fast Mode Benchmark - Latency and token usage of the fused single-call mode vs the
+standard four-stage pipeline
+
+Usage:
+    python -m benchmarks.fast_mode --backend sim --runs 3
+"""
+
+import argparse
+import statistics
+import time
+
+from core.llm_factory import make_llm, make_reasoner
+from core.tokens import estimate_message_tokens, estimate_tokens, reported_usage
+from core.workflow import MultiAgentWorkflow
+from core.wrappers import LLMWrapper
+
+QUESTIONS = [
+    "Compare MacBook Air vs Pro for development",
+    "What are the best Python web frameworks?",
+    "Should I use Django or FastAPI for a new REST API?",
+    "How should I choose between different programming languages?",
+]
+
+class UsageMeter(LLMWrapper):
+    """Counts calls and tokens (provider-reported when available, else estimated)."""
+    def __init__(self, llm):
+        super().__init__(llm)
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    def _count(self, messages, response):
+        usage = reported_usage(response)
+        if usage is None:
+            usage = (estimate_message_tokens(messages),
+                     estimate_tokens(getattr(response, "content", str(response))))
+        self.calls += 1
+        self.prompt_tokens += usage[0]
+        self.completion_tokens += usage[1]
+
+    def invoke(self, messages, **kwargs):
+        response = self.llm.invoke(messages, **kwargs)
+        self._count(messages, response)
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        response = await self.llm.ainvoke(messages, **kwargs)
+        self._count(messages, response)
+        return response
+
+def bench(mode: str, backend: str, runs: int) -> dict:
+    perception, reasoner = UsageMeter(make_llm(backend, cache=False)), UsageMeter(make_reasoner(backend, cache=False))
+    workflow = MultiAgentWorkflow(perception, reasoner, mode=mode)
+    latencies, fallbacks = [], 0
+    for _ in range(runs):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            state = workflow.run(question, verbose=False)
+            latencies.append(time.perf_counter() - start)
+            if mode == "fast" and state.get("step") != "fast":
+                fallbacks += 1
+    n = len(latencies)
+    return {
+        "mode": mode,
+        "questions": n,
+        "mean_s": statistics.mean(latencies),
+        "p50_s": statistics.median(latencies),
+        "max_s": max(latencies),
+        "calls_per_q": (perception.calls + reasoner.calls) / n,
+        "prompt_tokens_per_q": (perception.prompt_tokens + reasoner.prompt_tokens) / n,
+        "completion_tokens_per_q": (perception.completion_tokens + reasoner.completion_tokens) / n,
+        "fallbacks": fallbacks,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fast vs standard workflow mode")
+    parser.add_argument("--backend", default="sim", help="LLM backend to benchmark against")
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the question set per mode")
+    args = parser.parse_args()
+
+    results = [bench(mode, args.backend, args.runs) for mode in ("standard", "fast")]
+    print(f"{'mode':<10}{'mean s':>9}{'p50 s':>9}{'max s':>9}{'calls/q':>9}{'prompt tok/q':>14}{'compl tok/q':>13}{'fallbacks':>11}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['mean_s']:>9.3f}{r['p50_s']:>9.3f}{r['max_s']:>9.3f}{r['calls_per_q']:>9.1f}"
+              f"{r['prompt_tokens_per_q']:>14.0f}{r['completion_tokens_per_q']:>13.0f}{r['fallbacks']:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Replay Benchmark - Replays a recorded production trace against the workflow at N x speed
+and reports throughput, queueing delay and latency
+
+Record a trace from real traffic (any mode appends workflow arrivals and LLM
+calls), then replay it offline. Questions arrive at their recorded offsets
+divided by ``--speed`` and wait for one of ``--concurrency`` slots. LLM calls
+are answered from the trace by the replay backend with their recorded
+latencies divided by ``--latency-speed``.
+
+Usage:
+    python main.py --batch questions.jsonl --record logs/trace.llmt
+    python -m benchmarks.replay logs/trace.llmt --speed 4 --concurrency 32
+    python -m benchmarks.replay logs/trace.llmt --speed 10 --latency-speed 0 --json replay.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    from core.batch import percentile
+    return {f"p{p}_s": percentile(values, p) for p in (50, 95, 99)}
+
+async def replay(workflow, runs: List[Dict[str, Any]], speed: float, concurrency: int) -> Dict[str, Any]:
+    """Submit ``runs`` at their recorded offsets / ``speed`` with at most ``concurrency`` in flight."""
+    slots = asyncio.Semaphore(concurrency)
+    first = runs[0]["t"]
+    queued, service, total, lateness = [], [], [], []
+    errors = 0
+    start = time.perf_counter()
+
+    async def one(run: Dict[str, Any]) -> None:
+        nonlocal errors
+        due = start + (run["t"] - first) / speed
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        arrived = time.perf_counter()
+        lateness.append(arrived - due)
+        async with slots:
+            began = time.perf_counter()
+            queued.append(began - arrived)
+            try:
+                await workflow.arun(run["question"], verbose=False)
+            except Exception:
+                errors += 1
+            finished = time.perf_counter()
+        service.append(finished - began)
+        total.append(finished - arrived)
+
+    await asyncio.gather(*(one(run) for run in runs))
+    elapsed = time.perf_counter() - start
+    recorded_span = runs[-1]["t"] - first
+    return {
+        "runs": len(runs),
+        "errors": errors,
+        "speed": speed,
+        "offered_qps": len(runs) / (recorded_span / speed) if recorded_span > 0 else float("inf"),
+        "throughput_qps": len(runs) / elapsed if elapsed > 0 else 0.0,
+        "elapsed_s": elapsed,
+        "queue_delay": summarize(queued),
+        "service": summarize(service),
+        "latency": summarize(total),
+        "max_dispatch_lag_s": max(lateness),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded trace against the workflow")
+    parser.add_argument("trace", help="Trace file written with --record or TRACE_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Arrival rate multiplier (N x the recorded traffic)")
+    parser.add_argument("--latency-speed", type=float, default=1.0,
+                        help="Divisor for recorded LLM latencies (1 = as recorded, 0 = instant)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Questions in flight at once")
+    parser.add_argument("--mode", choices=["standard", "fast"], default="standard", help="Workflow mode")
+    parser.add_argument("--strict", action="store_true", help="Fail on prompts missing from the trace")
+    parser.add_argument("--limit", type=int, help="Replay only the first N runs")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    os.environ["REPLAY_TRACE_PATH"] = args.trace
+    os.environ["REPLAY_SPEED"] = str(args.latency_speed)
+    os.environ["REPLAY_STRICT"] = "true" if args.strict else "false"
+    # Imported here so the REPLAY_* environment above is picked up
+    from core.llm_factory import make_llm, make_reasoner, shutdown_clients
+    from core.replay import open_trace
+    from core.tracing import metrics
+    from core.workflow import MultiAgentWorkflow
+
+    trace = open_trace(args.trace)
+    runs = trace.runs()[:args.limit]
+    if not runs:
+        parser.error(f"{args.trace} holds {len(trace)} LLM calls but no workflow runs to replay")
+    # Each recorded arrival is replayed as-is: no coalescing of repeats
+    workflow = MultiAgentWorkflow(make_llm("replay"), make_reasoner("replay"), mode=args.mode, coalesce=False)
+    try:
+        report = asyncio.run(replay(workflow, runs, args.speed, args.concurrency))
+    finally:
+        shutdown_clients()
+    outcomes = {"hit": 0.0, "miss": 0.0}
+    for (name, labels), value in metrics.counters.items():
+        if name == "agent_replay_total":
+            outcomes[dict(labels)["outcome"]] += value
+    served = outcomes["hit"] + outcomes["miss"]
+    report["replay_hit_rate"] = outcomes["hit"] / served if served else None
+
+    print(f"Replayed {report['runs']} runs ({len(trace)} recorded calls) at {args.speed:g}x, "
+          f"concurrency {args.concurrency}, LLM latency /{args.latency_speed:g}")
+    print(f"  offered     {report['offered_qps']:8.2f} q/s")
+    print(f"  throughput  {report['throughput_qps']:8.2f} q/s   errors {report['errors']}")
+    for label, key in (("queue delay", "queue_delay"), ("service", "service"), ("latency", "latency")):
+        s = report[key]
+        print(f"  {label:<11} p50 {s['p50_s']:7.3f}s  p95 {s['p95_s']:7.3f}s  p99 {s['p99_s']:7.3f}s")
+    if report["replay_hit_rate"] is not None:
+        print(f"  replay hits {report['replay_hit_rate']:8.1%}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
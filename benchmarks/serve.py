@@ -0,0 +1,154 @@
+"""
+Service Benchmark - Load-tests the --serve HTTP API with many concurrent
+keep-alive clients and reports throughput, tail latency and 503 rejections
+
+The server runs in its own process (one long-lived workflow, as in --serve)
+so the load generator does not compete with it for the GIL. The fake backend
+measures the service overhead alone; the sim backend adds model latency.
+
+Usage:
+    python -m benchmarks.serve --levels 1 16 64 256 --requests 2000
+    python -m benchmarks.serve --backend sim --server-concurrency 32 --queue-size 64
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.fast_mode import QUESTIONS
+from core.batch import percentile
+
+class HTTPClient:
+    """One keep-alive HTTP/1.1 connection, enough to drive the service."""
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, payload: Any = None,
+                      headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """Send one request and return (status, lower-cased headers, body)."""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self._writer.drain()
+
+        status = int((await self._reader.readline()).split()[1])
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if "content-length" in response_headers:
+            data = await self._reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await self._reader.read()
+        if response_headers.get("connection") == "close":
+            await self.close()
+        return status, response_headers, data
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+def sse_events(data: bytes) -> List[Tuple[str, Any]]:
+    """Split a Server-Sent Events body into (event, decoded data) pairs."""
+    events = []
+    for block in data.decode("utf-8").split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields.get("data", "null"))))
+    return events
+
+def serve(backend: str, concurrency: int, queue_size: int, ready) -> None:
+    """Run the service on a free port (in a worker process) and report the port on ``ready``."""
+    from core.llm_factory import make_llm, make_reasoner
+    from core.server import WorkflowServer
+    from core.workflow import MultiAgentWorkflow
+
+    async def main():
+        workflow = MultiAgentWorkflow(make_llm(backend, cache=False), make_reasoner(backend, cache=False))
+        server = await WorkflowServer(workflow, concurrency, queue_size).start("127.0.0.1", 0)
+        ready.put(server.port)
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+async def run_level(port: int, clients: int, requests: int) -> Dict[str, Any]:
+    """Send ``requests`` POST /recommend calls from ``clients`` concurrent connections."""
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    remaining = iter(range(requests))
+
+    async def client():
+        http = HTTPClient("127.0.0.1", port)
+        try:
+            for i in remaining:
+                start = time.perf_counter()
+                status, _, _ = await http.request("POST", "/recommend", {"question": QUESTIONS[i % len(QUESTIONS)]})
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+        finally:
+            await http.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "clients": clients,
+        "requests": requests,
+        "ok": statuses.get(200, 0),
+        "rejected": statuses.get(503, 0),
+        "errors": requests - statuses.get(200, 0) - statuses.get(503, 0),
+        "throughput_rps": statuses.get(200, 0) / elapsed if elapsed else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the HTTP service")
+    parser.add_argument("--backend", choices=["fake", "sim"], default="fake", help="LLM backend behind the service")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 16, 64, 256], help="Concurrent clients per level")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests sent per level")
+    parser.add_argument("--server-concurrency", type=int, default=32, help="Questions the server runs at once")
+    parser.add_argument("--queue-size", type=int, default=64, help="Questions the server queues before 503")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Queue()
+    server = ctx.Process(target=serve, args=(args.backend, args.server_concurrency, args.queue_size, ready), daemon=True)
+    server.start()
+    try:
+        port = ready.get(timeout=120)
+        results = []
+        print(f"{'clients':>8}{'req/s':>10}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'503s':>7}{'errors':>8}")
+        for level in args.levels:
+            r = asyncio.run(run_level(port, level, args.requests))
+            results.append(r)
+            print(f"{r['clients']:>8}{r['throughput_rps']:>10.1f}{r['p50_s']:>9.3f}{r['p95_s']:>9.3f}"
+                  f"{r['p99_s']:>9.3f}{r['rejected']:>7}{r['errors']:>8}")
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "server_concurrency": args.server_concurrency,
+                       "queue_size": args.queue_size, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Startup Benchmark - Measures CLI cold start per backend with ``python -X importtime``
+
+Each phase runs in fresh interpreters: ``import`` (what every CLI mode pays
+before doing anything), ``ready`` (a workflow built for the backend) and
+``answer`` (one question answered). The slowest imports of the ``answer``
+phase are listed. Offline backends must not import the hosted client stack
+(``langchain_groq`` and the ``groq`` SDK). The run fails (exit 1) when they do, or when
+the median ``import`` phase exceeds ``--target-ms``, so the benchmark works
+as a CI gate.
+
+Usage:
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --backend sim --target-ms 300 --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only the hosted backend needs (httpx is not one: langchain_core
+# pulls it in through langsmith)
+HOSTED_ONLY = ("langchain_groq", "groq")
+
+def phase_code(phase: str, backend: str) -> str:
+    build = f"w = main.MultiAgentWorkflow(main.make_llm({backend!r}), main.make_reasoner({backend!r}))"
+    return {
+        "import": "import main",
+        "ready": f"import main; {build}",
+        "answer": f"import main; {build}; w.run('Compare MacBook Air vs Pro for development', verbose=False)",
+    }[phase]
+
+def run_phase(code: str) -> Tuple[float, str]:
+    """Run ``code`` in a fresh interpreter; return (wall seconds, importtime report)."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "phase failed")
+    return elapsed, proc.stderr
+
+def parse_importtime(report: str) -> Dict[str, int]:
+    """Cumulative microseconds per imported module."""
+    modules = {}
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+def top_level(report: str, n: int) -> List[Tuple[str, int]]:
+    """The ``n`` slowest top-level imports (nested ones are included in their parent)."""
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # one space follows the bar; nesting adds two more
+            rows.append((name.strip(), int(cumulative)))
+    return sorted(rows, key=lambda row: -row[1])[:n]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI cold start")
+    parser.add_argument("--backend", choices=["fake", "sim", "groq"], default="fake", help="Backend to start")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per phase")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    parser.add_argument("--target-ms", type=float, default=300.0, help="Fail when the median import phase is slower")
+    args = parser.parse_args()
+
+    run_phase("pass")  # warm the OS file cache
+    baseline = statistics.median(run_phase("pass")[0] for _ in range(args.runs))
+    print(f"{'phase':>8}{'median ms':>11}{'min ms':>9}{'modules':>9}")
+    print(f"{'python':>8}{baseline * 1000:>11.0f}")
+    results, report = {}, ""
+    for phase in ("import", "ready", "answer"):
+        timings = []
+        for _ in range(args.runs):
+            elapsed, report = run_phase(phase_code(phase, args.backend))
+            timings.append(elapsed)
+        results[phase] = statistics.median(timings)
+        print(f"{phase:>8}{results[phase] * 1000:>11.0f}{min(timings) * 1000:>9.0f}{len(parse_importtime(report)):>9}")
+
+    print(f"\nSlowest top-level imports ({args.backend}, answer phase):")
+    for name, micros in top_level(report, args.top):
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if results["import"] * 1000 > args.target_ms:
+        failures.append(f"import phase {results['import'] * 1000:.0f} ms > target {args.target_ms:.0f} ms")
+    if args.backend != "groq":
+        loaded = [name for name in HOSTED_ONLY if name in parse_importtime(report)]
+        if loaded:
+            failures.append(f"{args.backend} backend imported hosted-only modules: {', '.join(loaded)}")
+    for line in failures:
+        print(f"FAIL {line}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Stub Server - Minimal OpenAI/Groq-compatible chat completions endpoint for
+exercising the real HTTP client stack offline
+
+Point the groq backend at it with GROQ_BASE_URL=http://127.0.0.1:<port> (the
+SDK appends /openai/v1/chat/completions) and any GROQ_API_KEY.
+
+Usage:
+    python -m benchmarks.stub_server --port 8080 --latency-ms 200
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Set, Tuple
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server: StubServer = self.server
+        server.record(self.client_address)
+        request = json.loads(body or b"{}")
+        if server.latency_s:
+            time.sleep(server.latency_s)
+        content = server.reply
+        payload = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(content.split()), "total_tokens": 10 + len(content.split())},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded stub that counts requests, distinct client connections and open ones."""
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, reply: str = "Stub response", latency_ms: float = 0.0):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.reply = reply
+        self.latency_s = latency_ms / 1000.0
+        self.requests = 0
+        self.connections: Set[Tuple[str, int]] = set()
+        self.open_connections = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def record(self, client_address) -> None:
+        with self._lock:
+            self.requests += 1
+            self.connections.add(client_address)
+
+    def process_request_thread(self, request, client_address):
+        with self._lock:
+            self.open_connections += 1
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self._lock:
+                self.open_connections -= 1
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an OpenAI/Groq-compatible stub server")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay before every response")
+    parser.add_argument("--reply", default="Stub response", help="Completion content returned")
+    args = parser.parse_args()
+    server = StubServer(args.port, args.reply, args.latency_ms)
+    print(f"Serving on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Throughput Benchmark - Runs the workflow against the simulated backend at
+increasing concurrency and reports throughput, tail latency, CPU time and peak RSS
+
+Each concurrency level runs in a fresh process so peak RSS is per level. With
+``--baseline`` the run fails (exit 1) when throughput drops or p99 latency
+grows by more than ``--tolerance`` against a previous ``--json`` report, which
+makes it usable as an offline CI regression gate.
+
+The questions cycle through a small set, so request coalescing would merge
+concurrent repeats into one call and overstate throughput. It is off unless
+``--coalesce`` is given, and the report records which way it ran.
+
+Usage:
+    python -m benchmarks.throughput --levels 1 4 16 64 --questions 64
+    python -m benchmarks.throughput --json bench.json --baseline main-bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fast_mode import QUESTIONS
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_level(concurrency: int, questions: int, mode: str, coalesce: bool = False) -> Dict[str, Any]:
+    """Answer ``questions`` questions with ``concurrency`` in flight (in a worker process)."""
+    # Imported here so the SIM_* and ENABLE_COALESCING environment set by the parent is picked up
+    from core.batch import run_batch
+    from core.llm_factory import make_llm, make_reasoner
+    from core.workflow import MultiAgentWorkflow
+
+    workflow = MultiAgentWorkflow(make_llm("sim", cache=False), make_reasoner("sim", cache=False), mode=mode,
+                                  coalesce=coalesce)
+    items = [{"id": str(i), "question": QUESTIONS[i % len(QUESTIONS)]} for i in range(questions)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cpu_start = time.process_time()
+        stats = asyncio.run(run_batch(workflow, items, os.path.join(tmp, "out.jsonl"),
+                                      concurrency=concurrency, resume=False))
+        cpu = time.process_time() - cpu_start
+    return {
+        "concurrency": concurrency,
+        "questions": stats["processed"],
+        "errors": stats["errors"],
+        "throughput_qps": stats["throughput_qps"],
+        "p50_s": stats["p50_s"],
+        "p95_s": stats["p95_s"],
+        "p99_s": stats["p99_s"],
+        "cpu_s": cpu,
+        "cpu_ms_per_q": cpu * 1000 / max(1, stats["processed"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Describe every level that regressed beyond ``tolerance`` against ``baseline``."""
+    previous = {r["concurrency"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        base = previous.get(r["concurrency"])
+        if base is None:
+            continue
+        if r["throughput_qps"] < base["throughput_qps"] * (1 - tolerance):
+            regressions.append(f"c={r['concurrency']}: throughput {base['throughput_qps']:.2f} -> {r['throughput_qps']:.2f} q/s")
+        if r["p99_s"] > base["p99_s"] * (1 + tolerance):
+            regressions.append(f"c={r['concurrency']}: p99 {base['p99_s']:.3f} -> {r['p99_s']:.3f} s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark workflow throughput against the simulated backend")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64], help="Concurrency levels to run")
+    parser.add_argument("--questions", type=int, default=64, help="Questions answered per level")
+    parser.add_argument("--mode", choices=["standard", "fast"], default="standard", help="Workflow mode")
+    parser.add_argument("--latency-ms", type=float, help="Override SIM_LATENCY_MS")
+    parser.add_argument("--tokens-per-second", type=float, help="Override SIM_TOKENS_PER_SECOND")
+    parser.add_argument("--error-rate", type=float, help="Override SIM_ERROR_RATE")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Keep request coalescing on (repeated questions then share calls)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Fail if results regress against this --json report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    for flag, name in ((args.latency_ms, "SIM_LATENCY_MS"), (args.tokens_per_second, "SIM_TOKENS_PER_SECOND"),
+                       (args.error_rate, "SIM_ERROR_RATE")):
+        if flag is not None:
+            os.environ[name] = str(flag)
+    # Model-call coalescing in the worker's LLM stack follows the workflow's
+    os.environ["ENABLE_COALESCING"] = "true" if args.coalesce else "false"
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    print(f"Coalescing {'on: repeated questions share calls' if args.coalesce else 'off'}")
+    print(f"{'conc':>5}{'q/s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'cpu ms/q':>10}{'rss MiB':>9}{'errors':>8}")
+    for level in args.levels:
+        with ctx.Pool(1) as pool:
+            r = pool.apply(run_level, (level, args.questions, args.mode, args.coalesce))
+        results.append(r)
+        print(f"{r['concurrency']:>5}{r['throughput_qps']:>9.2f}{r['p50_s']:>9.3f}{r['p95_s']:>9.3f}{r['p99_s']:>9.3f}"
+              f"{r['cpu_ms_per_q']:>10.1f}{r['peak_rss_mb']:>9.1f}{r['errors']:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "questions": args.questions, "coalesce": args.coalesce,
+                       "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        if report.get("coalesce", True) != args.coalesce:
+            print("Baseline was run with coalescing "
+                  f"{'on' if report.get('coalesce', True) else 'off'}; numbers are not comparable")
+            sys.exit(1)
+        regressions = compare(results, report["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
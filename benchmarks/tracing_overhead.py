@@ -0,0 +1,79 @@
+"""
+Tracing Overhead Benchmark - Per-question cost of spans, token accounting and
+histograms, measured by running the same workflow with tracing on and off
+
+Every question is run once with tracing off and once with it on, in
+alternating order and with the garbage collector paused, and the overhead is
+the median of those paired differences, which is far steadier than comparing
+two separate timings. The target is relative to the ``fake`` backend, whose
+near-zero latency makes it the strictest baseline; against a real model round
+trip the relative cost is orders of magnitude smaller. The run fails (exit 1)
+when the overhead exceeds ``--max-overhead`` of the tracing-off latency.
+
+Usage:
+    python -m benchmarks.tracing_overhead --backend fake --runs 200 --max-overhead 0.01
+"""
+
+import argparse
+import gc
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+import core.llm_factory as llm_factory
+import core.tracing as tracing
+from core.llm_factory import make_llm, make_reasoner
+from core.workflow import MultiAgentWorkflow
+from benchmarks.fast_mode import QUESTIONS
+
+def make_workflow(enabled: bool, backend: str) -> MultiAgentWorkflow:
+    # The factory reads the flag when deciding whether to add TracedLLM
+    llm_factory.ENABLE_TRACING = enabled
+    return MultiAgentWorkflow(make_llm(backend, cache=False), make_reasoner(backend, cache=False))
+
+def timed(workflow: MultiAgentWorkflow, enabled: bool, question: str) -> float:
+    """Seconds to answer ``question`` with tracing switched on or off."""
+    tracing.ENABLE_TRACING = enabled
+    start = time.perf_counter()
+    workflow.run(question, verbose=False)
+    return time.perf_counter() - start
+
+def bench(workflows, runs: int) -> Tuple[float, float]:
+    """Median seconds per question with tracing off, and the median paired overhead."""
+    off: List[float] = []
+    deltas: List[float] = []
+    gc.disable()
+    try:
+        for i in range(runs):
+            order = (True, False) if i % 2 else (False, True)
+            for question in QUESTIONS:
+                times = {enabled: timed(workflows[enabled], enabled, question) for enabled in order}
+                off.append(times[False])
+                deltas.append(times[True] - times[False])
+            gc.collect()
+    finally:
+        gc.enable()
+    return statistics.median(off), statistics.median(deltas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure tracing overhead per question")
+    parser.add_argument("--backend", default="fake", help="LLM backend to benchmark against")
+    parser.add_argument("--runs", type=int, default=200, help="Paired off/on passes over the question set")
+    parser.add_argument("--max-overhead", type=float, default=0.01,
+                        help="Fail when tracing adds more than this fraction of the tracing-off latency")
+    args = parser.parse_args()
+
+    workflows = {enabled: make_workflow(enabled, args.backend) for enabled in (False, True)}
+    bench(workflows, 2)  # warm imports and KB loading
+    off, overhead = bench(workflows, args.runs)
+    ratio = overhead / off
+    print(f"tracing off: {off * 1000:.3f} ms/question ({args.backend} backend)")
+    print(f"tracing on:  {(off + overhead) * 1000:.3f} ms/question")
+    print(f"overhead:    {overhead * 1e6:.0f} us/question ({ratio:.2%}, target {args.max_overhead:.2%})")
+    if ratio > args.max_overhead:
+        print(f"FAIL tracing overhead {ratio:.2%} > target {args.max_overhead:.2%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
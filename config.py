@@ -16,21 +16,130 @@ TEMPERATURE = float(os.getenv("TEMPERATURE", "0.2"))
 # API Keys
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# HTTP Connection Pool (shared by every hosted client in the process)
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "30"))  # seconds
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+
 # System Configuration
+WORKFLOW_MODE = os.getenv("WORKFLOW_MODE", "standard").lower()  # standard | fast
 VERBOSE = os.getenv("VERBOSE", "true").lower() == "true"
 MAX_RESEARCH_FACTS = int(os.getenv("MAX_RESEARCH_FACTS", "6"))
-MAX_ANALYSIS_LENGTH = int(os.getenv("MAX_ANALYSIS_LENGTH", "99999999999"))
-MAX_DECISION_LENGTH = int(os.getenv("MAX_DECISION_LENGTH", "99999999999"))
+MAX_ANALYSIS_LENGTH = int(os.getenv("MAX_ANALYSIS_LENGTH", "1024"))  # output tokens (max_tokens), 0 = no cap
+MAX_DECISION_LENGTH = int(os.getenv("MAX_DECISION_LENGTH", "512"))  # output tokens (max_tokens), 0 = no cap
+
+# Research Fan-out (one concurrent research call per entity for 2..N-entity questions) and KB prefetch
+ENABLE_RESEARCH_FANOUT = os.getenv("ENABLE_RESEARCH_FANOUT", "true").lower() == "true"
+RESEARCH_FANOUT_MAX_ENTITIES = int(os.getenv("RESEARCH_FANOUT_MAX_ENTITIES", "5"))
+ENABLE_KB_PREFETCH = os.getenv("ENABLE_KB_PREFETCH", "true").lower() == "true"  # retrieve during perception
+
+# Prompt Budgets (estimated input tokens per stage; KB facts, research facts and analysis are trimmed to fit)
+RESEARCH_PROMPT_BUDGET = int(os.getenv("RESEARCH_PROMPT_BUDGET", "2000"))
+ANALYSIS_PROMPT_BUDGET = int(os.getenv("ANALYSIS_PROMPT_BUDGET", "2000"))
+DECISION_PROMPT_BUDGET = int(os.getenv("DECISION_PROMPT_BUDGET", "2000"))
+
+# Interactive Sessions (estimated tokens of earlier turns given to perception; older turns are summarized)
+SESSION_HISTORY_BUDGET = int(os.getenv("SESSION_HISTORY_BUDGET", "600"))
+SESSION_SUMMARY_BUDGET = int(os.getenv("SESSION_SUMMARY_BUDGET", "200"))
 
 # Display Configuration
 DEFAULT_DISPLAY_LIMIT = int(os.getenv("DEFAULT_DISPLAY_LIMIT", "99999999999"))
 FULL_OUTPUT_DISPLAY_LIMIT = int(os.getenv("FULL_OUTPUT_DISPLAY_LIMIT", "99999999999"))
 
+# Perception Fast Path (gazetteer + intent rules; the LLM runs only below the threshold)
+ENABLE_PERCEPTION_FAST_PATH = os.getenv("ENABLE_PERCEPTION_FAST_PATH", "true").lower() == "true"
+PERCEPTION_FAST_PATH_CONFIDENCE = float(os.getenv("PERCEPTION_FAST_PATH_CONFIDENCE", "0.75"))
+
+# Coalesce concurrent identical questions and prompts into one execution
+ENABLE_COALESCING = os.getenv("ENABLE_COALESCING", "true").lower() == "true"
+
+# Batch Configuration
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"  # AIMD below --concurrency
+AIMD_LATENCY_TOLERANCE = float(os.getenv("AIMD_LATENCY_TOLERANCE", "2.0"))  # x best latency before backing off
+
+# HTTP Service Configuration (--serve; beyond concurrency + queue, requests get 503)
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_CONCURRENCY = int(os.getenv("SERVER_CONCURRENCY", "32"))  # questions running at once
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "64"))  # questions waiting for a slot
+SERVER_MAX_BATCH = int(os.getenv("SERVER_MAX_BATCH", "64"))  # questions per /batch request
+
+# Rate Limiting and Retries (per model; 0 = unlimited)
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # seconds, doubled per attempt
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Deadlines, Hedging and Model Cascade
+WORKFLOW_DEADLINE_S = float(os.getenv("WORKFLOW_DEADLINE_S", "120"))  # whole question, 0 = none
+STAGE_DEADLINES = {  # seconds per stage, capped by what is left of the workflow deadline
+    stage.strip(): float(seconds)
+    for stage, seconds in (item.split("=", 1) for item in os.getenv(
+        "STAGE_DEADLINES", "perception=15,research=30,analysis=60,decision=45").split(",") if "=" in item)
+}
+ENABLE_HEDGING = os.getenv("ENABLE_HEDGING", "true").lower() == "true"  # duplicate calls slower than p95
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_POOL_SIZE = int(os.getenv("HEDGE_POOL_SIZE", "256"))  # threads for sync calls under a deadline
+CASCADE_STAGES = [s.strip() for s in os.getenv("CASCADE_STAGES", "perception").split(",") if s.strip()]
+
+# LLM Response Cache Configuration
+ENABLE_LLM_CACHE = os.getenv("ENABLE_LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite")  # empty = memory only
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # seconds, 0 = never expire
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_DISABLED_STAGES = [s.strip() for s in os.getenv("LLM_CACHE_DISABLED_STAGES", "").split(",") if s.strip()]
+
+# Whole-Answer Cache Configuration (reuses research/analysis/decision after perception)
+ENABLE_ANSWER_CACHE = os.getenv("ENABLE_ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", ".cache/answer_cache.sqlite")  # empty = memory only
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds, 0 = never expire
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.5"))  # 0 = intent + entities only
+
+# Precomputed Answer Store (written offline by --precompute, memory-mapped at startup)
+ENABLE_ANSWER_STORE = os.getenv("ENABLE_ANSWER_STORE", "true").lower() == "true"
+ANSWER_STORE_PATH = os.getenv("ANSWER_STORE_PATH", ".cache/answers.store")
+ANSWER_STORE_SIMILARITY = float(os.getenv("ANSWER_STORE_SIMILARITY", "0.5"))  # as ANSWER_CACHE_SIMILARITY
+PRECOMPUTE_MAX_ENTITIES = int(os.getenv("PRECOMPUTE_MAX_ENTITIES", "3"))  # largest entity combination per topic
+
+# Stage Checkpoints (Memory snapshot after each stage, so failed runs resume with --resume)
+ENABLE_CHECKPOINTS = os.getenv("ENABLE_CHECKPOINTS", "true").lower() == "true"
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", ".cache/checkpoints.sqlite")  # empty = memory only
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", "604800"))  # seconds, 0 = keep forever
 
 # Knowledge Base Configuration
 ENABLE_KNOWLEDGE_BASE = os.getenv("ENABLE_KNOWLEDGE_BASE", "true").lower() == "true"
 KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", "data/knowledge_base.json")
+KNOWLEDGE_BASE_INDEX_PATH = os.getenv("KNOWLEDGE_BASE_INDEX_PATH", "")  # default: <KNOWLEDGE_BASE_PATH>.bm25.pkl
+KB_MAX_POSTINGS = int(os.getenv("KB_MAX_POSTINGS", "5000"))  # postings scanned per query term
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()  # bm25 | dense | hybrid
+DENSE_INDEX_PATH = os.getenv("DENSE_INDEX_PATH", "")  # default: <KNOWLEDGE_BASE_PATH>.dense.npy
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+
+# Simulated Backend Configuration (BACKEND=sim)
+SIM_SEED = int(os.getenv("SIM_SEED", "0"))
+SIM_LATENCY_MS = float(os.getenv("SIM_LATENCY_MS", "300"))  # median time to first token
+SIM_LATENCY_SIGMA = float(os.getenv("SIM_LATENCY_SIGMA", "0.5"))  # log-normal spread
+SIM_TOKENS_PER_SECOND = float(os.getenv("SIM_TOKENS_PER_SECOND", "200"))
+SIM_ERROR_RATE = float(os.getenv("SIM_ERROR_RATE", "0"))
+SIM_TIMEOUT_RATE = float(os.getenv("SIM_TIMEOUT_RATE", "0"))
+SIM_TIMEOUT_S = float(os.getenv("SIM_TIMEOUT_S", "30"))
+
+# Record/Replay (BACKEND=replay serves responses recorded with TRACE_RECORD_PATH or --record)
+TRACE_RECORD_PATH = os.getenv("TRACE_RECORD_PATH", "")  # empty = not recording
+REPLAY_TRACE_PATH = os.getenv("REPLAY_TRACE_PATH", "")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1"))  # recorded latency divisor, 0 = no waiting
+REPLAY_STRICT = os.getenv("REPLAY_STRICT", "false").lower() == "true"  # fail on prompts missing from the trace
 
 # Logging Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-LOG_FILE = os.getenv("LOG_FILE", "logs/multi_agent.log") 
\ No newline at end of file
+LOG_FILE = os.getenv("LOG_FILE", "logs/multi_agent.log")
+
+# Tracing and Metrics Configuration
+ENABLE_TRACING = os.getenv("ENABLE_TRACING", "true").lower() == "true"
+METRICS_PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH", "logs/metrics.prom")
+METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH", "logs/metrics.json") 
\ No newline at end of file
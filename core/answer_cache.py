@@ -0,0 +1,146 @@
+"""
+Answer Cache - Whole-answer reuse for questions that perception maps to the same meaning
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from core.knowledge_base import tokenize
+from core.llm_factory import OFFLINE_BACKENDS
+from config import ENABLE_ANSWER_CACHE, ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY
+
+# Memory keys an answer cache entry restores
+ANSWER_KEYS = ("research_facts", "analysis", "decision")
+
+# Perception fallback intent: the question was not understood, so never reuse answers for it
+UNPARSED_INTENT = "general_query"
+
+# Distinct phrasings remembered per (intent, entity set)
+MAX_VARIANTS_PER_KEY = 16
+
+def answer_key(intent: str, entities: Iterable[str]) -> str:
+    """Exact-match key: the intent plus the case-insensitive set of entities."""
+    normalized = sorted({str(e).strip().lower() for e in entities if str(e).strip()})
+    raw = json.dumps([str(intent).strip().lower(), normalized])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def similarity(a: str, b: str, ignore: Iterable[str] = ()) -> float:
+    """Jaccard overlap of the content words of two questions.
+
+    Words in ``ignore`` (the shared entities) are left out so the score
+    reflects what is being asked about them, not that they are mentioned.
+    """
+    skip = {t for text in ignore for t in tokenize(str(text))}
+    ta, tb = set(tokenize(a)) - skip, set(tokenize(b)) - skip
+    if not ta and not tb:
+        return 1.0
+    return len(ta & tb) / len(ta | tb)
+
+class AnswerCache:
+    """Stores research, analysis and decision keyed on perception output.
+
+    A lookup hits when intent and entity set match exactly. With a
+    ``threshold`` the stored normalized question must also be at least that
+    similar apart from the entities (see ``similarity``). Entries expire after ``ttl`` seconds and are
+    dropped once the knowledge base fingerprint they were built from changes.
+    ``path=None`` keeps the cache in memory only.
+    """
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = 86400,
+                 threshold: float = 0.0):
+        self.ttl = ttl or None
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT NOT NULL, normalized TEXT NOT NULL, kb TEXT NOT NULL, payload TEXT NOT NULL,"
+            " expires_at REAL, created_at REAL NOT NULL, PRIMARY KEY (key, normalized))"
+        )
+
+    def get(self, intent: str, entities: Iterable[str], normalized_question: str,
+            kb_fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached answer fields, or None on a miss."""
+        entities = list(entities)
+        if not entities or intent == UNPARSED_INTENT:
+            return None
+        key = answer_key(intent, entities)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT normalized, kb, payload, expires_at FROM answers WHERE key = ? ORDER BY created_at DESC",
+                (key,),
+            ).fetchall()
+            best, best_score = None, -1.0
+            for normalized, kb, payload, expires_at in rows:
+                if kb != kb_fingerprint or (expires_at is not None and expires_at <= now):
+                    self._conn.execute("DELETE FROM answers WHERE key = ? AND normalized = ?", (key, normalized))
+                    self.counters["invalidations"] += 1
+                    continue
+                score = similarity(normalized, normalized_question, entities) if self.threshold > 0 else 1.0
+                if score >= self.threshold and score > best_score:
+                    best, best_score = payload, score
+            if best is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+        return json.loads(best)
+
+    def set(self, state: Dict[str, Any], kb_fingerprint: str) -> bool:
+        """Remember the answer of a completed run; returns False when it is not cacheable."""
+        intent, entities = state.get("intent"), state.get("entities") or []
+        if not entities or not intent or intent == UNPARSED_INTENT or not state.get("decision"):
+            return False
+        key = answer_key(intent, entities)
+        normalized = state.get("normalized_question") or ""
+        payload = json.dumps({k: state.get(k) for k in ANSWER_KEYS}, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, normalized, kb, payload, expires_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, normalized, kb_fingerprint, payload, now + self.ttl if self.ttl else None, now),
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE key = ? AND normalized NOT IN"
+                " (SELECT normalized FROM answers WHERE key = ? ORDER BY created_at DESC LIMIT ?)",
+                (key, key, MAX_VARIANTS_PER_KEY),
+            )
+            self.counters["stores"] += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return stats
+
+    def close(self) -> None:
+        self._conn.close()
+
+_default_answer_cache: Optional[AnswerCache] = None
+
+def answer_cache_for(backend: str) -> Optional[AnswerCache]:
+    """The process-wide answer cache for hosted backends; None when disabled or offline."""
+    global _default_answer_cache
+    if not ENABLE_ANSWER_CACHE or backend in OFFLINE_BACKENDS:
+        return None
+    if _default_answer_cache is None:
+        _default_answer_cache = AnswerCache(ANSWER_CACHE_PATH or None, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+    return _default_answer_cache
@@ -0,0 +1,208 @@
+"""
+Answer Store - Offline-precomputed answers for known KB topics, memory-mapped at startup
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.answer_cache import ANSWER_KEYS, MAX_VARIANTS_PER_KEY, UNPARSED_INTENT, answer_key, similarity
+from config import ENABLE_ANSWER_STORE, ANSWER_STORE_PATH, ANSWER_STORE_SIMILARITY, PRECOMPUTE_MAX_ENTITIES
+
+MAGIC = b"ANSWERS\x02"
+# magic, sha256 of the KB fingerprint, backend name, entry count
+HEADER = struct.Struct("<8s32s16sI")
+# sha256 of answer_key, payload offset, payload length; sorted by digest
+ENTRY = struct.Struct("<32sQI")
+
+def canonical_questions(topic_entities: Dict[str, List[str]],
+                        max_entities: int = PRECOMPUTE_MAX_ENTITIES) -> List[str]:
+    """The questions precompute asks for every topic and entity combination.
+
+    Single entities get an explain and a recommend question; combinations of
+    2 to ``max_entities`` entities of one topic get a comparison and a
+    recommendation among them. The wording matches the perception fast path
+    cues, so perception maps each question to the intent it stands for.
+    """
+    questions: List[str] = []
+    for entities in topic_entities.values():
+        for entity in entities or []:
+            questions.extend((f"What is {entity}?", f"Should I choose {entity}?"))
+        for size in range(2, min(len(entities or []), max_entities) + 1):
+            for combo in itertools.combinations(entities, size):
+                questions.extend((f"Compare {' vs '.join(combo)}",
+                                  f"Which is best: {', '.join(combo)}?"))
+    return list(dict.fromkeys(questions))
+
+def _digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+def _storable(state: Dict[str, Any]) -> bool:
+    """Same rule as AnswerCache.set: a parsed intent, some entities and a decision."""
+    intent = state.get("intent")
+    return bool(state.get("entities") and intent and intent != UNPARSED_INTENT and state.get("decision"))
+
+def write_answer_store(path: str, states: Iterable[Dict[str, Any]], kb_fingerprint: str,
+                       backend: str) -> int:
+    """Write completed runs to ``path``, keyed on their perception output.
+
+    Each entry keeps the normalized question of every run under its
+    (intent, entity set), first run first, so ``get`` can compare wording
+    the way AnswerCache does; runs that AnswerCache would not store are
+    skipped. The file is written next to ``path`` and renamed
+    over it, so processes still mapping the previous store keep a valid view.
+    Returns the number of entries written.
+    """
+    variants: Dict[bytes, Dict[str, Dict[str, Any]]] = {}
+    for state in states:
+        if not _storable(state):
+            continue
+        entry = variants.setdefault(bytes.fromhex(answer_key(state["intent"], state["entities"])), {})
+        normalized = state.get("normalized_question") or ""
+        if normalized not in entry and len(entry) < MAX_VARIANTS_PER_KEY:
+            entry[normalized] = {k: state.get(k) for k in ANSWER_KEYS}
+    payloads = {
+        key: zlib.compress(json.dumps([{"normalized": n, "answer": a} for n, a in entry.items()],
+                                      ensure_ascii=False).encode("utf-8"))
+        for key, entry in variants.items()
+    }
+    keys = sorted(payloads)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, _digest(kb_fingerprint), backend.encode("utf-8")[:16], len(keys)))
+        offset = HEADER.size + ENTRY.size * len(keys)
+        for key in keys:
+            f.write(ENTRY.pack(key, offset, len(payloads[key])))
+            offset += len(payloads[key])
+        for key in keys:
+            f.write(payloads[key])
+    os.replace(tmp, path)
+    return len(keys)
+
+async def precompute_answers(workflow, questions: List[str], concurrency: int = 16) -> Tuple[List[Dict[str, Any]], int]:
+    """Run every question through ``workflow.arun`` with at most ``concurrency`` in flight.
+
+    Returns the finished states in question order and the number of runs that failed.
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(question: str) -> Optional[Dict[str, Any]]:
+        async with slots:
+            try:
+                return await workflow.arun(question, verbose=False)
+            except Exception:
+                return None
+
+    results = await asyncio.gather(*(one(q) for q in questions))
+    states = [r for r in results if r is not None]
+    return states, len(results) - len(states)
+
+class AnswerStore:
+    """Read-only view of a store written by ``write_answer_store``.
+
+    The file is memory-mapped and looked up by binary search over the sorted
+    digest table, so opening it costs one header read however many entries
+    it holds, and a hit decompresses a single payload. As in AnswerCache,
+    with a ``threshold`` the stored normalized question must also be at
+    least that similar to the new one apart from the entities. Every entry
+    was researched from the knowledge base named in the header; ``get``
+    misses for all of them once ``kb_fingerprint`` no longer matches.
+    """
+    def __init__(self, path: str, threshold: float = 0.0):
+        self.path = path
+        self.threshold = threshold
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{path} is not an answer store")
+        magic, self._kb, backend, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or len(self._mm) < HEADER.size + ENTRY.size * self.count:
+            raise ValueError(f"{path} is not an answer store")
+        self.backend = backend.rstrip(b"\0").decode("utf-8")
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def fresh(self, kb_fingerprint: str) -> bool:
+        """True when the store was built from the knowledge base ``kb_fingerprint`` names."""
+        return self._kb == _digest(kb_fingerprint)
+
+    def get(self, intent: str, entities: Iterable[str], normalized_question: str,
+            kb_fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the stored answer fields, or None on a miss."""
+        entities = list(entities)
+        if not entities or intent == UNPARSED_INTENT:
+            return None
+        if not self.fresh(kb_fingerprint):
+            self._count("stale")
+            return None
+        found = self._find(bytes.fromhex(answer_key(intent, entities)))
+        best, best_score = None, -1.0
+        if found is not None:
+            offset, length = found
+            for variant in json.loads(zlib.decompress(self._mm[offset:offset + length])):
+                score = similarity(variant["normalized"], normalized_question, entities) if self.threshold > 0 else 1.0
+                if score >= self.threshold and score > best_score:
+                    best, best_score = variant["answer"], score
+        self._count("hits" if best is not None else "misses")
+        return best
+
+    def _find(self, key: bytes) -> Optional[Tuple[int, int]]:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = HEADER.size + mid * ENTRY.size
+            probe = self._mm[pos:pos + 32]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                _, offset, length = ENTRY.unpack_from(self._mm, pos)
+                return offset, length
+        return None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = self.count
+        return stats
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+
+_default_answer_store: Optional[AnswerStore] = None
+_default_loaded = False
+
+def answer_store_for(backend: str) -> Optional[AnswerStore]:
+    """The process-wide answer store precomputed with ``backend``; None when disabled, missing or from another backend."""
+    global _default_answer_store, _default_loaded
+    if not ENABLE_ANSWER_STORE or not ANSWER_STORE_PATH:
+        return None
+    if not _default_loaded:
+        _default_loaded = True
+        if os.path.exists(ANSWER_STORE_PATH):
+            try:
+                _default_answer_store = AnswerStore(ANSWER_STORE_PATH, ANSWER_STORE_SIMILARITY)
+            except ValueError:
+                _default_answer_store = None
+    store = _default_answer_store
+    return store if store is not None and store.backend == backend else None
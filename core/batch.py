@@ -0,0 +1,143 @@
+"""
+Batch Runner - Streams many questions through one workflow with bounded concurrency
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, List, Set
+
+# Memory keys copied into each output record
+RESULT_KEYS = ("intent", "entities", "normalized_question", "research_facts", "analysis", "decision")
+
+def load_batch(path: str) -> List[Dict[str, Any]]:
+    """Load questions from a JSONL file.
+
+    Each line is either an object with ``question`` (and optionally ``id``) or a
+    bare JSON string. Missing IDs default to the 1-based line number.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            if not record.get("question"):
+                raise ValueError(f"{path}:{line_no}: missing 'question'")
+            items.append({"id": str(record.get("id", line_no)), "question": record["question"]})
+    return items
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Return IDs that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A partially written last line from an interrupted run
+                continue
+            if "error" not in record:
+                done.add(str(record.get("id")))
+    return done
+
+def batch_run_id(item: Dict[str, Any]) -> str:
+    """Checkpoint run ID of a batch item; changes when the question at that ID changes."""
+    raw = f"{item['id']}\0{item['question']}"
+    return "batch:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+async def answer_item(workflow, item: Dict[str, Any], resume: bool = True):
+    """Run one item; with ``resume`` continue from its checkpoint if an earlier attempt failed."""
+    checkpointer = getattr(workflow, "checkpointer", None)
+    if checkpointer is None:
+        return await workflow.arun(item["question"], verbose=False)
+    run_id = batch_run_id(item)
+    if resume and checkpointer.load(run_id) is not None:
+        return await workflow.aresume(run_id, verbose=False)
+    return await workflow.arun(item["question"], verbose=False, run_id=run_id)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+async def run_batch(workflow, items: Iterable[Dict[str, Any]], output_path: str,
+                    concurrency: int = 16, resume: bool = True,
+                    on_result=None, controller=None) -> Dict[str, Any]:
+    """Run every item through ``workflow.arun`` with at most ``concurrency`` in flight.
+
+    Results are appended to ``output_path`` as one JSON line each, flushed as
+    soon as the question finishes. With ``resume`` IDs already present in the
+    output file are skipped, and when the workflow has a checkpointer a
+    question that failed earlier continues after its last completed stage. An ``AIMDController`` (core.ratelimit) further
+    limits concurrency below ``concurrency`` in response to throttling and
+    latency. Returns throughput and latency statistics.
+    """
+    skip = completed_ids(output_path) if resume else set()
+    queue: asyncio.Queue = asyncio.Queue()
+    skipped = 0
+    for item in items:
+        if item["id"] in skip:
+            skipped += 1
+        else:
+            queue.put_nowait(item)
+
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    async with (controller.slot() if controller is not None else nullcontext()):
+                        state = await answer_item(workflow, item, resume)
+                    record = dict(item)
+                    record.update({k: state.get(k) for k in RESULT_KEYS})
+                except Exception as e:
+                    errors += 1
+                    record = dict(item, error=f"{type(e).__name__}: {e}")
+                latency = time.perf_counter() - t0
+                record["latency_s"] = round(latency, 4)
+                latencies.append(latency)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if on_result is not None:
+                    on_result(record)
+
+        workers = max(1, min(concurrency, queue.qsize()))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "processed": len(latencies),
+        "skipped": skipped,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_qps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+    }
+    if controller is not None:
+        stats["final_concurrency"] = int(controller.limit)
+        stats["throttles"] = controller.throttles
+    return stats
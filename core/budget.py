@@ -0,0 +1,58 @@
+"""
+Prompt Budgeting - Fits variable prompt content (facts, analysis) into a token budget
+"""
+
+from typing import Iterable, List, Optional, Sequence
+
+from core.knowledge_base import tokenize
+from core.tokens import CHARS_PER_TOKEN, estimate_message_tokens, estimate_tokens
+
+# Marker appended to text cut short by ``truncate_to_budget``
+ELLIPSIS = " …"
+
+def format_facts(facts: Iterable[str]) -> str:
+    """Render facts as one bullet per line (cheaper and clearer than a Python list repr)."""
+    return "\n".join(f"- {str(fact).strip()}" for fact in facts)
+
+def remaining_budget(template, budget: int, slot: str, **fields) -> int:
+    """Tokens left for ``slot`` once the rest of ``template`` is formatted with ``fields``."""
+    overhead = estimate_message_tokens(template.format_messages(**{slot: ""}, **fields))
+    return max(0, budget - overhead)
+
+def fit_facts(facts: Sequence[str], budget: int, query: Optional[str] = None) -> List[str]:
+    """Keep the facts that fit in ``budget`` tokens when rendered by ``format_facts``.
+
+    Without a ``query`` the input order is taken as the ranking (retrieval
+    results). With one, facts are ranked by how many query terms they share.
+    Survivors keep their original order. Facts that do not fit are skipped,
+    so a shorter lower-ranked fact can still use the remaining space.
+    """
+    order = list(range(len(facts)))
+    if query:
+        terms = set(tokenize(query))
+        scores = [len(terms.intersection(tokenize(str(fact)))) for fact in facts]
+        order.sort(key=lambda i: -scores[i])
+    kept, used = set(), 0
+    for i in order:
+        cost = estimate_tokens(f"- {str(facts[i]).strip()}\n")
+        if used + cost <= budget:
+            kept.add(i)
+            used += cost
+    return [facts[i] for i in sorted(kept)]
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """Cut ``text`` to about ``budget`` tokens, preferring a sentence or word boundary."""
+    if estimate_tokens(text) <= budget:
+        return text
+    limit = max(0, budget * CHARS_PER_TOKEN - len(ELLIPSIS))
+    head = text[:limit]
+    cut = max(head.rfind(". "), head.rfind(".\n"), head.rfind("\n"))
+    if cut < limit // 2:
+        cut = head.rfind(" ")
+    if cut > 0:
+        head = head[:cut + 1]
+    return head.rstrip() + ELLIPSIS
+
+def output_cap(limit: int) -> dict:
+    """LLM call kwargs capping the completion at ``limit`` tokens (0 = uncapped)."""
+    return {"max_tokens": limit} if limit > 0 else {}
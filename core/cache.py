@@ -0,0 +1,242 @@
+"""
+LLM Response Cache - Content-addressed memory LRU in front of a SQLite store
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from core.context import current_stage
+from core.wrappers import LLMResponse, LLMWrapper, model_id
+
+def _message_parts(message: Any):
+    """Return (role, content) for a LangChain message, dict or plain string."""
+    if isinstance(message, dict):
+        return message.get("role", ""), message.get("content", "")
+    if isinstance(message, (tuple, list)) and len(message) == 2:
+        return message[0], message[1]
+    return getattr(message, "type", type(message).__name__), getattr(message, "content", str(message))
+
+def cache_key(messages: Iterable[Any], model: str, temperature: Optional[float],
+              params: Optional[Dict[str, Any]] = None) -> str:
+    """Hash the formatted messages together with the model name, temperature and call params."""
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": [_message_parts(m) for m in messages],
+    }
+    if params:
+        # Only present when set, so keys of calls without params are unchanged
+        payload["params"] = params
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """Two-tier response cache: a bounded in-memory LRU backed by SQLite.
+
+    ``path=None`` keeps only the memory tier. Entries expire after ``ttl``
+    seconds (``None`` or 0 disables expiry) and the disk tier is trimmed to
+    ``max_bytes`` of stored content, evicting the least recently used rows.
+    """
+    def __init__(self, path: Optional[str] = None, memory_size: int = 1024,
+                 ttl: Optional[float] = 86400, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.memory_size = memory_size
+        self.ttl = ttl or None
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_bytes = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if path:
+            self._open(path)
+
+    def _open(self, path: str) -> None:
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed_at)")
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached content for ``key`` or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                content, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return content
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT content, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    content, expires_at = row
+                    if expires_at is None or expires_at > now:
+                        self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._remember(key, content, expires_at)
+                        self.counters["disk_hits"] += 1
+                        return content
+                    self._delete(key)
+
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, key: str, content: str) -> None:
+        """Store ``content`` under ``key`` in both tiers."""
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            self._remember(key, content, expires_at)
+            self.counters["stores"] += 1
+            if self._conn is None:
+                return
+            size = len(content.encode("utf-8"))
+            old = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, content, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, expires_at, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+
+    def _remember(self, key: str, content: str, expires_at: Optional[float]) -> None:
+        self._memory[key] = (content, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _delete(self, key: str) -> None:
+        row = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._disk_bytes -= row[0]
+
+    def _evict_disk(self) -> None:
+        # Expired rows go first, then least recently used until under 90% of the budget
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        target = int(self.max_bytes * 0.9)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY accessed_at"
+        ).fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            self.counters["evictions"] += 1
+        self._disk_bytes = total
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus current tier sizes."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class CachedLLM(LLMWrapper):
+    """Serves repeated prompts from an LLMCache instead of calling the model.
+
+    Stages listed in ``disabled_stages`` (see core.context.stage_scope) always
+    go to the model.
+    """
+    def __init__(self, llm, cache: LLMCache, disabled_stages: Iterable[str] = ()):
+        super().__init__(llm)
+        self.cache = cache
+        self.disabled_stages = frozenset(disabled_stages)
+
+    def _key(self, messages, kwargs) -> Optional[str]:
+        if current_stage() in self.disabled_stages:
+            return None
+        return cache_key(messages, model_id(self.llm), getattr(self.llm, "temperature", None), kwargs)
+
+    def invoke(self, messages, **kwargs):
+        key = self._key(messages, kwargs)
+        if key is None:
+            return self.llm.invoke(messages, **kwargs)
+        content = self.cache.get(key)
+        if content is not None:
+            return LLMResponse(content, cache_hit=True)
+        response = self.llm.invoke(messages, **kwargs)
+        self.cache.set(key, getattr(response, "content", str(response)))
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        key = self._key(messages, kwargs)
+        if key is None:
+            return await self.llm.ainvoke(messages, **kwargs)
+        content = self.cache.get(key)
+        if content is not None:
+            return LLMResponse(content, cache_hit=True)
+        response = await self.llm.ainvoke(messages, **kwargs)
+        self.cache.set(key, getattr(response, "content", str(response)))
+        return response
+
+    def stream(self, messages, **kwargs):
+        key = self._key(messages, kwargs)
+        if key is None:
+            yield from self.llm.stream(messages, **kwargs)
+            return
+        content = self.cache.get(key)
+        if content is not None:
+            yield LLMResponse(content, cache_hit=True)
+            return
+        parts = []
+        for chunk in self.llm.stream(messages, **kwargs):
+            parts.append(getattr(chunk, "content", str(chunk)))
+            yield chunk
+        self.cache.set(key, "".join(parts))
+
+    async def astream(self, messages, **kwargs):
+        key = self._key(messages, kwargs)
+        if key is None:
+            async for chunk in self.llm.astream(messages, **kwargs):
+                yield chunk
+            return
+        content = self.cache.get(key)
+        if content is not None:
+            yield LLMResponse(content, cache_hit=True)
+            return
+        parts = []
+        async for chunk in self.llm.astream(messages, **kwargs):
+            parts.append(getattr(chunk, "content", str(chunk)))
+            yield chunk
+        self.cache.set(key, "".join(parts))
@@ -0,0 +1,80 @@
+"""
+Checkpoints - Append-only SQLite log of Memory snapshots so failed runs can resume
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from core.llm_factory import OFFLINE_BACKENDS
+from config import ENABLE_CHECKPOINTS, CHECKPOINT_PATH, CHECKPOINT_TTL
+
+class Checkpointer:
+    """Stores the Memory after every completed stage, keyed by run ID.
+
+    Snapshots are only ever appended; ``load`` returns the newest one. The
+    database runs in WAL mode with ``synchronous=NORMAL``, so a write is an
+    append to the log without an fsync and SQLite syncs many of them at once
+    when it checkpoints the WAL. A crashed process loses nothing; a power
+    loss can lose the last few snapshots, which only means redoing those
+    stages. Snapshots older than ``ttl`` seconds are pruned on open.
+    ``path=None`` keeps checkpoints in memory only.
+    """
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = 604800):
+        self.ttl = ttl or None
+        self._lock = threading.Lock()
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, step TEXT,"
+            " state TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_run ON checkpoints (run_id, seq)")
+        if self.ttl:
+            self._conn.execute("DELETE FROM checkpoints WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def save(self, run_id: str, state: Dict[str, Any]) -> None:
+        """Append a snapshot of ``state`` for ``run_id``."""
+        payload = json.dumps(state, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO checkpoints (run_id, step, state, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, state.get("step"), payload, time.time()),
+            )
+
+    def load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Return the newest snapshot of ``run_id``, or None when it has none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM checkpoints WHERE run_id = ? ORDER BY seq DESC LIMIT 1", (run_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshots, runs = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT run_id) FROM checkpoints"
+            ).fetchone()
+        return {"snapshots": snapshots, "runs": runs}
+
+    def close(self) -> None:
+        self._conn.close()
+
+_default_checkpointer: Optional[Checkpointer] = None
+
+def checkpointer_for(backend: str) -> Optional[Checkpointer]:
+    """The process-wide checkpointer for hosted backends; None when disabled or offline."""
+    global _default_checkpointer
+    if not ENABLE_CHECKPOINTS or backend in OFFLINE_BACKENDS:
+        return None
+    if _default_checkpointer is None:
+        _default_checkpointer = Checkpointer(CHECKPOINT_PATH or None, CHECKPOINT_TTL)
+    return _default_checkpointer
@@ -0,0 +1,58 @@
+"""
+Execution Context - Tracks which workflow stage is currently calling the LLM and its deadline
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Set by the workflow around each agent call; read by LLM wrappers (cache, ...)
+_current_stage: ContextVar[Optional[str]] = ContextVar("current_stage", default=None)
+
+# Absolute time.monotonic() by which the current workflow or stage must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """An LLM call did not finish before the active stage or workflow deadline."""
+
+def current_stage() -> Optional[str]:
+    """Return the stage (perception, research, analysis, decision) being run, if any."""
+    return _current_stage.get()
+
+@contextmanager
+def stage_scope(name: str) -> Iterator[None]:
+    """Mark every LLM call made inside the block as belonging to ``name``."""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left before the active deadline (negative once past it), or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline() -> None:
+    """Raise DeadlineExceeded when the active deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{current_stage() or 'workflow'} exceeded its deadline")
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """Give the block at most ``seconds``; an earlier enclosing deadline still applies.
+
+    ``None`` or 0 leaves the current deadline unchanged.
+    """
+    if not seconds:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
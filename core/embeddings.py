@@ -0,0 +1,176 @@
+"""
+Dense Retrieval - Hashing TF-IDF embeddings stored as a memory-mapped float32 matrix
+"""
+
+import json
+import math
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# numpy is optional: without it the Research agent stays on BM25 only. It is
+# imported on first use, so runs that never touch the dense index skip it
+np = None
+
+from core.knowledge_base import KnowledgeBase, get_knowledge_base, tokenize
+from config import (
+    ENABLE_KNOWLEDGE_BASE, KNOWLEDGE_BASE_PATH, DENSE_INDEX_PATH, EMBEDDING_DIM,
+)
+
+# Rows embedded per write when building the matrix
+BUILD_BATCH_SIZE = 8192
+
+def _load_numpy() -> bool:
+    """Import numpy once; False when it is not installed."""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except Exception:
+            return False
+        np = numpy
+    return True
+
+def _features(text: str) -> Dict[int, float]:
+    """Hash tokens to 32-bit feature ids with sublinear tf weights."""
+    counts: Dict[int, int] = {}
+    for token in tokenize(text):
+        h = zlib.crc32(token.encode("utf-8"))
+        counts[h] = counts.get(h, 0) + 1
+    return {h: 1.0 + math.log(c) for h, c in counts.items()}
+
+class HashingEmbedder:
+    """CPU-only text embedder: feature hashing into ``dim`` buckets with IDF weights.
+
+    Each token lands in bucket ``crc32 % dim`` with a sign taken from
+    the top hash bit, so collisions cancel out on average. Bucket IDF weights
+    are fitted on the corpus at build time and stored with the matrix.
+    """
+    def __init__(self, dim: int = EMBEDDING_DIM, idf: Optional["np.ndarray"] = None):
+        if not _load_numpy():
+            raise RuntimeError("numpy not installed. pip install numpy")
+        self.dim = dim
+        self.idf = idf if idf is not None else np.ones(dim, dtype=np.float32)
+
+    def fit(self, texts) -> "HashingEmbedder":
+        """Compute bucket-level document frequencies and set IDF weights."""
+        df = np.zeros(self.dim, dtype=np.float64)
+        n = 0
+        for text in texts:
+            n += 1
+            buckets = {h % self.dim for h in _features(text)}
+            df[list(buckets)] += 1
+        self.idf = np.log((1 + n) / (1 + df)).astype(np.float32) + 1.0
+        return self
+
+    def embed_into(self, text: str, out: "np.ndarray") -> None:
+        """Write the L2-normalised embedding of ``text`` into the row ``out``."""
+        out[:] = 0.0
+        for h, weight in _features(text).items():
+            out[h % self.dim] += weight if h & 0x80000000 else -weight
+        out *= self.idf
+        norm = float(np.linalg.norm(out))
+        if norm > 0:
+            out /= norm
+
+    def embed(self, text: str) -> "np.ndarray":
+        vec = np.empty(self.dim, dtype=np.float32)
+        self.embed_into(text, vec)
+        return vec
+
+def _fact_text(kb: KnowledgeBase, fact_id: int) -> str:
+    return f"{kb.facts[fact_id]} {kb.topic_of(fact_id)}"
+
+def build_dense_index(kb: KnowledgeBase, path: str, dim: int = EMBEDDING_DIM) -> str:
+    """Embed every KB fact into a contiguous float32 ``.npy`` matrix at ``path``.
+
+    A ``.meta.json`` sidecar records the KB fingerprint and IDF weights so a
+    stale matrix is detected at load time.
+    """
+    embedder = HashingEmbedder(dim).fit(_fact_text(kb, i) for i in range(len(kb)))
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}.npy"
+    matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(kb), dim))
+    batch = np.empty((BUILD_BATCH_SIZE, dim), dtype=np.float32)
+    for start in range(0, len(kb), BUILD_BATCH_SIZE):
+        stop = min(start + BUILD_BATCH_SIZE, len(kb))
+        for row, fact_id in enumerate(range(start, stop)):
+            embedder.embed_into(_fact_text(kb, fact_id), batch[row])
+        matrix[start:stop] = batch[:stop - start]
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, path)
+
+    with open(path + ".meta.json", "w", encoding="utf-8") as f:
+        json.dump({"dim": dim, "count": len(kb), "fingerprint": kb.fingerprint,
+                   "idf": embedder.idf.tolist()}, f)
+    return path
+
+class DenseIndex:
+    """Read-only view of the embedding matrix, shared between processes via the page cache."""
+    def __init__(self, matrix: "np.ndarray", embedder: HashingEmbedder, fingerprint: str):
+        self.matrix = matrix
+        self.embedder = embedder
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path: str) -> "DenseIndex":
+        if not _load_numpy():
+            raise RuntimeError("numpy not installed. pip install numpy")
+        with open(path + ".meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(path, mmap_mode="r")
+        embedder = HashingEmbedder(meta["dim"], np.asarray(meta["idf"], dtype=np.float32))
+        return cls(matrix, embedder, meta["fingerprint"])
+
+    def search_scored(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Return the top-k (fact id, cosine similarity) pairs with positive similarity."""
+        n = self.matrix.shape[0]
+        if n == 0 or k <= 0:
+            return []
+        scores = self.matrix @ self.embedder.embed(query)
+        k = min(k, n)
+        top = np.argpartition(scores, n - k)[n - k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+def hybrid_search(kb: KnowledgeBase, dense: Optional[DenseIndex], query: str, k: int,
+                  rrf_k: int = 60) -> List[str]:
+    """Fuse BM25 and dense rankings with reciprocal rank fusion."""
+    if dense is None:
+        return kb.search(query, k)
+    fused: Dict[int, float] = {}
+    for ranking in (kb.search_scored(query, k * 3), dense.search_scored(query, k * 3)):
+        for rank, (fact_id, _) in enumerate(ranking):
+            fused[fact_id] = fused.get(fact_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [kb.facts[i] for i in best]
+
+def dense_index_path() -> str:
+    return DENSE_INDEX_PATH or KNOWLEDGE_BASE_PATH + ".dense.npy"
+
+_dense: Optional[DenseIndex] = None
+_dense_loaded = False
+_dense_lock = threading.Lock()
+
+def get_dense_index() -> Optional[DenseIndex]:
+    """Return the process-wide dense index, or None when unavailable or stale.
+
+    The matrix is built offline (``python main.py --build-index``); a missing
+    file, missing numpy or a KB fingerprint mismatch all disable dense retrieval.
+    """
+    global _dense, _dense_loaded
+    if not _dense_loaded:
+        with _dense_lock:
+            if not _dense_loaded:
+                kb = get_knowledge_base()
+                path = dense_index_path()
+                if kb is not None and ENABLE_KNOWLEDGE_BASE and os.path.exists(path) and _load_numpy():
+                    dense = DenseIndex.load(path)
+                    if dense.fingerprint == kb.fingerprint:
+                        _dense = dense
+                _dense_loaded = True
+    return _dense
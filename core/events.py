@@ -0,0 +1,40 @@
+"""
+Workflow Events - Typed progress events and the sink they are delivered to
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional, TypedDict
+
+class WorkflowEvent(TypedDict, total=False):
+    """A single progress event emitted while a workflow runs."""
+    # workflow_started | stage_started | token | fact | stage_finished | workflow_finished
+    type: str
+    stage: Optional[str]
+    # token text for "token" events
+    text: str
+    # question, research fact, stage output or final Memory depending on the event type
+    data: Any
+
+EventSink = Callable[[WorkflowEvent], None]
+
+_sink: ContextVar[Optional[EventSink]] = ContextVar("event_sink", default=None)
+
+def emit(event: WorkflowEvent) -> None:
+    """Deliver ``event`` to the active sink, if any."""
+    sink = _sink.get()
+    if sink is not None:
+        sink(event)
+
+def is_streaming() -> bool:
+    """True when someone is listening for events, so stages should stream tokens."""
+    return _sink.get() is not None
+
+@contextmanager
+def event_sink(sink: EventSink) -> Iterator[None]:
+    """Route every event emitted inside the block to ``sink``."""
+    token = _sink.set(sink)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
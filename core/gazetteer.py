@@ -0,0 +1,115 @@
+"""
+Gazetteer - Linear-time multi-pattern entity matching (Aho-Corasick)
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.knowledge_base import get_knowledge_base
+
+class AhoCorasick:
+    """Finds every occurrence of many patterns in one pass over the text.
+
+    Built once from the pattern list, a lookup costs O(len(text) + matches)
+    however many patterns there are. Matching is on the exact characters
+    given, so callers lowercase both patterns and text for case-insensitive search.
+    """
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]  # pattern lengths ending at each state
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._link()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        if len(pattern) not in self._out[state]:
+            self._out[state].append(len(pattern))
+
+    def _link(self) -> None:
+        """Breadth-first pass computing failure links and merged outputs."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        """Return (start, end) spans of every pattern occurrence in ``text``."""
+        spans = []
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length in out[state]:
+                spans.append((i + 1 - length, i + 1))
+        return spans
+
+class Gazetteer:
+    """Case-insensitive whole-word lookup of known entity names.
+
+    Overlapping hits resolve leftmost-longest, so "MacBook Pro" wins over a
+    bare "Pro" and each entity is returned once under its canonical spelling.
+    """
+    def __init__(self, names: Iterable[str]):
+        self.canonical: Dict[str, str] = {}
+        for name in names:
+            key = " ".join(str(name).lower().split())
+            if key:
+                self.canonical.setdefault(key, str(name).strip())
+        self._matcher = AhoCorasick(self.canonical)
+
+    def __len__(self) -> int:
+        return len(self.canonical)
+
+    def entities(self, text: str) -> List[str]:
+        lowered = " ".join(text.lower().split())
+        spans = [(s, e) for s, e in self._matcher.find(lowered)
+                 if (s == 0 or not lowered[s - 1].isalnum()) and (e == len(lowered) or not lowered[e].isalnum())]
+        spans.sort(key=lambda span: (span[0], -span[1]))
+        found, last_end = [], 0
+        for start, end in spans:
+            if start < last_end:
+                continue
+            name = self.canonical[lowered[start:end]]
+            if name not in found:
+                found.append(name)
+            last_end = end
+        return found
+
+_gazetteer: Optional[Tuple[str, Gazetteer]] = None
+_gazetteer_lock = threading.Lock()
+
+def entity_gazetteer() -> Optional[Gazetteer]:
+    """Gazetteer over the knowledge base's entity names, rebuilt when the KB changes."""
+    global _gazetteer
+    kb = get_knowledge_base()
+    if kb is None:
+        return None
+    cached = _gazetteer
+    if cached is not None and cached[0] == kb.fingerprint:
+        return cached[1]
+    with _gazetteer_lock:
+        if _gazetteer is None or _gazetteer[0] != kb.fingerprint:
+            names = (name for names in kb.topic_entities.values() for name in names)
+            _gazetteer = (kb.fingerprint, Gazetteer(names))
+        return _gazetteer[1]
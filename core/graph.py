@@ -0,0 +1,64 @@
+"""
+Workflow Graph - Compiles the agent pipeline into a LangGraph state machine
+"""
+
+from core.memory import Memory
+from agents.orchestrator import route_next_step
+
+STAGES = ("perception", "research", "analysis", "decision")
+
+def node_name(stage: str) -> str:
+    # LangGraph node names may not collide with Memory keys such as "analysis"
+    return f"{stage}_agent"
+
+def route_entry(state: Memory) -> str:
+    """Start with perception unless the state already carries its output."""
+    if state.get("intent") is None:
+        return "perception"
+    return route_next_step(state)
+
+def route_entry_fast(state: Memory) -> str:
+    """Start with the fused call unless resuming a run that got past it.
+
+    Follow-ups in a session go to perception, which sees the earlier turns.
+    """
+    if state.get("intent") is None:
+        return "perception" if state.get("context") else "fast"
+    return route_next_step(state)
+
+def route_after_fast(state: Memory) -> str:
+    """Finish when the fused call produced a decision, else run the full pipeline."""
+    return "done" if state.get("decision") is not None else "perception"
+
+def build_graph(nodes):
+    """Compile a StateGraph over Memory from ``nodes``.
+
+    ``nodes`` maps each stage name to a (sync, async) pair of callables taking
+    the current Memory and returning a partial update. Every edge is
+    conditional on ``route_next_step``, so stages can be skipped (e.g. factual
+    intents go research -> decision) and routing never costs an LLM call.
+    An optional ``"fast"`` node runs first and falls through to perception
+    when it fails. Entry routing skips completed stages, so a checkpointed
+    Memory can be passed in to resume a run.
+    """
+    # Imported here so importing the workflow module stays cheap
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import END, START, StateGraph
+
+    graph = StateGraph(Memory)
+    path_map = {stage: node_name(stage) for stage in STAGES}
+    path_map["done"] = END
+
+    for stage in STAGES:
+        func, afunc = nodes[stage]
+        graph.add_node(node_name(stage), RunnableLambda(func, afunc=afunc, name=node_name(stage)))
+        graph.add_conditional_edges(node_name(stage), route_next_step, path_map)
+
+    if "fast" in nodes:
+        func, afunc = nodes["fast"]
+        graph.add_node(node_name("fast"), RunnableLambda(func, afunc=afunc, name=node_name("fast")))
+        graph.add_conditional_edges(START, route_entry_fast, {**path_map, "fast": node_name("fast")})
+        graph.add_conditional_edges(node_name("fast"), route_after_fast, path_map)
+    else:
+        graph.add_conditional_edges(START, route_entry, path_map)
+    return graph.compile()
@@ -0,0 +1,83 @@
+"""
+HTTP Pool - Shared keep-alive connection pools for hosted LLM clients
+"""
+
+import asyncio
+from typing import AsyncGenerator, Dict
+
+import httpx
+
+class PerLoopTransport(httpx.AsyncBaseTransport):
+    """Async transport keeping one keep-alive pool per event loop.
+
+    asyncio connections belong to the loop that opened them, so a single
+    pool cannot be reused across ``asyncio.run`` calls; each loop gets its own.
+    A pool is closed (and forgotten) when its loop shuts down its async
+    generators, which ``asyncio.run`` does before closing the loop, so
+    finished loops leave no pools or sockets behind.
+    """
+    def __init__(self, **transport_kwargs):
+        self._kwargs = transport_kwargs
+        self._pools: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+        # One pending async generator per loop; its finally closes the loop's pool
+        self._closers: Dict[asyncio.AbstractEventLoop, AsyncGenerator[None, None]] = {}
+
+    async def _pool(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = self._pools[loop] = httpx.AsyncHTTPTransport(**self._kwargs)
+            closer = self._closers[loop] = self._close_on_shutdown(loop, pool)
+            await closer.__anext__()
+        return pool
+
+    async def _close_on_shutdown(self, loop: asyncio.AbstractEventLoop,
+                                 pool: httpx.AsyncHTTPTransport) -> AsyncGenerator[None, None]:
+        try:
+            yield
+        finally:
+            self._closers.pop(loop, None)
+            if self._pools.get(loop) is pool:
+                del self._pools[loop]
+            await pool.aclose()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await (await self._pool()).handle_async_request(request)
+
+    async def aclose(self) -> None:
+        closer = self._closers.pop(asyncio.get_running_loop(), None)
+        if closer is not None:
+            await closer.aclose()
+        self.close_idle()
+
+    def close_idle(self) -> None:
+        """Close pools whose loop is idle; pools of closed loops are just dropped."""
+        for loop, closer in list(self._closers.items()):
+            if not loop.is_closed() and not loop.is_running():
+                loop.run_until_complete(closer.aclose())
+        self._pools.clear()
+        self._closers.clear()
+
+class SharedHTTPPool:
+    """The sync and async clients every hosted LLM client in a process shares."""
+    def __init__(self, max_connections: int, max_keepalive: int, keepalive_expiry: float,
+                 connect_timeout: float, request_timeout: float):
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        timeout = httpx.Timeout(request_timeout, connect=connect_timeout)
+        self._transport = PerLoopTransport(limits=limits)
+        self.client = httpx.Client(limits=limits, timeout=timeout)
+        self.async_client = httpx.AsyncClient(transport=self._transport, timeout=timeout)
+
+    def close(self) -> None:
+        """Close both clients, from sync code or from inside a running event loop."""
+        self.client.close()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._transport.close_idle()
+        else:
+            loop.create_task(self.async_client.aclose())
@@ -0,0 +1,134 @@
+"""
+Streaming JSON - Incremental parsing of list output while an LLM completion streams in
+"""
+
+import json
+from typing import Any, List, Optional
+
+# Line prefixes treated as bullets when the output is not a JSON array
+BULLETS = ("-", "•", "*")
+
+# Unbulleted lines shorter than this are headings or noise, not facts
+MIN_LINE_FACT_LENGTH = 21
+
+class FactStreamParser:
+    """Turns streamed text into facts, returning each one as soon as it is complete.
+
+    The output is expected to hold a JSON array. ``feed`` returns every
+    element that finished in the text it was given: a string element as soon
+    as its closing quote arrives, anything else at the following comma or
+    bracket. Lines before the array (a code fence or a one-line preamble) are
+    skipped, and once the array closes ``done`` is set and later text is
+    ignored.
+
+    Output that never opens an array is read line by line instead: bullets
+    and long lines become facts, at most ``max_line_facts`` of them.
+    """
+
+    def __init__(self, max_line_facts: Optional[int] = None):
+        self.max_line_facts = max_line_facts
+        self.done = False
+        self.in_array = False
+        self.line_facts = 0
+        self._line: List[str] = []
+        self._pending: Optional[str] = None  # prose line that may turn out to be a preamble
+        self._element: List[str] = []
+        self._emitted = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume the next chunk and return the facts it completed."""
+        out: List[Any] = []
+        for ch in text:
+            if self.done:
+                break
+            if not self.in_array:
+                self._feed_line(ch, out)
+            elif self._in_string:
+                self._element.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 0:
+                        self._emit_element(out)
+            elif ch == "," and self._depth == 0:
+                self._end_element(out)
+            elif ch == "]" and self._depth == 0:
+                self._end_element(out)
+                self.done = True
+            else:
+                if ch == '"':
+                    self._in_string = True
+                elif ch in "[{":
+                    self._depth += 1
+                elif ch in "]}" and self._depth > 0:
+                    self._depth -= 1
+                self._element.append(ch)
+        return out
+
+    def close(self) -> List[Any]:
+        """Flush what is left once the stream ends; returns the last facts."""
+        out: List[Any] = []
+        if self.in_array and not self.done:
+            # Truncated array (e.g. cut by max_tokens): keep a complete last element
+            self._end_element(out)
+        elif not self.in_array:
+            self._end_line(out)
+            self._flush_pending(out)
+        return out
+
+    # --- array mode ---------------------------------------------------------
+
+    def _emit_element(self, out: List[Any]) -> None:
+        raw = "".join(self._element).strip()
+        if self._emitted or not raw:
+            return
+        try:
+            out.append(json.loads(raw))
+        except ValueError:
+            return
+        self._emitted = True
+
+    def _end_element(self, out: List[Any]) -> None:
+        self._emit_element(out)
+        self._element = []
+        self._emitted = False
+
+    # --- line mode ----------------------------------------------------------
+
+    def _feed_line(self, ch: str, out: List[Any]) -> None:
+        if ch == "\n":
+            self._end_line(out)
+        elif ch == "[" and not "".join(self._line).strip():
+            # The array starts here; a prose line just before it was a preamble
+            self.in_array = True
+            self._line = []
+            self._pending = None
+        else:
+            self._line.append(ch)
+
+    def _end_line(self, out: List[Any]) -> None:
+        line = "".join(self._line).strip()
+        self._line = []
+        if not line:
+            return
+        self._flush_pending(out)
+        if line.startswith(BULLETS):
+            self._add_line_fact(line.lstrip("- • *").strip(), out)
+        elif len(line) >= MIN_LINE_FACT_LENGTH:
+            self._pending = line
+
+    def _flush_pending(self, out: List[Any]) -> None:
+        if self._pending is not None:
+            self._add_line_fact(self._pending, out)
+            self._pending = None
+
+    def _add_line_fact(self, fact: str, out: List[Any]) -> None:
+        if fact and (self.max_line_facts is None or self.line_facts < self.max_line_facts):
+            self.line_facts += 1
+            out.append(fact)
@@ -0,0 +1,224 @@
+"""
+Knowledge Base - Fact corpus loaded from KNOWLEDGE_BASE_PATH with a persisted BM25 index
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    ENABLE_KNOWLEDGE_BASE, KNOWLEDGE_BASE_PATH, KNOWLEDGE_BASE_INDEX_PATH,
+    KB_MAX_POSTINGS,
+)
+
+# Bump when the on-disk index layout changes so stale indexes are rebuilt
+INDEX_VERSION = 1
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be between by can do does for from how i in is it me my of on or
+should that the their there these this to vs versus was what when which who why will
+with you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens with stopwords removed."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def _iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield fact records ({text, topic, entities}) from a JSON or JSONL corpus.
+
+    Supported layouts:
+      - JSONL: one record or bare string per line (for large corpora)
+      - JSON:  {"topics": [{"topic", "entities", "facts": [...]}, ...]}
+      - JSON:  {"topic name": ["fact", ...], ...}
+      - JSON:  [record or string, ...]
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    yield {"text": record} if isinstance(record, str) else record
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if isinstance(data, dict) and isinstance(data.get("topics"), list):
+        for topic in data["topics"]:
+            for fact in topic.get("facts", []):
+                yield {"text": fact, "topic": topic.get("topic", "general"),
+                       "entities": topic.get("entities", [])}
+    elif isinstance(data, dict):
+        for topic, facts in data.items():
+            for fact in facts:
+                yield {"text": fact, "topic": topic}
+    else:
+        for record in data:
+            yield {"text": record} if isinstance(record, str) else record
+
+def _source_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+class KnowledgeBase:
+    """In-memory fact corpus with an impact-ordered BM25 inverted index.
+
+    Each posting list stores (doc id, precomputed BM25 weight) sorted by
+    descending weight, so a query only has to walk the first ``max_postings``
+    entries of each term no matter how large the corpus grows.
+    """
+    def __init__(self, facts: List[str], fact_topics: array, topics: List[str],
+                 topic_entities: Dict[str, List[str]], index: Dict[str, Tuple[array, array]],
+                 fingerprint: str, max_postings: int = KB_MAX_POSTINGS):
+        self.facts = facts
+        self.fact_topics = fact_topics
+        self.topics = topics
+        self.topic_entities = topic_entities
+        self.index = index
+        self.fingerprint = fingerprint
+        self.max_postings = max_postings
+
+    @classmethod
+    def build(cls, records: Iterator[Dict[str, Any]], **kwargs) -> "KnowledgeBase":
+        """Tokenize every fact and build the BM25 index."""
+        facts: List[str] = []
+        fact_topics = array("I")
+        topics: List[str] = []
+        topic_ids: Dict[str, int] = {}
+        topic_entities: Dict[str, List[str]] = defaultdict(list)
+        doc_len = array("I")
+        post_docs: Dict[str, array] = defaultdict(lambda: array("I"))
+        post_tfs: Dict[str, array] = defaultdict(lambda: array("H"))
+        digest = hashlib.sha256()
+
+        for record in records:
+            text = str(record.get("text", "")).strip()
+            if not text:
+                continue
+            topic = record.get("topic") or "general"
+            if topic not in topic_ids:
+                topic_ids[topic] = len(topics)
+                topics.append(topic)
+            for entity in record.get("entities") or []:
+                if entity not in topic_entities[topic]:
+                    topic_entities[topic].append(entity)
+
+            doc_id = len(facts)
+            facts.append(text)
+            fact_topics.append(topic_ids[topic])
+            digest.update(f"{topic}\x1f{text}\x1e".encode("utf-8"))
+
+            # Topic and entity names are indexed with the fact so topic-level queries match
+            counts = Counter(tokenize(" ".join([text, topic, *(record.get("entities") or [])])))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                post_docs[term].append(doc_id)
+                post_tfs[term].append(min(tf, 65535))
+
+        n_docs = len(facts)
+        avg_len = (sum(doc_len) / n_docs) if n_docs else 0.0
+        index: Dict[str, Tuple[array, array]] = {}
+        for term, docs in post_docs.items():
+            tfs = post_tfs[term]
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            weights = [
+                idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len[d] / avg_len))
+                for d, tf in zip(docs, tfs)
+            ]
+            order = sorted(range(len(docs)), key=weights.__getitem__, reverse=True)
+            index[term] = (array("I", (docs[i] for i in order)), array("f", (weights[i] for i in order)))
+
+        return cls(facts, fact_topics, topics, dict(topic_entities), index, digest.hexdigest(), **kwargs)
+
+    @classmethod
+    def load(cls, path: str, index_path: Optional[str] = None) -> "KnowledgeBase":
+        """Load the corpus at ``path``, reusing the persisted index when it is current."""
+        index_path = index_path or path + ".bm25.pkl"
+        signature = _source_signature(path)
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "rb") as f:
+                    payload = pickle.load(f)
+                if payload.get("version") == INDEX_VERSION and payload.get("signature") == signature:
+                    return cls(**payload["kb"])
+            except Exception:
+                pass  # Corrupt or incompatible index: rebuild below
+
+        kb = cls.build(_iter_records(path))
+        kb.save(index_path, signature)
+        return kb
+
+    def save(self, index_path: str, signature: Tuple[int, int]) -> None:
+        """Atomically persist the index next to the corpus."""
+        payload = {
+            "version": INDEX_VERSION,
+            "signature": signature,
+            "kb": {
+                "facts": self.facts,
+                "fact_topics": self.fact_topics,
+                "topics": self.topics,
+                "topic_entities": self.topic_entities,
+                "index": self.index,
+                "fingerprint": self.fingerprint,
+            },
+        }
+        tmp_path = f"{index_path}.tmp.{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+
+    def search_scored(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Return the top-k (fact id, BM25 score) pairs for ``query``."""
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for term in set(tokenize(query)):
+            entry = self.index.get(term)
+            if entry is None:
+                continue
+            docs, weights = entry
+            for i in range(min(len(docs), self.max_postings)):
+                d = docs[i]
+                scores[d] = get(d, 0.0) + weights[i]
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+    def search(self, query: str, k: int) -> List[str]:
+        """Return the text of the top-k facts for ``query``."""
+        return [self.facts[i] for i, _ in self.search_scored(query, k)]
+
+    def topic_of(self, fact_id: int) -> str:
+        return self.topics[self.fact_topics[fact_id]]
+
+    def __len__(self) -> int:
+        return len(self.facts)
+
+_kb: Optional[KnowledgeBase] = None
+_kb_loaded = False
+_kb_lock = threading.Lock()
+
+def get_knowledge_base() -> Optional[KnowledgeBase]:
+    """Return the process-wide knowledge base, or None when disabled or missing."""
+    global _kb, _kb_loaded
+    if not _kb_loaded:
+        with _kb_lock:
+            if not _kb_loaded:
+                if ENABLE_KNOWLEDGE_BASE and os.path.exists(KNOWLEDGE_BASE_PATH):
+                    _kb = KnowledgeBase.load(KNOWLEDGE_BASE_PATH, KNOWLEDGE_BASE_INDEX_PATH or None)
+                _kb_loaded = True
+    return _kb
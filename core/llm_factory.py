@@ -2,78 +2,252 @@
 LLM Factory - Creates and manages different LLM backends
 """
 
+import atexit
 import os
-from typing import Optional
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Union
 
-# LLM backends (optional — not required when using FakeLLM)
-try:
-    from langchain_groq import ChatGroq
-except Exception:
-    ChatGroq = None
+from core.cache import CachedLLM, LLMCache
+from core.ratelimit import RateLimitedLLM, get_rate_limiter
+from core.replay import RecordingLLM, ReplayLLM, get_recorder, open_trace, start_recording
+from core.routing import CascadeLLM, HedgedLLM
+from core.simulated import SimulatedLLM
+from core.singleflight import CoalescingLLM
+from core.tracing import TracedLLM
+from core.wrappers import model_id
+
+if TYPE_CHECKING:
+    from core.http_pool import SharedHTTPPool
+from config import (
+    ENABLE_LLM_CACHE, LLM_CACHE_PATH, LLM_CACHE_MEMORY_SIZE, LLM_CACHE_TTL,
+    LLM_CACHE_MAX_MB, LLM_CACHE_DISABLED_STAGES, ENABLE_TRACING,
+    SIM_SEED, SIM_LATENCY_MS, SIM_LATENCY_SIGMA, SIM_TOKENS_PER_SECOND,
+    SIM_ERROR_RATE, SIM_TIMEOUT_RATE, SIM_TIMEOUT_S,
+    LLM_POOL_MAX_CONNECTIONS, LLM_POOL_MAX_KEEPALIVE, LLM_POOL_KEEPALIVE_EXPIRY,
+    LLM_CONNECT_TIMEOUT, LLM_REQUEST_TIMEOUT,
+    LLM_RPM, LLM_TPM, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    ENABLE_COALESCING, ENABLE_HEDGING, HEDGE_MIN_DELAY_MS, CASCADE_STAGES,
+    TRACE_RECORD_PATH, REPLAY_TRACE_PATH, REPLAY_SPEED, REPLAY_STRICT,
+)
 
 # Configuration
 BACKEND = os.getenv("BACKEND", "groq").lower()  # Changed default to groq
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.2"))
 
+# Offline backends are never cached by default so they exercise the full stack
+OFFLINE_BACKENDS = ("fake", "sim", "replay")
+
 class FakeLLM:
     """A tiny deterministic LLM for offline tests."""
     def __init__(self, name: str = "fake", temperature: float = 0.0):
         self.name = name
         self.temperature = temperature
 
-    def invoke(self, messages):
+    def invoke(self, messages, **kwargs):
         # Simple mock responses for testing
         return type('MockResponse', (), {'content': f"Mock response from {self.name}"})()
 
-def make_llm(backend: str = None):
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages)
+
+    def stream(self, messages, **kwargs):
+        # Word-sized chunks so streaming consumers see more than one token
+        content = self.invoke(messages).content
+        for i, word in enumerate(content.split(" ")):
+            yield type('MockChunk', (), {'content': word if i == 0 else " " + word})()
+
+    async def astream(self, messages, **kwargs):
+        for chunk in self.stream(messages):
+            yield chunk
+
+def make_simulated(name: str, temperature: float = TEMPERATURE) -> SimulatedLLM:
+    """Create a SimulatedLLM configured from the SIM_* settings."""
+    return SimulatedLLM(
+        name, temperature, seed=SIM_SEED,
+        latency_ms=SIM_LATENCY_MS, latency_sigma=SIM_LATENCY_SIGMA,
+        tokens_per_second=SIM_TOKENS_PER_SECOND, error_rate=SIM_ERROR_RATE,
+        timeout_rate=SIM_TIMEOUT_RATE, timeout_s=SIM_TIMEOUT_S,
+    )
+
+def make_replay(name: str, temperature: float = TEMPERATURE) -> ReplayLLM:
+    """Create a ReplayLLM over REPLAY_TRACE_PATH configured from the REPLAY_* settings."""
+    if not REPLAY_TRACE_PATH or not os.path.exists(REPLAY_TRACE_PATH):
+        raise RuntimeError("REPLAY_TRACE_PATH must name a trace recorded with --record or TRACE_RECORD_PATH.")
+    # Prompts missing from the trace get simulated content (the delay comes from the trace)
+    fallback = SimulatedLLM(name, temperature, latency_ms=0, latency_sigma=0, tokens_per_second=0)
+    return ReplayLLM(open_trace(REPLAY_TRACE_PATH), name, temperature, REPLAY_SPEED, REPLAY_STRICT, fallback)
+
+_default_cache: Optional[LLMCache] = None
+
+def get_default_cache() -> LLMCache:
+    """Return the process-wide response cache configured from the environment."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMCache(
+            path=LLM_CACHE_PATH or None,
+            memory_size=LLM_CACHE_MEMORY_SIZE,
+            ttl=LLM_CACHE_TTL,
+            max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+        )
+    return _default_cache
+
+def _wrap(llm, backend: str, cache: Union[LLMCache, bool, None]):
+    """Layer rate limiting, deadlines and hedging, prompt coalescing, the
+    response cache and tracing around a backend model.
+
+    ``cache=None`` follows ENABLE_LLM_CACHE (offline backends are never cached
+    by default), ``False`` disables caching and an LLMCache instance is used as-is.
+    Rate limiting sits innermost so cache hits and coalesced duplicates cost
+    no budget, hedging below coalescing so a hedge is a real second request,
+    and tracing outermost so it sees cache hits and retries. While recording
+    (``--record`` or TRACE_RECORD_PATH) the model itself is wrapped, so the
+    trace holds real model latencies without queueing or backoff.
+    """
+    recorder = get_recorder() or (start_recording(TRACE_RECORD_PATH) if TRACE_RECORD_PATH else None)
+    if recorder is not None and backend != "replay":
+        llm = RecordingLLM(llm, recorder)
+    limiter = get_rate_limiter(model_id(llm), LLM_RPM, LLM_TPM)
+    llm = RateLimitedLLM(llm, limiter, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX)
+    llm = HedgedLLM(llm, ENABLE_HEDGING, HEDGE_MIN_DELAY_MS / 1000.0)
+    if ENABLE_COALESCING:
+        llm = CoalescingLLM(llm)
+    if cache is None:
+        cache = get_default_cache() if ENABLE_LLM_CACHE and backend not in OFFLINE_BACKENDS else False
+    if cache is not False:
+        llm = CachedLLM(llm, cache, LLM_CACHE_DISABLED_STAGES)
+    if ENABLE_TRACING:
+        llm = TracedLLM(llm)
+    return llm
+
+def make_llm(backend: str = None, cache: Union[LLMCache, bool, None] = None):
     """Create an LLM instance based on the specified backend."""
     if backend is None:
         backend = BACKEND
     
     backend = backend.lower()
-    
+    llm = _wrap(_make_llm(backend), backend, cache)
+    return _cascade(llm, llm, backend, cache)
+
+def _make_llm(backend: str):
     if backend == "fake":
-        return FakeLLM("fake", TEMPERATURE)
-    
-    if backend == "groq":
-        if ChatGroq is None:
-            raise RuntimeError("langchain-groq not installed. pip install langchain-groq")
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            raise RuntimeError("GROQ_API_KEY not set in environment or .env file.")
-        return ChatGroq(model=GROQ_MODEL, temperature=TEMPERATURE, api_key=groq_api_key)
-    
-    # Default fallback to groq
-    if ChatGroq is None:
-        raise RuntimeError("langchain-groq not installed. pip install langchain-groq")
-    groq_api_key = os.getenv("GROQ_API_KEY")
-    if not groq_api_key:
-        raise RuntimeError("GROQ_API_KEY not set in environment or .env file.")
-    return ChatGroq(model=GROQ_MODEL, temperature=TEMPERATURE, api_key=groq_api_key)
+        return get_client("fake", "fake", TEMPERATURE)
+    if backend == "sim":
+        return get_client("sim", "sim", TEMPERATURE)
+    if backend == "replay":
+        return get_client("replay", "replay", TEMPERATURE)
+    # groq, and the default for unknown backends
+    return get_client("groq", GROQ_MODEL, TEMPERATURE)
 
-def make_reasoner(backend: str = None):
+def make_reasoner(backend: str = None, cache: Union[LLMCache, bool, None] = None):
     """Create a reasoner LLM instance (can be different from the main LLM)."""
     if backend is None:
         backend = BACKEND
     
     backend = backend.lower()
-    
+    llm = _wrap(_make_reasoner(backend), backend, cache)
+    return _cascade(llm, None, backend, cache)
+
+def _make_reasoner(backend: str):
     if backend == "fake":
-        return FakeLLM("fake-reasoner", TEMPERATURE)
-    
-    if backend == "groq":
-        if ChatGroq is None:
-            raise RuntimeError("langchain-groq not installed. pip install langchain-groq")
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            raise RuntimeError("GROQ_API_KEY not set in environment or .env file.")
-        return ChatGroq(model=os.getenv("GROQ_REASONER_MODEL", GROQ_MODEL), temperature=TEMPERATURE, api_key=groq_api_key)
-    
-    # Default fallback to groq
-    if ChatGroq is None:
-        raise RuntimeError("langchain-groq not installed. pip install langchain-groq")
+        return get_client("fake", "fake-reasoner", TEMPERATURE)
+    if backend == "sim":
+        return get_client("sim", "sim-reasoner", TEMPERATURE)
+    if backend == "replay":
+        return get_client("replay", "replay-reasoner", TEMPERATURE)
+    return get_client("groq", os.getenv("GROQ_REASONER_MODEL", GROQ_MODEL), TEMPERATURE)
+
+def _cascade(llm, cheap, backend: str, cache: Union[LLMCache, bool, None]):
+    """Route CASCADE_STAGES through the perception model first, escalating to the reasoner.
+
+    ``llm`` keeps serving every other stage; ``cheap`` is passed when it is
+    already wrapped (make_llm), else it is built here. Without two distinct
+    models there is nothing to escalate to. FakeLLM output never validates,
+    so a cascade there would only double its calls.
+    """
+    if not CASCADE_STAGES or backend == "fake":
+        return llm
+    cheap_model, strong_model = _make_llm(backend), _make_reasoner(backend)
+    if model_id(cheap_model) == model_id(strong_model):
+        return llm
+    if cheap is None:
+        cheap, strong = _wrap(cheap_model, backend, cache), llm
+    else:
+        strong = _wrap(strong_model, backend, cache)
+    return CascadeLLM(llm, cheap, strong, CASCADE_STAGES)
+
+# Process-wide chat model clients keyed by (backend, model, temperature). Every
+# hosted client shares one keep-alive connection pool per process.
+_clients: Dict[Tuple[str, str, float], Any] = {}
+_http_pool: Optional["SharedHTTPPool"] = None
+_registry_lock = threading.Lock()
+
+def get_client(backend: str, model: str, temperature: float):
+    """Return the shared client for (backend, model, temperature), creating it once."""
+    key = (backend, model, temperature)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _new_client(backend, model, temperature)
+        return client
+
+def _new_client(backend: str, model: str, temperature: float):
+    if backend == "fake":
+        return FakeLLM(model, temperature)
+    if backend == "sim":
+        return make_simulated(model, temperature)
+    if backend == "replay":
+        return make_replay(model, temperature)
+
+    # Imported on first use: the LangChain stack is most of the startup cost
+    # and the offline backends never need it
+    try:
+        from langchain_groq import ChatGroq
+    except Exception:
+        raise RuntimeError("langchain-groq not installed. pip install langchain-groq") from None
     groq_api_key = os.getenv("GROQ_API_KEY")
     if not groq_api_key:
         raise RuntimeError("GROQ_API_KEY not set in environment or .env file.")
-    return ChatGroq(model=os.getenv("GROQ_REASONER_MODEL", GROQ_MODEL), temperature=TEMPERATURE, api_key=groq_api_key) 
\ No newline at end of file
+    pool = _shared_http_pool()
+    return ChatGroq(
+        model=model, temperature=temperature, api_key=groq_api_key,
+        base_url=os.getenv("GROQ_BASE_URL") or None,
+        max_retries=0,  # RateLimitedLLM owns retries and backoff
+        http_client=pool.client, http_async_client=pool.async_client,
+    )
+
+def _shared_http_pool():
+    """Create (once per process) the keep-alive HTTP pool behind hosted clients."""
+    global _http_pool
+    if _http_pool is None:
+        # httpx ships with the groq SDK, so it is only imported when groq is used
+        from core.http_pool import SharedHTTPPool
+        _http_pool = SharedHTTPPool(
+            LLM_POOL_MAX_CONNECTIONS, LLM_POOL_MAX_KEEPALIVE, LLM_POOL_KEEPALIVE_EXPIRY,
+            LLM_CONNECT_TIMEOUT, LLM_REQUEST_TIMEOUT,
+        )
+    return _http_pool
+
+def shutdown_clients() -> None:
+    """Close the shared connection pools and forget every registered client."""
+    global _http_pool
+    with _registry_lock:
+        pool, _http_pool = _http_pool, None
+        _clients.clear()
+    if pool is not None:
+        pool.close()
+
+def _reset_after_fork() -> None:
+    # The child inherits the parent's sockets: drop them without closing
+    # (a TLS close_notify would corrupt the parent's sessions) and start fresh
+    global _http_pool, _registry_lock
+    _http_pool = None
+    _clients.clear()
+    _registry_lock = threading.Lock()
+
+atexit.register(shutdown_clients)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -2,12 +2,15 @@
 Memory Management - Handles agent state and conversation history
 """
 
-from typing import TypedDict, List, Optional, Dict, Any
+from typing import TypedDict, List, Optional, Dict, Any, Tuple, Union
 
 class Memory(TypedDict, total=False):
     """Short-term memory for the multi-agent system."""
-    # Core messages (running transcript for traceability)
+    # Core messages (running transcript for traceability; agent entries
+    # reference the output fields below instead of copying them)
     messages: List[Dict[str, Any]]
+    # Earlier turns of the session (rolling summary plus recent turns)
+    context: Optional[str]
     # Perception layer outputs
     intent: Optional[str]
     entities: List[str]
@@ -17,12 +20,38 @@ class Memory(TypedDict, total=False):
     analysis: Optional[str]
     decision: Optional[str]
     # Control flags
-    step: Optional[str]  # orchestrator: research|analysis|decision|done
+    step: Optional[str]  # last completed stage: perception|research|analysis|decision
+    run_id: Optional[str]  # checkpoint key, set when the workflow has a checkpointer
+
+# Memory fields holding each stage's output, referenced by its transcript entry
+STAGE_OUTPUTS: Dict[str, Tuple[str, ...]] = {
+    "fast": ("intent", "entities", "normalized_question", "research_facts", "analysis", "decision"),
+    "perception": ("intent", "entities", "normalized_question"),
+    "answer_store": ("research_facts", "analysis", "decision"),
+    "answer_cache": ("research_facts", "analysis", "decision"),
+    "research": ("research_facts",),
+    "analysis": ("analysis",),
+    "decision": ("decision",),
+}
 
 def add_message(state: Memory, role: str, content: str) -> None:
     """Add a message to the conversation history."""
     state.setdefault("messages", []).append({"role": role, "content": content})
 
+def with_message(state: Memory, role: str, ref: Union[str, Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    """Return a copy of the conversation history with an entry for ``role``
+    that points at the Memory field(s) ``ref`` instead of copying them."""
+    return [*state.get("messages", []), {"role": role, "ref": ref}]
+
+def message_content(state: Memory, message: Dict[str, Any]) -> Any:
+    """The content of a transcript entry, resolving field references against ``state``."""
+    ref = message.get("ref")
+    if ref is None:
+        return message.get("content")
+    if isinstance(ref, str):
+        return state.get(ref)
+    return {key: state.get(key) for key in ref}
+
 def get_last_user_message(state: Memory) -> str:
     """Get the last user message from the conversation history."""
     msgs = state.get("messages", [])
@@ -31,10 +60,13 @@ def get_last_user_message(state: Memory) -> str:
             return str(m.get("content", ""))
     return ""
 
-def create_initial_state(question: str) -> Memory:
-    """Create initial memory state with user question."""
-    return {
+def create_initial_state(question: str, context: Optional[str] = None) -> Memory:
+    """Create initial memory state with user question (and the session context, if any)."""
+    state: Memory = {
         "messages": [{"role": "user", "content": question}],
         "entities": [],
         "research_facts": [],
-    } 
\ No newline at end of file
+    }
+    if context:
+        state["context"] = context
+    return state
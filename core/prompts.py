@@ -0,0 +1,69 @@
+"""
+Prompt Templates - Precompiled chat prompts that format without importing LangChain
+"""
+
+from string import Formatter
+from typing import Any, List, NamedTuple, Sequence, Tuple, Union
+
+# Role names as LangChain normalizes them, so formatted messages (and the
+# cache keys derived from them) match what ChatPromptTemplate produced
+ROLES = {"system": "system", "human": "human", "user": "human", "ai": "ai", "assistant": "ai"}
+
+class Message(NamedTuple):
+    """A (role, content) pair. Chat models accept it as a message tuple, and
+    it exposes ``type`` and ``content`` like a LangChain message."""
+    type: str
+    content: str
+
+# A compiled template: literal text, or (field name, conversion, format spec)
+Part = Union[str, Tuple[str, str, str]]
+
+class ChatPrompt:
+    """Drop-in replacement for ``ChatPromptTemplate.from_messages`` with
+    f-string templates.
+
+    Each template is parsed once, when the module defines it, so formatting
+    only joins strings. ``{{`` and ``}}`` escape braces, as in ``str.format``.
+    """
+    def __init__(self, messages: Sequence[Tuple[str, str]]):
+        self.messages = [(ROLES[role], _compile(template)) for role, template in messages]
+        self.input_variables = sorted({part[0] for _, parts in self.messages
+                                       for part in parts if not isinstance(part, str)})
+
+    @classmethod
+    def from_messages(cls, messages: Sequence[Tuple[str, str]]) -> "ChatPrompt":
+        return cls(messages)
+
+    def format_messages(self, **fields: Any) -> List[Message]:
+        missing = [name for name in self.input_variables if name not in fields]
+        if missing:
+            raise KeyError(f"Prompt is missing variables: {missing}")
+        return [Message(role, _render(parts, fields)) for role, parts in self.messages]
+
+def _compile(template: str) -> List[Part]:
+    parts: List[Part] = []
+    for literal, name, spec, conversion in Formatter().parse(template):
+        if literal:
+            parts.append(literal)
+        if name is not None:
+            if not name.isidentifier():
+                raise ValueError(f"Unsupported template field {{{name}}}")
+            parts.append((name, conversion or "", spec or ""))
+    return parts
+
+def _render(parts: List[Part], fields: Any) -> str:
+    out = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+            continue
+        name, conversion, spec = part
+        value = fields[name]
+        if conversion == "r":
+            value = repr(value)
+        elif conversion == "s":
+            value = str(value)
+        elif conversion == "a":
+            value = ascii(value)
+        out.append(value if type(value) is str and not spec else format(value, spec))
+    return "".join(out)
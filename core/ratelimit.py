@@ -0,0 +1,307 @@
+"""
+Rate Limiting - Token buckets for provider RPM/TPM limits, retries with
+jittered backoff, and an AIMD concurrency controller
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional
+
+from core.context import remaining
+from core.tokens import estimate_message_tokens, reported_usage
+from core.tracing import record_retry
+from core.wrappers import LLMWrapper
+
+# HTTP statuses worth retrying: throttling, conflicts and transient server errors
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+# SDK exceptions that carry no status code but are transient
+RETRYABLE_NAMES = frozenset({"APITimeoutError", "APIConnectionError", "ReadTimeout", "ConnectTimeout", "ConnectError"})
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate`` per second.
+
+    ``reserve`` always debits immediately and returns how long the caller
+    must wait, so concurrent callers queue up fairly and the balance may go
+    negative while reservations are outstanding.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens and return the seconds to wait before using them."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def adjust(self, amount: float) -> None:
+        """Credit (positive) or debit (negative) tokens after the fact."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one model (0 = unlimited)."""
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.requests = TokenBucket(rpm / 60.0, rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm / 60.0, tpm) if tpm > 0 else None
+
+    def reserve(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.reserve(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token bucket once the provider reports real usage."""
+        if self.tokens is not None and actual is not None:
+            self.tokens.adjust(estimated - actual)
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model: str, rpm: float, tpm: float) -> RateLimiter:
+    """Return the process-wide limiter for ``model`` so every agent shares its budget."""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limiter = _limiters[model] = RateLimiter(rpm, tpm)
+        return limiter
+
+def status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for throttling, timeouts and transient server or connection errors."""
+    if status_code(exc) in RETRYABLE_STATUS:
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__name__ in RETRYABLE_NAMES
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait (Retry-After header), if any."""
+    value = getattr(exc, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        parsed = email.utils.parsedate_to_datetime(str(value)) if value else None
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+def backoff_delay(attempt: int, base: float, cap: float, hint: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff; a Retry-After hint is a floor, plus a little jitter."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if hint is not None:
+        delay = hint + random.uniform(0, base)
+    return delay
+
+class AIMDController:
+    """Adaptive concurrency limit: additive increase, multiplicative decrease.
+
+    The limit grows by about one slot per window of ``limit`` successful
+    questions. It is multiplied by ``decrease`` when the provider throttles
+    us (429) or when smoothed question latency exceeds ``latency_tolerance``
+    times its best recent value. Decreases are spaced at least one baseline
+    latency apart so a single burst of 429s counts once.
+    """
+    def __init__(self, max_limit: int, min_limit: int = 1, initial: Optional[int] = None,
+                 decrease: float = 0.5, latency_tolerance: float = 2.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial if initial is not None else max_limit)
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.throttles = 0
+        self._baseline: Optional[float] = None
+        self._ewma: Optional[float] = None
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._cond: Optional[asyncio.Condition] = None
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.throttles += 1
+            self._decrease()
+
+    def on_success(self, latency: float) -> None:
+        with self._lock:
+            # Compare smoothed latency with its best recent value, so one slow
+            # question does not halve the limit
+            self._ewma = latency if self._ewma is None else self._ewma + 0.1 * (latency - self._ewma)
+            if self._baseline is None or self._ewma < self._baseline:
+                self._baseline = self._ewma
+            else:
+                # Let the baseline drift up slowly so it tracks the workload
+                self._baseline += 0.01 * (self._ewma - self._baseline)
+            if self._ewma > self._baseline * self.latency_tolerance:
+                self._decrease()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < (self._baseline or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of ``limit`` concurrent slots for a question, reporting its latency."""
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        token = _current_controller.set(self)
+        start = time.perf_counter()
+        throttles = self.throttles
+        try:
+            yield
+            if self.throttles == throttles:
+                self.on_success(time.perf_counter() - start)
+        finally:
+            _current_controller.reset(token)
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+_current_controller: ContextVar[Optional[AIMDController]] = ContextVar("current_controller", default=None)
+
+class RateLimitedLLM(LLMWrapper):
+    """Waits for rate-limit budget before each call and retries transient failures.
+
+    Throttled calls are reported to the AIMD controller of the question being
+    processed (see ``AIMDController.slot``). Streams are only retried before
+    their first chunk.
+    """
+    def __init__(self, llm, limiter: RateLimiter, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 completion_estimate: int = 256):
+        super().__init__(llm)
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.completion_estimate = completion_estimate
+
+    def _estimate(self, messages, kwargs) -> int:
+        return estimate_message_tokens(messages) + kwargs.get("max_tokens", self.completion_estimate)
+
+    def _reconcile(self, estimated: int, response: Any) -> None:
+        usage = reported_usage(response)
+        self.limiter.reconcile(estimated, sum(usage) if usage else None)
+
+    def _retry_delay(self, exc: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up."""
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        if status_code(exc) == 429:
+            controller = _current_controller.get()
+            if controller is not None:
+                controller.on_throttle()
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after(exc))
+        left = remaining()
+        if left is not None and delay >= left:
+            # The retry could not finish before the stage deadline
+            return None
+        record_retry()
+        return delay
+
+    def invoke(self, messages, **kwargs):
+        estimated = self._estimate(messages, kwargs)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                response = self.llm.invoke(messages, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._reconcile(estimated, response)
+            return response
+
+    async def ainvoke(self, messages, **kwargs):
+        estimated = self._estimate(messages, kwargs)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(estimated)
+            try:
+                response = await self.llm.ainvoke(messages, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._reconcile(estimated, response)
+            return response
+
+    def stream(self, messages, **kwargs):
+        estimated = self._estimate(messages, kwargs)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            started, last = False, None
+            try:
+                for chunk in self.llm.stream(messages, **kwargs):
+                    started, last = True, chunk
+                    yield chunk
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._reconcile(estimated, last)
+            return
+
+    async def astream(self, messages, **kwargs):
+        estimated = self._estimate(messages, kwargs)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(estimated)
+            started, last = False, None
+            try:
+                async for chunk in self.llm.astream(messages, **kwargs):
+                    started, last = True, chunk
+                    yield chunk
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._reconcile(estimated, last)
+            return
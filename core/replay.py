@@ -0,0 +1,312 @@
+"""
+Record/Replay - Captures LLM calls into a compact trace file and serves them back offline
+"""
+
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import statistics
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+from core.cache import cache_key
+from core.context import current_stage
+from core.tokens import reported_usage
+from core.tracing import record_replay
+from core.wrappers import LLMResponse, LLMWrapper, model_id
+
+# Trace file layout: MAGIC, then one record per call or workflow run:
+#   <u32 payload length> <u8 kind> <32-byte SHA-256 key> <zlib-compressed JSON payload>
+# Records are only ever appended. The key sits outside the compressed payload,
+# so a reader indexes a memory-mapped trace without decompressing anything.
+MAGIC = b"LLMTRACE\x01"
+RECORD = struct.Struct("<IB32s")
+KIND_CALL = 1  # {t, model, stage, ttft, latency, content, usage}; key = prompt digest
+KIND_RUN = 2   # {t, question}; key = question digest
+
+def prompt_digest(messages, kwargs: Optional[Dict[str, Any]] = None) -> bytes:
+    """Key of a call: the formatted messages and call params, not the model name,
+    so a trace recorded against any model replays under the replay backend."""
+    return bytes.fromhex(cache_key(messages, "", None, kwargs or None))
+
+class TraceWriter:
+    """Appends records to a trace file; safe to share between threads.
+
+    Each record goes out in a single ``O_APPEND`` write, so several processes
+    can record into the same file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._lock = threading.Lock()
+        with self._lock:
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, MAGIC)
+
+    def write(self, kind: int, key: bytes, payload: Dict[str, Any]) -> None:
+        blob = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            if self._fd is not None:
+                os.write(self._fd, RECORD.pack(len(blob), kind, key) + blob)
+
+    def record_call(self, messages, kwargs: Dict[str, Any], model: str, started: float,
+                    ttft: float, latency: float, content: str, response: Any) -> None:
+        usage = reported_usage(response)
+        self.write(KIND_CALL, prompt_digest(messages, kwargs), {
+            "t": started, "model": model, "stage": current_stage(), "ttft": round(ttft, 6),
+            "latency": round(latency, 6), "content": content,
+            "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1]} if usage else None,
+        })
+
+    def record_run(self, question: str) -> None:
+        self.write(KIND_RUN, hashlib.sha256(question.encode("utf-8")).digest(),
+                   {"t": time.time(), "question": question})
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+class Trace:
+    """Read-only, memory-mapped view of a trace file.
+
+    Opening scans the record headers only. Payloads are decompressed when a
+    call is served, so opening a large trace is cheap and every process
+    replaying it shares one copy through the page cache. A torn record at the
+    end (a recorder killed mid-write) is ignored.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an LLM trace file")
+        self._calls: Dict[bytes, List[int]] = {}
+        self._runs: List[int] = []
+        self._call_count = 0
+        pos, size = len(MAGIC), len(self._map)
+        while pos + RECORD.size <= size:
+            length, kind, key = RECORD.unpack_from(self._map, pos)
+            if pos + RECORD.size + length > size:
+                break
+            if kind == KIND_CALL:
+                self._calls.setdefault(key, []).append(pos)
+                self._call_count += 1
+            elif kind == KIND_RUN:
+                self._runs.append(pos)
+            pos += RECORD.size + length
+        self._latencies: Optional[Dict[Optional[str], float]] = None
+
+    def __len__(self) -> int:
+        return self._call_count
+
+    def _payload(self, pos: int) -> Dict[str, Any]:
+        length = RECORD.unpack_from(self._map, pos)[0]
+        start = pos + RECORD.size
+        return json.loads(zlib.decompress(self._map[start:start + length]))
+
+    def responses(self, key: bytes) -> List[int]:
+        """Positions of the recorded responses to the prompt ``key``, oldest first."""
+        return self._calls.get(key, [])
+
+    def call(self, pos: int) -> Dict[str, Any]:
+        return self._payload(pos)
+
+    def calls(self) -> Iterator[Dict[str, Any]]:
+        for positions in self._calls.values():
+            for pos in positions:
+                yield self._payload(pos)
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """Recorded workflow runs ({t, question}) in arrival order."""
+        return sorted((self._payload(pos) for pos in self._runs), key=lambda run: run["t"])
+
+    def median_latency(self, stage: Optional[str]) -> float:
+        """Median recorded latency of ``stage``'s calls (all calls when the stage has none)."""
+        if self._latencies is None:
+            by_stage: Dict[Optional[str], List[float]] = {}
+            for call in self.calls():
+                by_stage.setdefault(call.get("stage"), []).append(call["latency"])
+                by_stage.setdefault("*", []).append(call["latency"])
+            self._latencies = {s: statistics.median(v) for s, v in by_stage.items()}
+        return self._latencies.get(stage, self._latencies.get("*", 0.0))
+
+class ReplayMiss(KeyError):
+    """A prompt that the trace has no response for (strict replay only)."""
+
+class RecordingLLM(LLMWrapper):
+    """Records every successful call of the wrapped model into a TraceWriter."""
+    def __init__(self, llm, writer: TraceWriter):
+        super().__init__(llm)
+        self.writer = writer
+
+    def _record(self, messages, kwargs, started, ttft, latency, content, response) -> None:
+        self.writer.record_call(messages, kwargs, model_id(self.llm), started, ttft, latency, content, response)
+
+    def invoke(self, messages, **kwargs):
+        started, start = time.time(), time.perf_counter()
+        response = self.llm.invoke(messages, **kwargs)
+        latency = time.perf_counter() - start
+        self._record(messages, kwargs, started, latency, latency, getattr(response, "content", str(response)), response)
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        started, start = time.time(), time.perf_counter()
+        response = await self.llm.ainvoke(messages, **kwargs)
+        latency = time.perf_counter() - start
+        self._record(messages, kwargs, started, latency, latency, getattr(response, "content", str(response)), response)
+        return response
+
+    def stream(self, messages, **kwargs):
+        started, start = time.time(), time.perf_counter()
+        parts, ttft, last = [], None, None
+        for chunk in self.llm.stream(messages, **kwargs):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(getattr(chunk, "content", str(chunk)))
+            last = chunk
+            yield chunk
+        latency = time.perf_counter() - start
+        self._record(messages, kwargs, started, latency if ttft is None else ttft, latency, "".join(parts), last)
+
+    async def astream(self, messages, **kwargs):
+        started, start = time.time(), time.perf_counter()
+        parts, ttft, last = [], None, None
+        async for chunk in self.llm.astream(messages, **kwargs):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(getattr(chunk, "content", str(chunk)))
+            last = chunk
+            yield chunk
+        latency = time.perf_counter() - start
+        self._record(messages, kwargs, started, latency if ttft is None else ttft, latency, "".join(parts), last)
+
+class ReplayLLM:
+    """Chat model that answers from a recorded trace.
+
+    A prompt is looked up by ``prompt_digest``. When it was recorded several
+    times, the responses are served in recorded order, then cycled. Each
+    response takes its recorded latency divided by ``speed`` (1 = as
+    recorded, 0 = no waiting), and streams start after the recorded time to
+    first token. Prompts the trace lacks raise ReplayMiss when ``strict``.
+    Otherwise ``fallback`` (a SimulatedLLM) writes the content, delayed by
+    the median recorded latency of the current stage. Hits and misses are
+    counted in ``agent_replay_total``.
+    """
+    def __init__(self, trace: Trace, name: str = "replay", temperature: float = 0.0,
+                 speed: float = 1.0, strict: bool = False, fallback=None):
+        self.trace = trace
+        self.name = name
+        self.temperature = temperature
+        self.speed = speed
+        self.strict = strict
+        self.fallback = fallback
+        self._served: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, messages, kwargs) -> Dict[str, Any]:
+        """The recorded call answering ``messages`` (or a synthesized one on a miss)."""
+        key = prompt_digest(messages, kwargs)
+        positions = self.trace.responses(key)
+        record_replay(bool(positions))
+        if positions:
+            with self._lock:
+                i = self._served.get(key, 0)
+                self._served[key] = i + 1
+            return self.trace.call(positions[i % len(positions)])
+        if self.strict or self.fallback is None:
+            raise ReplayMiss(f"{self.name}: prompt {key.hex()[:12]} is not in {self.trace.path}")
+        latency = self.trace.median_latency(current_stage())
+        content = getattr(self.fallback.invoke(messages, **kwargs), "content", "")
+        return {"ttft": latency, "latency": latency, "content": content, "usage": None}
+
+    def _delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed > 0 else 0.0
+
+    @staticmethod
+    def _response(call: Dict[str, Any], content: str, final: bool = True) -> LLMResponse:
+        if final and call.get("usage"):
+            return LLMResponse(content, token_usage=call["usage"])
+        return LLMResponse(content)
+
+    @staticmethod
+    def _chunks(content: str) -> List[str]:
+        words = content.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def invoke(self, messages, **kwargs):
+        call = self._lookup(messages, kwargs)
+        time.sleep(self._delay(call["latency"]))
+        return self._response(call, call["content"])
+
+    async def ainvoke(self, messages, **kwargs):
+        call = self._lookup(messages, kwargs)
+        await asyncio.sleep(self._delay(call["latency"]))
+        return self._response(call, call["content"])
+
+    def stream(self, messages, **kwargs):
+        call = self._lookup(messages, kwargs)
+        chunks = self._chunks(call["content"])
+        gap = self._delay(max(0.0, call["latency"] - call["ttft"])) / max(1, len(chunks) - 1)
+        time.sleep(self._delay(call["ttft"]))
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(gap)
+            yield self._response(call, chunk, i == len(chunks) - 1)
+
+    async def astream(self, messages, **kwargs):
+        call = self._lookup(messages, kwargs)
+        chunks = self._chunks(call["content"])
+        gap = self._delay(max(0.0, call["latency"] - call["ttft"])) / max(1, len(chunks) - 1)
+        await asyncio.sleep(self._delay(call["ttft"]))
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(gap)
+            yield self._response(call, chunk, i == len(chunks) - 1)
+
+# The process-wide recorder (None when not recording) and the traces opened for replay
+_recorder: Optional[TraceWriter] = None
+_traces: Dict[str, Trace] = {}
+_lock = threading.Lock()
+
+def start_recording(path: str) -> TraceWriter:
+    """Record every LLM client created from now on (and every workflow run) into ``path``."""
+    global _recorder
+    with _lock:
+        if _recorder is None or _recorder.path != path:
+            if _recorder is not None:
+                _recorder.close()
+            _recorder = TraceWriter(path)
+        return _recorder
+
+def stop_recording() -> None:
+    global _recorder
+    with _lock:
+        recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+
+def get_recorder() -> Optional[TraceWriter]:
+    return _recorder
+
+def record_run(question: str) -> None:
+    """Note a workflow run's arrival in the trace being recorded, if any."""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record_run(question)
+
+def open_trace(path: str) -> Trace:
+    """The shared Trace for ``path``, opened (and indexed) once per process."""
+    with _lock:
+        trace = _traces.get(path)
+        if trace is None:
+            trace = _traces[path] = Trace(path)
+        return trace
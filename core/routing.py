@@ -0,0 +1,273 @@
+"""
+Request Routing - Deadlines, hedged requests and cheap-to-strong model cascades
+"""
+
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from core.context import DeadlineExceeded, check_deadline, current_stage, remaining
+from core.json_stream import FactStreamParser
+from core.tracing import record_routing
+from core.wrappers import LLMWrapper, model_id
+from config import HEDGE_POOL_SIZE
+
+class LatencyTracker:
+    """Sliding window of recent call latencies per (model, stage).
+
+    ``quantile`` stays None until ``min_samples`` calls were seen, so nothing
+    is hedged on too little data.
+    """
+    def __init__(self, window: int = 200, min_samples: int = 20, q: float = 0.95):
+        self.window = window
+        self.min_samples = min_samples
+        self.q = q
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._cached: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: Tuple[str, str], seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._cached.pop(key, None)
+
+    def quantile(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            value = self._cached.get(key)
+            if value is not None:
+                return value
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+            value = self._cached[key] = ordered[min(len(ordered) - 1, int(self.q * len(ordered)))]
+            return value
+
+# Shared by every HedgedLLM so make_llm and make_reasoner learn from the same calls
+latency_tracker = LatencyTracker()
+
+# Worker threads for sync calls (and stream chunks) that need a timeout or a hedge
+_executor = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix="llm-hedge")
+
+# Returned by next() in a worker once a stream is exhausted
+_END = object()
+
+def _wait_timeout(hedge_at: Optional[float]) -> Optional[float]:
+    """Seconds until the hedge is due or the deadline passes, whichever is first."""
+    timeouts = [t for t in (remaining(), hedge_at and hedge_at - time.monotonic()) if t is not None]
+    return max(0.0, min(timeouts)) if timeouts else None
+
+class HedgedLLM(LLMWrapper):
+    """Enforces the active deadline and hedges calls that run unusually long.
+
+    Once ``tracker`` has enough latencies for the model and stage, a call
+    still running after the observed p95 (at least ``min_delay`` seconds)
+    gets one duplicate request and the first response wins. Async losers are
+    cancelled; a sync loser finishes in its worker thread and is ignored.
+    Failures are not hedged (RateLimitedLLM retries them). Streams are not
+    hedged either, but each chunk must arrive before the deadline.
+
+    Sync calls run in a shared worker pool so the caller can stop waiting.
+    The hedge timer starts when the call gets a worker, so time spent queued
+    for the pool never triggers a hedge (it still counts against the
+    deadline).
+    """
+    def __init__(self, llm, hedge: bool = True, min_delay: float = 0.05,
+                 tracker: LatencyTracker = latency_tracker):
+        super().__init__(llm)
+        self.hedge = hedge
+        self.min_delay = min_delay
+        self.tracker = tracker
+
+    def _plan(self) -> Tuple[Tuple[str, str], Optional[float]]:
+        """(latency key, seconds to wait before hedging or None) for a call starting now."""
+        key = (model_id(self.llm), current_stage() or "unscoped")
+        delay = self.tracker.quantile(key) if self.hedge else None
+        return key, max(delay, self.min_delay) if delay is not None else None
+
+    def _timed(self, key, messages, kwargs, started: Optional[Dict[str, float]] = None):
+        start = time.perf_counter()
+        if started is not None:
+            started["at"] = time.monotonic()
+        response = self.llm.invoke(messages, **kwargs)
+        self.tracker.observe(key, time.perf_counter() - start)
+        return response
+
+    async def _atimed(self, key, messages, kwargs):
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(messages, **kwargs)
+        self.tracker.observe(key, time.perf_counter() - start)
+        return response
+
+    def invoke(self, messages, **kwargs):
+        key, delay = self._plan()
+        if delay is None and remaining() is None:
+            return self._timed(key, messages, kwargs)
+        check_deadline()
+
+        def submit(started=None):
+            return _executor.submit(contextvars.copy_context().run, self._timed, key, messages, kwargs, started)
+
+        started: Dict[str, float] = {}
+        primary = submit(started)
+        pending, error = {primary}, None
+        while pending:
+            hedge_at = started["at"] + delay if delay is not None and "at" in started else None
+            timeout = _wait_timeout(hedge_at)
+            if delay is not None and hedge_at is None:
+                # Still queued for a worker: check again once a hedge could be due
+                timeout = delay if timeout is None else min(timeout, delay)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        record_routing("hedge_won")
+                    return future.result()
+                error = future.exception()
+            if done:
+                continue
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                delay = None
+                record_routing("hedge")
+                pending.add(submit())
+            elif remaining() is not None and remaining() <= 0:
+                record_routing("deadline")
+                raise DeadlineExceeded(f"{key[1]} exceeded its deadline")
+        raise error
+
+    async def ainvoke(self, messages, **kwargs):
+        key, delay = self._plan()
+        if delay is None and remaining() is None:
+            return await self._atimed(key, messages, kwargs)
+        check_deadline()
+        hedge_at = time.monotonic() + delay if delay is not None else None
+
+        primary = asyncio.ensure_future(self._atimed(key, messages, kwargs))
+        pending, error = {primary}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=_wait_timeout(hedge_at),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            record_routing("hedge_won")
+                        return task.result()
+                    error = task.exception()
+                if done:
+                    continue
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    record_routing("hedge")
+                    pending.add(asyncio.ensure_future(self._atimed(key, messages, kwargs)))
+                elif remaining() is not None and remaining() <= 0:
+                    record_routing("deadline")
+                    raise DeadlineExceeded(f"{key[1]} exceeded its deadline")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stream(self, messages, **kwargs):
+        check_deadline()
+        chunks = iter(self.llm.stream(messages, **kwargs))
+        if remaining() is None:
+            yield from chunks
+            return
+        # Pull each chunk in a worker so a stalled stream cannot outlive the deadline
+        context = contextvars.copy_context()
+        while True:
+            future = _executor.submit(context.run, next, chunks, _END)
+            try:
+                chunk = future.result(timeout=max(0.0, remaining()))
+            except FutureTimeout:
+                record_routing("deadline")
+                raise DeadlineExceeded(f"{current_stage() or 'workflow'} exceeded its deadline") from None
+            if chunk is _END:
+                return
+            yield chunk
+
+    async def astream(self, messages, **kwargs):
+        check_deadline()
+        chunks = self.llm.astream(messages, **kwargs).__aiter__()
+        while True:
+            left = remaining()
+            try:
+                if left is None:
+                    chunk = await chunks.__anext__()
+                else:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, left))
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                record_routing("deadline")
+                raise DeadlineExceeded(f"{current_stage() or 'workflow'} exceeded its deadline") from None
+            yield chunk
+
+def valid_json_object(content: str) -> bool:
+    """Perception output must be a JSON object with an intent."""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and bool(data.get("intent"))
+
+def valid_fact_list(content: str) -> bool:
+    """Research output must contain a complete, non-empty JSON array."""
+    parser = FactStreamParser()
+    return bool(parser.feed(content)) and parser.done
+
+# Stages that can cascade, and how their output is checked before it is accepted
+STAGE_VALIDATORS: Dict[str, Callable[[str], bool]] = {
+    "perception": valid_json_object,
+    "research": valid_fact_list,
+}
+
+class CascadeLLM(LLMWrapper):
+    """Tries ``cheap`` first for cascade stages, escalating to ``strong`` on invalid output.
+
+    Every other stage, and every stream, goes to ``llm`` unchanged. Each tier
+    is a fully wrapped model, so both calls are cached, limited and traced
+    separately.
+    """
+    def __init__(self, llm, cheap, strong, stages: Iterable[str]):
+        super().__init__(llm)
+        unknown = set(stages) - set(STAGE_VALIDATORS)
+        if unknown:
+            raise ValueError(f"No cascade validator for stages: {sorted(unknown)}")
+        self.cheap = cheap
+        self.strong = strong
+        self.validators = {stage: STAGE_VALIDATORS[stage] for stage in stages}
+
+    def invoke(self, messages, **kwargs):
+        validator = self.validators.get(current_stage())
+        if validator is None:
+            return self.llm.invoke(messages, **kwargs)
+        response = self.cheap.invoke(messages, **kwargs)
+        if self._accept(validator, response):
+            return response
+        return self.strong.invoke(messages, **kwargs)
+
+    async def ainvoke(self, messages, **kwargs):
+        validator = self.validators.get(current_stage())
+        if validator is None:
+            return await self.llm.ainvoke(messages, **kwargs)
+        response = await self.cheap.ainvoke(messages, **kwargs)
+        if self._accept(validator, response):
+            return response
+        return await self.strong.ainvoke(messages, **kwargs)
+
+    @staticmethod
+    def _accept(validator: Callable[[str], bool], response: Any) -> bool:
+        accepted = validator(getattr(response, "content", str(response)))
+        record_routing("cascade_accepted" if accepted else "cascade_escalated")
+        return accepted
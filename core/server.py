@@ -0,0 +1,313 @@
+"""
+HTTP Service - Async JSON and Server-Sent Events API over one long-lived workflow
+"""
+
+import asyncio
+import json
+import time
+from contextlib import aclosing, contextmanager
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from core.batch import RESULT_KEYS
+from core.context import DeadlineExceeded
+from core.tracing import metrics, record_http_request
+
+# Largest request body accepted (a /batch of a few hundred questions fits easily)
+MAX_BODY_BYTES = 1 << 20
+
+# Seconds a rejected client is asked to wait before retrying
+RETRY_AFTER_S = 1
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+# Path -> (method, handler name)
+ROUTES = {
+    "/recommend": ("POST", "_recommend"),
+    "/batch": ("POST", "_batch"),
+    "/metrics": ("GET", "_metrics"),
+    "/health": ("GET", "_health"),
+}
+
+class HTTPError(Exception):
+    """Aborts a request with ``status`` and a JSON ``{"error": message}`` body."""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class Request:
+    """One parsed HTTP/1.1 request."""
+    __slots__ = ("method", "path", "headers", "body")
+
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self) -> Dict[str, Any]:
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON") from None
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+        return payload
+
+def result_record(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The public fields of a finished workflow Memory."""
+    record = {key: state.get(key) for key in RESULT_KEYS}
+    if state.get("run_id"):
+        record["run_id"] = state["run_id"]
+    return record
+
+class WorkflowServer:
+    """Serves one shared ``MultiAgentWorkflow`` over HTTP/1.1 with keep-alive.
+
+    Endpoints: ``POST /recommend`` (JSON, or an SSE stream of workflow
+    events with ``"stream": true``, ``?stream=1`` or
+    ``Accept: text/event-stream``),
+    ``POST /batch``, ``GET /metrics`` (Prometheus text) and ``GET /health``.
+    At most ``concurrency`` questions run at once and ``queue_size`` more may
+    wait for a slot; anything beyond that is rejected with 503 and
+    Retry-After, so overload shows up as fast rejections instead of
+    unbounded queueing latency.
+    """
+    def __init__(self, workflow, concurrency: int = 32, queue_size: int = 64, max_batch: int = 64):
+        self.workflow = workflow
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.admitted = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+
+    @property
+    def capacity(self) -> int:
+        return self.concurrency + self.queue_size
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> "WorkflowServer":
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def serve_forever(self) -> None:
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """Stop listening and drop open connections, including idle keep-alive ones."""
+        self._server.close()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    # --- admission ----------------------------------------------------------
+
+    @contextmanager
+    def _admit(self, n: int = 1) -> Iterator[None]:
+        """Reserve ``n`` places among running and queued questions, or reject with 503."""
+        if self.admitted + n > self.capacity:
+            raise HTTPError(503, "Server busy; retry later")
+        self.admitted += n
+        try:
+            yield
+        finally:
+            self.admitted -= n
+
+    async def _answer(self, question: str) -> Dict[str, Any]:
+        async with self._slots:
+            return await self.workflow.arun(question, verbose=False)
+
+    # --- connection handling ------------------------------------------------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await _read_request(reader)
+                except HTTPError as e:
+                    _write(writer, e.status, _json_body({"error": str(e)}), keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self._dispatch(request, writer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        """Answer one request; returns whether the connection stays open."""
+        start = time.perf_counter()
+        status = 200
+        try:
+            route = self._route(request)
+            if route == self._recommend and _wants_stream(request):
+                return await self._stream(request, writer)
+            status, body, content_type = await route(request)
+        except HTTPError as e:
+            status, body, content_type = e.status, _json_body({"error": str(e)}), "application/json"
+        except DeadlineExceeded as e:
+            status, body, content_type = 504, _json_body({"error": str(e)}), "application/json"
+        except Exception as e:
+            status, body, content_type = 500, _json_body({"error": f"{type(e).__name__}: {e}"}), "application/json"
+        finally:
+            route_path = _route_path(request)
+            record_http_request(route_path if route_path in ROUTES else "unmatched", status,
+                                time.perf_counter() - start)
+        extra = {"Retry-After": str(RETRY_AFTER_S)} if status == 503 else None
+        _write(writer, status, body, content_type, request.keep_alive, extra)
+        return request.keep_alive
+
+    def _route(self, request: Request):
+        entry = ROUTES.get(_route_path(request))
+        if entry is None:
+            raise HTTPError(404, f"No route for {request.path}")
+        if request.method != entry[0]:
+            raise HTTPError(405, f"{request.path} expects {entry[0]}")
+        return getattr(self, entry[1])
+
+    # --- endpoints ----------------------------------------------------------
+
+    async def _recommend(self, request: Request) -> Tuple[int, bytes, str]:
+        question = _question(request.json())
+        with self._admit():
+            state = await self._answer(question)
+        return 200, _json_body(result_record(state)), "application/json"
+
+    async def _stream(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        """Send the workflow events as Server-Sent Events, then close the connection."""
+        question = _question(request.json())
+        with self._admit():
+            writer.write(_head(200, "text/event-stream", None, False, {"Cache-Control": "no-cache"}))
+            async with self._slots:
+                try:
+                    async with aclosing(self.workflow.astream(question)) as events:
+                        async for event in events:
+                            writer.write(_sse(event["type"], _event_payload(event)))
+                            await writer.drain()
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    writer.write(_sse("error", {"error": f"{type(e).__name__}: {e}"}))
+        return False
+
+    async def _batch(self, request: Request) -> Tuple[int, bytes, str]:
+        payload = request.json()
+        items = payload.get("items")
+        if items is None:
+            items = [{"id": str(i), "question": q} for i, q in enumerate(payload.get("questions") or [], 1)]
+        if not isinstance(items, list) or not items:
+            raise HTTPError(400, "Expected a non-empty 'items' or 'questions' list")
+        if len(items) > self.max_batch:
+            raise HTTPError(413, f"At most {self.max_batch} questions per batch")
+        items = [{"id": str(item.get("id", i)), "question": _question(item)} if isinstance(item, dict)
+                 else {"id": str(i), "question": _question({"question": item})}
+                 for i, item in enumerate(items, 1)]
+
+        async def one(item: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                return dict(item, **result_record(await self._answer(item["question"])))
+            except Exception as e:
+                return dict(item, error=f"{type(e).__name__}: {e}")
+
+        with self._admit(len(items)):
+            results = await asyncio.gather(*(one(item) for item in items))
+        return 200, _json_body({"results": results}), "application/json"
+
+    async def _metrics(self, request: Request) -> Tuple[int, bytes, str]:
+        return 200, metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+
+    async def _health(self, request: Request) -> Tuple[int, bytes, str]:
+        return 200, _json_body({
+            "status": "ok", "in_flight": self.admitted,
+            "concurrency": self.concurrency, "capacity": self.capacity,
+        }), "application/json"
+
+def _route_path(request: Request) -> str:
+    return request.path.split("?", 1)[0]
+
+def _question(payload: Dict[str, Any]) -> str:
+    question = payload.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise HTTPError(400, "Missing 'question'")
+    return question.strip()
+
+def _wants_stream(request: Request) -> bool:
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return True
+    query = parse_qs(urlsplit(request.path).query)
+    if query.get("stream", ["0"])[0].lower() in ("1", "true"):
+        return True
+    try:
+        return bool(request.json().get("stream"))
+    except HTTPError:
+        return False
+
+def _event_payload(event: Dict[str, Any]) -> Dict[str, Any]:
+    if event["type"] == "workflow_finished":
+        return {"type": event["type"], "data": result_record(event["data"])}
+    return dict(event)
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Parse the next request on the connection; None once the client is done."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line") from None
+    headers: Dict[str, str] = {}
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(400, "Bad Content-Length") from None
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target, headers, body)
+
+def _json_body(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+
+def _sse(event: str, payload: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n".encode("utf-8")
+
+def _head(status: int, content_type: str, length: Optional[int], keep_alive: bool,
+          extra: Optional[Dict[str, str]] = None) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}", f"Content-Type: {content_type}"]
+    if length is not None:
+        lines.append(f"Content-Length: {length}")
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    lines.extend(f"{name}: {value}" for name, value in (extra or {}).items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+def _write(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str = "application/json",
+           keep_alive: bool = True, extra: Optional[Dict[str, str]] = None) -> None:
+    writer.write(_head(status, content_type, len(body), keep_alive, extra) + body)
@@ -0,0 +1,107 @@
+"""
+Conversation Sessions - Bounded multi-turn history with a rolling summary
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+from core.budget import truncate_to_budget
+from core.context import stage_scope
+from core.tokens import estimate_tokens
+from core.tracing import record_fallback, span
+from agents.summarizer import summarize_turns, asummarize_turns
+from config import SESSION_HISTORY_BUDGET, SESSION_SUMMARY_BUDGET
+
+class Session:
+    """Conversation state carried across ``MultiAgentWorkflow.run`` calls.
+
+    Each finished run is kept as one compact turn (the normalized question
+    and the decision cut to a quarter of ``budget``), not its whole Memory.
+    Once the turns exceed ``budget`` tokens, the oldest are folded into a
+    rolling summary of at most ``summary_budget`` tokens. Folding takes one
+    ``llm`` call, or with no ``llm`` the summary keeps one line per turn and
+    drops the oldest lines. ``context()`` is therefore bounded by
+    ``budget + summary_budget`` however long the session runs.
+    """
+    def __init__(self, llm=None, budget: int = SESSION_HISTORY_BUDGET,
+                 summary_budget: int = SESSION_SUMMARY_BUDGET):
+        self.llm = llm
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.summary = ""
+        self.turns: Deque[Dict[str, Any]] = deque()
+        self.turn_count = 0
+
+    def context(self) -> str:
+        """The session so far, for the next question's perception prompt ("" when empty)."""
+        parts = [f"Summary: {self.summary}"] if self.summary else []
+        parts.extend(_render(turn) for turn in self.turns)
+        return "\n".join(parts)
+
+    def record(self, state: Dict[str, Any]) -> None:
+        """Add a finished run as the latest turn, folding older turns into the summary."""
+        folded = self._add(state)
+        if folded:
+            self.summary = self._fold(folded)
+
+    async def arecord(self, state: Dict[str, Any]) -> None:
+        """Async version of record."""
+        folded = self._add(state)
+        if folded:
+            self.summary = await self._afold(folded)
+
+    def reset(self) -> None:
+        self.summary = ""
+        self.turns.clear()
+        self.turn_count = 0
+
+    def _add(self, state: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Append the turn; return the oldest turns that no longer fit the budget."""
+        question = state.get("normalized_question") or next(
+            (m.get("content") for m in state.get("messages", []) if m.get("role") == "user"), "")
+        self.turns.append({
+            "question": question,
+            "answer": truncate_to_budget(" ".join(str(state.get("decision") or "").split()), self.budget // 4),
+        })
+        self.turn_count += 1
+        folded = []
+        # The latest turn always stays verbatim so a follow-up can refer to it
+        while len(self.turns) > 1 and sum(estimate_tokens(_render(t)) for t in self.turns) > self.budget:
+            folded.append(self.turns.popleft())
+        return folded
+
+    def _fold(self, turns: List[Dict[str, Any]]) -> str:
+        if self.llm is None:
+            return self._extractive(turns)
+        with stage_scope("summary"), span("summary"):
+            try:
+                return summarize_turns(self.summary, "\n".join(map(_render, turns)), self.llm, self.summary_budget)
+            except Exception:
+                record_fallback("session_summary")
+                return self._extractive(turns)
+
+    async def _afold(self, turns: List[Dict[str, Any]]) -> str:
+        if self.llm is None:
+            return self._extractive(turns)
+        with stage_scope("summary"), span("summary"):
+            try:
+                return await asummarize_turns(self.summary, "\n".join(map(_render, turns)), self.llm,
+                                              self.summary_budget)
+            except Exception:
+                record_fallback("session_summary")
+                return self._extractive(turns)
+
+    def _extractive(self, turns: List[Dict[str, Any]]) -> str:
+        """One line per turn; the oldest lines go first when over budget."""
+        lines = [line for line in self.summary.split("\n") if line]
+        lines.extend(f"{turn['question']} -> {_first_sentence(turn['answer'])}" for turn in turns)
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        return truncate_to_budget("\n".join(lines), self.summary_budget)
+
+def _render(turn: Dict[str, Any]) -> str:
+    return f"User: {turn['question']}\nAssistant: {turn['answer']}"
+
+def _first_sentence(text: str) -> str:
+    end = text.find(". ")
+    return text if end < 0 else text[:end + 1]
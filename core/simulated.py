@@ -0,0 +1,223 @@
+"""
+Simulated LLM - Offline backend with realistic latency, streaming and failures
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.wrappers import LLMResponse
+
+# Median completion length (tokens) per prompt type; actual lengths vary +-50%
+OUTPUT_TOKENS = {
+    "perception": 30,
+    "research": 90,
+    "analysis": 220,
+    "decision": 140,
+    "fused": 420,
+    "orchestrator": 2,
+    "generic": 80,
+}
+
+# Prompt types recognised from the opening words of the system message
+_PROMPT_MARKERS = (
+    ("You are Perception", "perception"),
+    ("You are Research.", "research"),
+    ("You are Analysis", "analysis"),
+    ("You are Decision", "decision"),
+    ("You are the Orchestrator", "orchestrator"),
+    ("answers in one pass", "fused"),
+)
+
+_FILLER = (
+    "latency throughput tradeoff ecosystem performance memory battery thermals workload "
+    "maintenance community documentation tooling deployment scaling typing async ORM "
+    "portability budget reliability support learning curve benchmarks"
+).split()
+
+_ENTITY_RE = re.compile(r"\b(?:[A-Z][\w+#.-]*)(?:\s+[A-Z][\w+#.-]*)*")
+_QUESTION_WORDS = {"What", "Which", "How", "Should", "Why", "Compare", "Is", "Are", "Can", "Do", "Does", "I"}
+
+class SimulatedLLMError(RuntimeError):
+    """An injected provider error; ``status_code`` mimics the HTTP status."""
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+class SimulatedTimeout(TimeoutError):
+    """An injected request timeout."""
+
+def _message_text(message: Any) -> Tuple[str, str]:
+    if isinstance(message, tuple):
+        return message[0], str(message[1])
+    return getattr(message, "type", ""), str(getattr(message, "content", message))
+
+def _extract_question(human: str) -> str:
+    match = re.search(r"Question:\s*(.+)", human)
+    return (match.group(1) if match else human).strip()
+
+def _extract_entities(question: str) -> List[str]:
+    entities = []
+    for match in _ENTITY_RE.finditer(question):
+        words = [w for w in match.group(0).split() if w not in _QUESTION_WORDS]
+        if words and " ".join(words) not in entities:
+            entities.append(" ".join(words))
+    return entities
+
+def _intent(question: str) -> str:
+    q = question.lower()
+    if " vs " in q or "compare" in q or " or " in q:
+        return "compare"
+    if "best" in q or "should" in q or "recommend" in q:
+        return "recommend"
+    if q.startswith(("how", "why", "explain")):
+        return "explain"
+    return "factual"
+
+class SimulatedLLM:
+    """Stand-in chat model for load tests and benchmarks.
+
+    Time to first token is drawn from a log-normal distribution around
+    ``latency_ms`` and output is produced at ``tokens_per_second``. Errors
+    and timeouts are injected at the given rates. Perception, research and
+    fused prompts get well-formed JSON, so the parsers take their normal
+    path. Latency and failures come from a ``seed``-ed RNG. Content is a
+    pure function of the seed and the prompt, which keeps caches and
+    replays meaningful.
+    """
+    def __init__(self, name: str = "sim", temperature: float = 0.0, seed: int = 0,
+                 latency_ms: float = 300.0, latency_sigma: float = 0.5,
+                 tokens_per_second: float = 200.0, error_rate: float = 0.0,
+                 timeout_rate: float = 0.0, timeout_s: float = 30.0):
+        self.name = name
+        self.temperature = temperature
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_s = timeout_s
+        # Seeded per name so the perception and reasoner clients draw different latencies
+        self._rng = random.Random(f"{seed}:{name}")
+        self._lock = threading.Lock()
+
+    # --- sampling -----------------------------------------------------------
+
+    def _sample(self) -> Tuple[float, Optional[Exception]]:
+        """Draw (time to first token in seconds, injected failure or None)."""
+        with self._lock:
+            ttft = self.latency_ms / 1000.0 * self._rng.lognormvariate(0.0, self.latency_sigma) if self.latency_ms > 0 else 0.0
+            roll = self._rng.random()
+        if roll < self.timeout_rate:
+            return self.timeout_s, SimulatedTimeout(f"{self.name}: request timed out after {self.timeout_s:g}s")
+        if roll < self.timeout_rate + self.error_rate:
+            return ttft, SimulatedLLMError(f"{self.name}: service unavailable")
+        return ttft, None
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    # --- content ------------------------------------------------------------
+
+    def _respond(self, messages) -> Tuple[str, int]:
+        """Return (completion text, prompt token estimate) for ``messages``."""
+        parts = [_message_text(m) for m in messages]
+        system = next((text for role, text in parts if role == "system"), "")
+        human = next((text for role, text in reversed(parts) if role in ("human", "user")), parts[-1][1] if parts else "")
+        kind = next((k for marker, k in _PROMPT_MARKERS if marker in system), "generic")
+
+        digest = hashlib.sha256(f"{self.seed}\0{self.name}\0{system}\0{human}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        question = _extract_question(human)
+        entities = _extract_entities(question)
+        prompt_tokens = sum(len(text) for _, text in parts) // 4 + 4 * len(parts)
+
+        def prose(tokens: int) -> str:
+            n = max(1, int(tokens * rng.uniform(0.5, 1.5)))
+            subject = " and ".join(entities) or "this option"
+            words = [subject + ":"] + [rng.choice(_FILLER) for _ in range(n)]
+            return " ".join(words) + "."
+
+        def facts() -> List[str]:
+            subjects = entities or ["The main option"]
+            return [f"{rng.choice(subjects)} offers strong {rng.choice(_FILLER)} with good {rng.choice(_FILLER)}."
+                    for _ in range(rng.randint(3, 6))]
+
+        if kind == "perception":
+            content = json.dumps({"intent": _intent(question), "entities": entities,
+                                  "normalized_question": question.rstrip("?").strip()})
+        elif kind == "research":
+            content = json.dumps(facts())
+        elif kind == "fused":
+            content = json.dumps({
+                "intent": _intent(question), "entities": entities,
+                "normalized_question": question.rstrip("?").strip(), "facts": facts(),
+                "analysis": prose(OUTPUT_TOKENS["analysis"]), "decision": prose(OUTPUT_TOKENS["decision"]),
+            })
+        elif kind == "orchestrator":
+            content = "decision"
+        else:
+            content = prose(OUTPUT_TOKENS[kind])
+        return content, prompt_tokens
+
+    @staticmethod
+    def _usage(prompt_tokens: int, content: str) -> Dict[str, Any]:
+        return {"token_usage": {"prompt_tokens": prompt_tokens, "completion_tokens": -(-len(content) // 4)}}
+
+    @staticmethod
+    def _chunks(content: str) -> List[str]:
+        words = content.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    # --- chat model interface -----------------------------------------------
+
+    def invoke(self, messages, **kwargs):
+        ttft, failure = self._sample()
+        content, prompt_tokens = self._respond(messages)
+        if failure is not None:
+            time.sleep(ttft)
+            raise failure
+        chunks = self._chunks(content)
+        time.sleep(ttft + len(chunks) * self._token_delay())
+        return LLMResponse(content, **self._usage(prompt_tokens, content))
+
+    async def ainvoke(self, messages, **kwargs):
+        ttft, failure = self._sample()
+        content, prompt_tokens = self._respond(messages)
+        if failure is not None:
+            await asyncio.sleep(ttft)
+            raise failure
+        chunks = self._chunks(content)
+        await asyncio.sleep(ttft + len(chunks) * self._token_delay())
+        return LLMResponse(content, **self._usage(prompt_tokens, content))
+
+    def stream(self, messages, **kwargs):
+        ttft, failure = self._sample()
+        content, prompt_tokens = self._respond(messages)
+        time.sleep(ttft)
+        if failure is not None:
+            raise failure
+        chunks, delay = self._chunks(content), self._token_delay()
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(delay)
+            # Providers report usage on the final chunk
+            yield LLMResponse(chunk, **(self._usage(prompt_tokens, content) if i == len(chunks) - 1 else {}))
+
+    async def astream(self, messages, **kwargs):
+        ttft, failure = self._sample()
+        content, prompt_tokens = self._respond(messages)
+        await asyncio.sleep(ttft)
+        if failure is not None:
+            raise failure
+        chunks, delay = self._chunks(content), self._token_delay()
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(delay)
+            yield LLMResponse(chunk, **(self._usage(prompt_tokens, content) if i == len(chunks) - 1 else {}))
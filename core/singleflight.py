@@ -0,0 +1,97 @@
+"""
+Singleflight - Coalesces concurrent identical work into one shared execution
+"""
+
+import asyncio
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from core.cache import cache_key
+from core.wrappers import LLMWrapper, model_id
+
+class _Flight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+class SingleFlight:
+    """Runs one execution per key at a time; concurrent callers share its outcome.
+
+    ``do`` (threads) and ``ado`` (asyncio) return ``(result, shared)``, where
+    ``shared`` is True when the result object went to more than one caller.
+    Callers that may mutate the result should copy it when shared. Exceptions
+    reach every caller. An async execution runs as its own task, so
+    cancelling one caller never cancels the work the others wait on.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Flight] = {}
+        self._acalls: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], _Flight] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight(Future())
+            else:
+                flight.waiters += 1
+        if not leader:
+            return flight.future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(self._calls, key)
+            flight.future.set_exception(e)
+            raise
+        # No new waiters can join once the key is removed, so the count is final
+        shared = self._land(self._calls, key).waiters > 0
+        flight.future.set_result(result)
+        return result, shared
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        loop = asyncio.get_running_loop()
+        # Futures belong to one event loop, so flights are never shared across loops
+        full_key = (loop, key)
+        flight = self._acalls.get(full_key)
+        if flight is None:
+            flight = self._acalls[full_key] = _Flight(asyncio.ensure_future(fn()))
+            flight.future.add_done_callback(lambda _: self._land(self._acalls, full_key))
+            result = await asyncio.shield(flight.future)
+            return result, flight.waiters > 0
+        flight.waiters += 1
+        return await asyncio.shield(flight.future), True
+
+    def _land(self, calls: Dict, key: Hashable) -> _Flight:
+        with self._lock:
+            return calls.pop(key)
+
+def question_key(question: str) -> str:
+    """Lexically normalise a question so trivially different copies coalesce."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+# Process-wide group for identical prompts sent by any agent
+prompt_flights = SingleFlight()
+
+class CoalescingLLM(LLMWrapper):
+    """Sends one request for identical prompts that are in flight at the same time.
+
+    Streams are not coalesced: every streaming caller needs its own tokens.
+    """
+    def __init__(self, llm, flights: SingleFlight = prompt_flights):
+        super().__init__(llm)
+        self.flights = flights
+
+    def _key(self, messages, kwargs) -> str:
+        return cache_key(messages, model_id(self.llm), getattr(self.llm, "temperature", None), kwargs)
+
+    def invoke(self, messages, **kwargs):
+        return self.flights.do(self._key(messages, kwargs), lambda: self.llm.invoke(messages, **kwargs))[0]
+
+    async def ainvoke(self, messages, **kwargs):
+        return (await self.flights.ado(self._key(messages, kwargs), lambda: self.llm.ainvoke(messages, **kwargs)))[0]
@@ -0,0 +1,392 @@
+"""
+Tracing - Per-stage spans, token accounting and latency histograms
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from core.context import current_stage
+from core.tokens import estimate_message_tokens, estimate_tokens, reported_usage
+from core.wrappers import LLMWrapper
+from config import ENABLE_TRACING, LOG_FILE, LOG_LEVEL
+
+logger = logging.getLogger("multi_agent.trace")
+
+# Latency bucket upper bounds in seconds (Prometheus-style, roughly log spaced)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 25.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Fixed-bucket histogram: O(log buckets) observe, no per-sample storage."""
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+class Span:
+    """What one stage cost: wall time plus LLM calls, tokens and fallbacks."""
+    __slots__ = ("stage", "start", "duration", "calls", "prompt_tokens",
+                 "completion_tokens", "cache_hits", "retries", "fallbacks")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+        self.cache_hits = self.retries = 0
+        self.fallbacks: List[str] = []
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__ if name != "start"}
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# Deferred per-call and per-stage updates kept before they are folded in
+MAX_PENDING = 4096
+
+class Metrics:
+    """Process-wide counters and histograms, exportable as Prometheus text or JSON.
+
+    LLM calls and stage durations, recorded several times per question, are
+    appended to a queue without taking the lock and folded into the series
+    when ``counters`` or ``histograms`` is read, on export, or once
+    MAX_PENDING updates have accumulated.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._pending: Deque[Tuple[str, float, Optional[Tuple[Any, Any, Optional[str]]]]] = deque()
+        # Call-site label order -> sorted metric key, so hot paths skip the sort
+        self._keys: Dict[Tuple[str, Labels], Tuple[str, Labels]] = {}
+        self._stage_series: Dict[str, Tuple[Tuple[str, Labels], ...]] = {}
+
+    @property
+    def counters(self) -> Dict[Tuple[str, Labels], float]:
+        with self._lock:
+            self._fold()
+        return self._counters
+
+    @property
+    def histograms(self) -> Dict[Tuple[str, Labels], Histogram]:
+        with self._lock:
+            self._fold()
+        return self._histograms
+
+    def _key(self, name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        raw = (name, tuple(labels.items()))
+        key = self._keys.get(raw)
+        if key is None:
+            key = self._keys[raw] = (name, tuple(sorted(raw[1])))
+        return key
+
+    def _histogram(self, key: Tuple[str, Labels]) -> Histogram:
+        hist = self._histograms.get(key)
+        if hist is None:
+            hist = self._histograms[key] = Histogram()
+        return hist
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._histogram(key).observe(value)
+
+    def add(self, name: str, labels: Labels, value: float = 1) -> None:
+        """``inc`` for hot paths that already hold the sorted label pairs."""
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe_stage(self, stage: str, duration: float) -> None:
+        """Observe one stage duration (deferred; the span hot path)."""
+        self._pending.append((stage, duration, None))
+        if len(self._pending) > MAX_PENDING:
+            with self._lock:
+                self._fold()
+
+    def record_call(self, stage: str, duration: float, messages, response: Any,
+                    content: Optional[str] = None) -> None:
+        """Account one LLM call (deferred; the TracedLLM hot path).
+
+        Tokens and cache hits are read from ``response`` when the call is
+        folded in, so the caller only pays for the append.
+        """
+        self._pending.append((stage, duration, (messages, response, content)))
+        if len(self._pending) > MAX_PENDING:
+            with self._lock:
+                self._fold()
+
+    def _stage_keys(self, stage: str) -> Tuple[Tuple[str, Labels], ...]:
+        """Metric keys of the per-stage series, built once per stage."""
+        keys = self._stage_series.get(stage)
+        if keys is None:
+            labels = (("stage", stage),)
+            keys = self._stage_series[stage] = tuple((name, labels) for name in (
+                "agent_stage_duration_seconds", "agent_llm_call_duration_seconds", "agent_llm_calls_total",
+                "agent_prompt_tokens_total", "agent_completion_tokens_total", "agent_llm_cache_hits_total"))
+        return keys
+
+    def _fold(self) -> None:
+        """Apply the deferred updates; the caller holds the lock."""
+        counters = self._counters
+        while True:
+            try:
+                stage, duration, call = self._pending.popleft()
+            except IndexError:
+                return
+            stage_duration, latency, calls, prompt, completion, hits = self._stage_keys(stage)
+            if call is None:
+                self._histogram(stage_duration).observe(duration)
+                continue
+            prompt_tokens, completion_tokens, cache_hit = call_usage(*call)
+            self._histogram(latency).observe(duration)
+            counters[calls] = counters.get(calls, 0) + 1
+            counters[prompt] = counters.get(prompt, 0) + prompt_tokens
+            counters[completion] = counters.get(completion, 0) + completion_tokens
+            if cache_hit:
+                counters[hits] = counters.get(hits, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            self._fold()
+            for name in sorted({n for n, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value:g}")
+            for name in sorted({n for n, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self._histograms.items(), key=lambda kv: kv[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(labels, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """Counters plus count/mean/p50/p95/p99 for every histogram."""
+        with self._lock:
+            self._fold()
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self._counters.items())]
+            histograms = [{
+                "name": n, "labels": dict(l), "count": h.count,
+                "mean": h.sum / h.count if h.count else 0.0,
+                "p50": h.quantile(0.50), "p95": h.quantile(0.95), "p99": h.quantile(0.99),
+            } for (n, l), h in sorted(self._histograms.items(), key=lambda kv: kv[0])]
+        return {"counters": counters, "histograms": histograms}
+
+    def export(self, prometheus_path: Optional[str] = None, json_path: Optional[str] = None) -> None:
+        """Write the Prometheus text file and/or the JSON summary."""
+        for path, render in ((prometheus_path, self.to_prometheus),
+                             (json_path, lambda: json.dumps(self.summary(), indent=2))):
+            if not path:
+                continue
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp.{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(render())
+            os.replace(tmp_path, path)
+
+metrics = Metrics()
+
+class span:
+    """Time a workflow stage and collect what its LLM calls cost.
+
+    The stage duration always goes to the histogram. The per-span call,
+    token and fallback tallies only feed the DEBUG span log, so without it
+    no Span is built and the context is left alone. A class rather than a
+    generator context manager, since it is entered for every stage of every run.
+    """
+    __slots__ = ("stage", "start", "current", "token")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.start = None
+        self.current: Optional[Span] = None
+
+    def __enter__(self) -> Optional[Span]:
+        if ENABLE_TRACING:
+            self.start = time.perf_counter()
+            if logger.isEnabledFor(logging.DEBUG):
+                self.current = Span(self.stage)
+                self.token = _current_span.set(self.current)
+        return self.current
+
+    def __exit__(self, *exc) -> None:
+        if self.start is None:
+            return
+        duration = time.perf_counter() - self.start
+        metrics.observe_stage(self.stage, duration)
+        current = self.current
+        if current is not None:
+            _current_span.reset(self.token)
+            current.duration = duration
+            logger.debug("span %s", json.dumps(current.as_dict()))
+
+def _stage_label() -> str:
+    return current_stage() or "unscoped"
+
+def record_fallback(kind: str) -> None:
+    """Count a parse fallback (e.g. perception_json, research_lines) in the current stage."""
+    if not ENABLE_TRACING:
+        return
+    current = _current_span.get()
+    if current is not None:
+        current.fallbacks.append(kind)
+    metrics.add("agent_parse_fallbacks_total", (("kind", kind), ("stage", _stage_label())))
+
+def record_fast_path(stage: str, hit: bool) -> None:
+    """Count whether a local fast path answered ``stage`` without an LLM call."""
+    if not ENABLE_TRACING:
+        return
+    metrics.add("agent_fast_path_total", (("outcome", "hit" if hit else "miss"), ("stage", stage)))
+
+def record_replay(hit: bool) -> None:
+    """Count whether the replay backend found a recorded response for a prompt."""
+    if not ENABLE_TRACING:
+        return
+    metrics.inc("agent_replay_total", stage=_stage_label(), outcome="hit" if hit else "miss")
+
+def record_routing(event: str) -> None:
+    """Count a routing event (hedge, hedge_won, deadline, cascade_escalated, ...) in the current stage."""
+    if not ENABLE_TRACING:
+        return
+    metrics.inc("agent_llm_routing_total", stage=_stage_label(), event=event)
+
+def record_http_request(route: str, status: int, duration: float) -> None:
+    """Count one HTTP request served in --serve mode and observe its latency."""
+    if not ENABLE_TRACING:
+        return
+    metrics.inc("agent_http_requests_total", route=route, status=str(status))
+    metrics.observe("agent_http_request_duration_seconds", duration, route=route)
+
+def record_retry() -> None:
+    """Count a retried LLM call in the current stage."""
+    if not ENABLE_TRACING:
+        return
+    current = _current_span.get()
+    if current is not None:
+        current.retries += 1
+    metrics.inc("agent_llm_retries_total", stage=_stage_label())
+
+def call_usage(messages, response: Any, content: Optional[str] = None) -> Tuple[int, int, bool]:
+    """Prompt tokens, completion tokens (reported or estimated) and cache hit of one call."""
+    usage = reported_usage(response)
+    if usage is None:
+        text = content if content is not None else getattr(response, "content", str(response))
+        usage = (estimate_message_tokens(messages), estimate_tokens(text))
+    metadata = getattr(response, "response_metadata", None)
+    return usage[0], usage[1], bool(metadata and metadata.get("cache_hit"))
+
+def record_llm_call(messages, response: Any, duration: float, content: Optional[str] = None) -> None:
+    """Account one LLM call: latency, tokens (reported or estimated) and cache hits."""
+    current = _current_span.get()
+    if current is not None:
+        prompt_tokens, completion_tokens, cache_hit = call_usage(messages, response, content)
+        current.calls += 1
+        current.prompt_tokens += prompt_tokens
+        current.completion_tokens += completion_tokens
+        current.cache_hits += cache_hit
+    metrics.record_call(_stage_label(), duration, messages, response, content)
+
+class TracedLLM(LLMWrapper):
+    """Records latency, time to first token and token usage of every call."""
+
+    def invoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        response = self.llm.invoke(messages, **kwargs)
+        record_llm_call(messages, response, time.perf_counter() - start)
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(messages, **kwargs)
+        record_llm_call(messages, response, time.perf_counter() - start)
+        return response
+
+    def stream(self, messages, **kwargs):
+        start = time.perf_counter()
+        parts, last = [], None
+        for chunk in self.llm.stream(messages, **kwargs):
+            if last is None:
+                metrics.observe("agent_llm_ttft_seconds", time.perf_counter() - start, stage=_stage_label())
+            parts.append(getattr(chunk, "content", str(chunk)))
+            last = chunk
+            yield chunk
+        record_llm_call(messages, last, time.perf_counter() - start, "".join(parts))
+
+    async def astream(self, messages, **kwargs):
+        start = time.perf_counter()
+        parts, last = [], None
+        async for chunk in self.llm.astream(messages, **kwargs):
+            if last is None:
+                metrics.observe("agent_llm_ttft_seconds", time.perf_counter() - start, stage=_stage_label())
+            parts.append(getattr(chunk, "content", str(chunk)))
+            last = chunk
+            yield chunk
+        record_llm_call(messages, last, time.perf_counter() - start, "".join(parts))
+
+def configure_logging() -> None:
+    """Send trace spans and other logs to LOG_FILE at LOG_LEVEL."""
+    root = logging.getLogger("multi_agent")
+    if root.handlers or not LOG_FILE:
+        return
+    if os.path.dirname(LOG_FILE):
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL.upper())
+    root.propagate = False
@@ -2,120 +2,481 @@
 Workflow Orchestration - Manages the multi-agent workflow execution
 """
 
-from typing import Dict, Any
-from core.memory import Memory, add_message, get_last_user_message
-from agents.perception import extract_intent_and_entities
-from agents.orchestrator import decide_next_step
-from agents.research import gather_research
-from agents.analysis import analyze_facts
-from agents.decision import make_decision
-from config import DEFAULT_DISPLAY_LIMIT
+import asyncio
+import contextvars
+import copy
+import queue
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, List, AsyncIterator, Iterator, Optional
+from core.context import deadline_scope, stage_scope
+from core.tracing import record_fast_path, span
+from core.events import WorkflowEvent, emit, event_sink, is_streaming
+from core.graph import build_graph
+from core.singleflight import SingleFlight, question_key
+from core.answer_cache import AnswerCache
+from core.answer_store import AnswerStore
+from core.checkpoint import Checkpointer
+from core.replay import record_run
+from core.session import Session
+from core.memory import Memory, STAGE_OUTPUTS, with_message, get_last_user_message, create_initial_state
+from agents.perception import extract_intent_and_entities, aextract_intent_and_entities
+from agents.research import gather_research, agather_research, stream_research, astream_research
+from agents.research import prefetch_kb_facts, retrieve_kb_facts, kb_fingerprint
+from agents.fused import run_fused, arun_fused
+from agents.analysis import analyze_facts, aanalyze_facts, stream_analysis, astream_analysis
+from agents.decision import make_decision, amake_decision, stream_decision, astream_decision
+from config import DEFAULT_DISPLAY_LIMIT, WORKFLOW_MODE, ENABLE_COALESCING, WORKFLOW_DEADLINE_S, STAGE_DEADLINES
+
+STAGE_BANNERS = {
+    "fast": "\n⚡ Fast path: single fused call",
+    "answer_store": "\n📦 Answer store: precomputed answer for this intent and entities",
+    "answer_cache": "\n♻️  Answer cache: same intent and entities as an earlier question",
+    "perception": "\n🔍 Step 1: Perception",
+    "research": "\n📚 Step 2: Research",
+    "analysis": "\n🧠 Step 3: Analysis",
+    "decision": "\n🎯 Step 4: Decision",
+}
 
 class MultiAgentWorkflow:
     """Orchestrates the execution of the multi-agent cognitive architecture."""
-    
-    def __init__(self, perception_llm, reasoner_llm, display_limit: int = None):
+
+    def __init__(self, perception_llm, reasoner_llm, display_limit: int = None,
+                 mode: str = WORKFLOW_MODE, coalesce: bool = ENABLE_COALESCING,
+                 answer_cache: Optional[AnswerCache] = None,
+                 answer_store: Optional[AnswerStore] = None,
+                 checkpointer: Optional[Checkpointer] = None,
+                 deadline: Optional[float] = WORKFLOW_DEADLINE_S,
+                 stage_deadlines: Optional[Dict[str, float]] = None):
+        """``mode="fast"`` answers with one fused reasoner call and only runs
+        the four-stage pipeline when that output cannot be parsed. With
+        ``coalesce`` concurrent runs of the same question share one execution
+        and each caller gets its own copy of the resulting Memory. An
+        ``answer_cache`` is consulted right after perception and can replace
+        the remaining stages; a precomputed ``answer_store`` is looked up
+        before it. A ``checkpointer`` receives the Memory after
+        every completed stage so a failed run can be continued with ``resume``.
+        A run must finish within ``deadline`` seconds and each stage within
+        its ``stage_deadlines`` entry (default STAGE_DEADLINES); LLM calls that
+        overrun raise ``core.context.DeadlineExceeded``."""
+        if mode not in ("standard", "fast"):
+            raise ValueError(f"Unknown workflow mode: {mode}")
         self.perception_llm = perception_llm
         self.reasoner_llm = reasoner_llm
         self.display_limit = display_limit or DEFAULT_DISPLAY_LIMIT
-    
-    def run(self, question: str, verbose: bool = True) -> Dict[str, Any]:
-        """Run the complete multi-agent workflow."""
-        # Initialize state
-        state = Memory(
-            messages=[{"role": "user", "content": question}],
-            entities=[],
-            research_facts=[],
-        )
-        
-        if verbose:
-            print(f"\n🤔 Processing: {question}")
-            print("=" * 50)
-        
-        # Step 1: Perception
-        if verbose:
-            print("\n🔍 Step 1: Perception")
-        
-        perception_result = extract_intent_and_entities(
-            get_last_user_message(state), 
-            self.perception_llm
-        )
-        
-        state.update(perception_result)
-        add_message(state, "system/perception", str(perception_result))
-        
-        if verbose:
-            print(f"   Intent: {state['intent']}")
-            print(f"   Entities: {state['entities']}")
-        
-        # Step 2: Research
+        self.mode = mode
+        self.flights = SingleFlight() if coalesce else None
+        self.answer_cache = answer_cache
+        self.answer_store = answer_store
+        self.checkpointer = checkpointer
+        self.deadline = deadline
+        self.stage_deadlines = STAGE_DEADLINES if stage_deadlines is None else stage_deadlines
+        nodes = {
+            "perception": (self._perception_node, self._aperception_node),
+            "research": (self._research_node, self._aresearch_node),
+            "analysis": (self._analysis_node, self._aanalysis_node),
+            "decision": (self._decision_node, self._adecision_node),
+        }
+        if mode == "fast":
+            nodes["fast"] = (self._fast_node, self._afast_node)
+        self.graph = build_graph(nodes)
+
+    def run(self, question: str, verbose: bool = True, run_id: Optional[str] = None,
+            session: Optional[Session] = None) -> Dict[str, Any]:
+        """Run the complete multi-agent workflow.
+
+        With ``verbose`` progress is printed as it happens, including the
+        analysis and decision tokens as the model streams them. With a
+        checkpointer, stages are saved under ``run_id`` (a new ID when None;
+        the result carries it as ``run_id``). With a ``session`` the question
+        is read as a follow-up to its earlier turns and the result is
+        recorded as the next turn.
+        """
+        context = session.context() if session is not None else None
         if verbose:
-            print("\n📚 Step 2: Research")
-        
-        research_facts = gather_research(
-            state.get("normalized_question", question),
-            state.get("entities", []),
-            self.reasoner_llm
-        )
-        
-        state["research_facts"] = research_facts
-        add_message(state, "agent/research", str(research_facts))
-        
+            with event_sink(ConsoleRenderer(self.display_limit)):
+                state = self._run(question, run_id, context)
+        else:
+            state = self._run(question, run_id, context)
+        if session is not None:
+            session.record(state)
+        return state
+
+    async def arun(self, question: str, verbose: bool = True, run_id: Optional[str] = None,
+                   session: Optional[Session] = None) -> Dict[str, Any]:
+        """Run the complete multi-agent workflow on the event loop via ainvoke."""
+        context = session.context() if session is not None else None
         if verbose:
-            print(f"   Found {len(research_facts)} facts:")
-            for i, fact in enumerate(research_facts, 1):
-                if len(fact) > self.display_limit:
-                    print(f"   {i}. {fact[:self.display_limit]}...")
-                    print(f"      ... (truncated, full length: {len(fact)} chars)")
-                else:
-                    print(f"   {i}. {fact}")
-        
-        # Step 3: Analysis
+            with event_sink(ConsoleRenderer(self.display_limit)):
+                state = await self._arun(question, run_id, context)
+        else:
+            state = await self._arun(question, run_id, context)
+        if session is not None:
+            await session.arecord(state)
+        return state
+
+    def resume(self, run_id: str, verbose: bool = True) -> Dict[str, Any]:
+        """Continue a checkpointed run after its last completed stage.
+
+        A run that already finished returns its final Memory without any LLM call.
+        """
+        state = self._checkpoint(run_id)
         if verbose:
-            print("\n🧠 Step 3: Analysis")
-        
-        analysis = analyze_facts(
-            state.get("normalized_question", question),
-            research_facts,
-            self.reasoner_llm
-        )
-        
-        state["analysis"] = analysis
-        add_message(state, "agent/analysis", analysis)
-        
+            with event_sink(ConsoleRenderer(self.display_limit)):
+                return self._execute(state)
+        return self._execute(state)
+
+    async def aresume(self, run_id: str, verbose: bool = True) -> Dict[str, Any]:
+        """Async version of resume."""
+        state = self._checkpoint(run_id)
         if verbose:
-            if len(analysis) > self.display_limit:
-                print(f"   Analysis (truncated, full length: {len(analysis)} chars):")
-                print(f"   {analysis[:self.display_limit]}...")
-                print(f"   ... (full analysis available in results)")
+            with event_sink(ConsoleRenderer(self.display_limit)):
+                return await self._aexecute(state)
+        return await self._aexecute(state)
+
+    def stream(self, question: str) -> Iterator[WorkflowEvent]:
+        """Run the workflow in a background thread, yielding events as they happen.
+
+        The last event is ``workflow_finished`` whose ``data`` is the final Memory.
+        """
+        events: "queue.Queue" = queue.Queue()
+        failure: List[BaseException] = []
+
+        def target():
+            try:
+                with event_sink(events.put):
+                    self._run(question)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                events.put(None)
+
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True)
+        thread.start()
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield event
+        thread.join()
+        if failure:
+            raise failure[0]
+
+    async def astream(self, question: str) -> AsyncIterator[WorkflowEvent]:
+        """Async version of stream: runs arun as a task and yields its events."""
+        events: "asyncio.Queue" = asyncio.Queue()
+        with event_sink(events.put_nowait):
+            task = asyncio.ensure_future(self._arun(question))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def _run(self, question: str, run_id: Optional[str] = None, context: Optional[str] = None) -> Memory:
+        record_run(question)
+        initial = self._initial_state(question, run_id, context)
+        # Streaming callers need their own events, and follow-ups depend on
+        # their session, so only silent standalone runs coalesce
+        if self.flights is None or is_streaming() or context:
+            return self._execute(initial)
+        state, shared = self.flights.do(question_key(question), lambda: self._execute(initial))
+        return copy.deepcopy(state) if shared else state
+
+    async def _arun(self, question: str, run_id: Optional[str] = None, context: Optional[str] = None) -> Memory:
+        record_run(question)
+        initial = self._initial_state(question, run_id, context)
+        if self.flights is None or is_streaming() or context:
+            return await self._aexecute(initial)
+        state, shared = await self.flights.ado(question_key(question), lambda: self._aexecute(initial))
+        return copy.deepcopy(state) if shared else state
+
+    def _execute(self, initial: Memory) -> Memory:
+        emit({"type": "workflow_started", "data": get_last_user_message(initial)})
+        with span("workflow"), deadline_scope(self.deadline):
+            state = self.graph.invoke(initial)
+        self._remember_answer(state)
+        emit({"type": "workflow_finished", "data": state})
+        return state
+
+    async def _aexecute(self, initial: Memory) -> Memory:
+        emit({"type": "workflow_started", "data": get_last_user_message(initial)})
+        with span("workflow"), deadline_scope(self.deadline):
+            state = await self.graph.ainvoke(initial)
+        self._remember_answer(state)
+        emit({"type": "workflow_finished", "data": state})
+        return state
+
+    def _initial_state(self, question: str, run_id: Optional[str], context: Optional[str] = None) -> Memory:
+        state = create_initial_state(question, context)
+        if self.checkpointer is not None:
+            state["run_id"] = run_id or uuid.uuid4().hex
+        return state
+
+    def _checkpoint(self, run_id: str) -> Memory:
+        state = self.checkpointer.load(run_id) if self.checkpointer is not None else None
+        if state is None:
+            raise ValueError(f"No checkpoint for run {run_id}")
+        return state
+
+    # Graph nodes: each takes the current Memory and returns a partial update
+
+    def _fast_node(self, state: Memory) -> Dict[str, Any]:
+        question = get_last_user_message(state)
+        with self._stage("fast"):
+            result = run_fused(question, retrieve_kb_facts(question, []), self.reasoner_llm)
+        return self._finish_fast(state, result)
+
+    async def _afast_node(self, state: Memory) -> Dict[str, Any]:
+        question = get_last_user_message(state)
+        with self._stage("fast"):
+            result = await arun_fused(question, retrieve_kb_facts(question, []), self.reasoner_llm)
+        return self._finish_fast(state, result)
+
+    def _perception_node(self, state: Memory) -> Dict[str, Any]:
+        # Research usually retrieves for the same question; start that lookup now
+        prefetch_kb_facts(get_last_user_message(state))
+        with self._stage("perception"):
+            result = extract_intent_and_entities(get_last_user_message(state), self.perception_llm,
+                                                 state.get("context"))
+        return self._finish_perception(state, result)
+
+    async def _aperception_node(self, state: Memory) -> Dict[str, Any]:
+        prefetch_kb_facts(get_last_user_message(state))
+        with self._stage("perception"):
+            result = await aextract_intent_and_entities(get_last_user_message(state), self.perception_llm,
+                                                        state.get("context"))
+        return self._finish_perception(state, result)
+
+    def _research_node(self, state: Memory) -> Dict[str, Any]:
+        with self._stage("research"):
+            if is_streaming():
+                facts = self._collect_facts(stream_research(_question(state), state.get("entities", []), self.reasoner_llm))
             else:
-                print(f"   Analysis: {analysis}")
-        
-        # Step 4: Decision
-        if verbose:
-            print("\n🎯 Step 4: Decision")
-        
-        decision = make_decision(
-            state.get("normalized_question", question),
-            analysis,
-            self.reasoner_llm
-        )
-        
-        state["decision"] = decision
-        add_message(state, "agent/decision", decision)
-        
-        if verbose:
-            if len(decision) > self.display_limit:
-                print(f"   Decision (truncated, full length: {len(decision)} chars):")
-                print(f"   {decision[:self.display_limit]}...")
-                print(f"   ... (full decision available in results)")
+                facts = gather_research(_question(state), state.get("entities", []), self.reasoner_llm)
+        return self._finish(state, "research", facts, {"research_facts": facts})
+
+    async def _aresearch_node(self, state: Memory) -> Dict[str, Any]:
+        with self._stage("research"):
+            if is_streaming():
+                facts = await self._acollect_facts(astream_research(_question(state), state.get("entities", []), self.reasoner_llm))
             else:
-                print(f"   Decision: {decision}")
-        
-        # Final output
-        if verbose:
-            print("\n" + "=" * 50)
-            print("🎉 Workflow Complete!")
-            print("=" * 50)
-        
-        return state 
\ No newline at end of file
+                facts = await agather_research(_question(state), state.get("entities", []), self.reasoner_llm)
+        return self._finish(state, "research", facts, {"research_facts": facts})
+
+    def _analysis_node(self, state: Memory) -> Dict[str, Any]:
+        facts = state.get("research_facts", [])
+        with self._stage("analysis"):
+            if is_streaming():
+                analysis = self._collect("analysis", stream_analysis(_question(state), facts, self.reasoner_llm))
+            else:
+                analysis = analyze_facts(_question(state), facts, self.reasoner_llm)
+        return self._finish(state, "analysis", analysis, {"analysis": analysis})
+
+    async def _aanalysis_node(self, state: Memory) -> Dict[str, Any]:
+        facts = state.get("research_facts", [])
+        with self._stage("analysis"):
+            if is_streaming():
+                analysis = await self._acollect("analysis", astream_analysis(_question(state), facts, self.reasoner_llm))
+            else:
+                analysis = await aanalyze_facts(_question(state), facts, self.reasoner_llm)
+        return self._finish(state, "analysis", analysis, {"analysis": analysis})
+
+    def _decision_node(self, state: Memory) -> Dict[str, Any]:
+        # Factual intents skip analysis; decide directly from the research facts
+        basis = _decision_basis(state)
+        with self._stage("decision"):
+            if is_streaming():
+                decision = self._collect("decision", stream_decision(_question(state), basis, self.reasoner_llm))
+            else:
+                decision = make_decision(_question(state), basis, self.reasoner_llm)
+        return self._finish(state, "decision", decision, {"decision": decision})
+
+    async def _adecision_node(self, state: Memory) -> Dict[str, Any]:
+        basis = _decision_basis(state)
+        with self._stage("decision"):
+            if is_streaming():
+                decision = await self._acollect("decision", astream_decision(_question(state), basis, self.reasoner_llm))
+            else:
+                decision = await amake_decision(_question(state), basis, self.reasoner_llm)
+        return self._finish(state, "decision", decision, {"decision": decision})
+
+    @contextmanager
+    def _stage(self, stage: str):
+        emit({"type": "stage_started", "stage": stage})
+        with stage_scope(stage), span(stage), deadline_scope(self.stage_deadlines.get(stage)):
+            yield
+
+    def _collect(self, stage: str, chunks: Iterator[str]) -> str:
+        parts = []
+        for text in chunks:
+            if text:
+                parts.append(text)
+                emit({"type": "token", "stage": stage, "text": text})
+        return "".join(parts).strip()
+
+    async def _acollect(self, stage: str, chunks: AsyncIterator[str]) -> str:
+        parts = []
+        async for text in chunks:
+            if text:
+                parts.append(text)
+                emit({"type": "token", "stage": stage, "text": text})
+        return "".join(parts).strip()
+
+    def _collect_facts(self, facts: Iterator[Any]) -> List[Any]:
+        collected = []
+        for fact in facts:
+            collected.append(fact)
+            emit({"type": "fact", "stage": "research", "data": fact})
+        return collected
+
+    async def _acollect_facts(self, facts: AsyncIterator[Any]) -> List[Any]:
+        collected = []
+        async for fact in facts:
+            collected.append(fact)
+            emit({"type": "fact", "stage": "research", "data": fact})
+        return collected
+
+    def _finish_fast(self, state: Memory, result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if result is None:
+            # Unparseable output: fall through to the four-stage pipeline
+            emit({"type": "stage_finished", "stage": "fast", "data": None})
+            return {"step": "fast"}
+        return self._finish(state, "fast", result, dict(result))
+
+    def _finish_perception(self, state: Memory, result: Dict[str, Any]) -> Dict[str, Any]:
+        update = self._finish(state, "perception", result, dict(result), role="system/perception")
+        stage, cached = None, None
+        if self.answer_store is not None:
+            cached = self.answer_store.get(result["intent"], result["entities"],
+                                           result["normalized_question"], kb_fingerprint())
+            record_fast_path("answer_store", cached is not None)
+            stage = "answer_store"
+        if cached is None and self.answer_cache is not None:
+            cached = self.answer_cache.get(result["intent"], result["entities"],
+                                           result["normalized_question"], kb_fingerprint())
+            stage = "answer_cache"
+        if cached is None:
+            return update
+        # Same meaning as a known question: skip research, analysis and decision
+        emit({"type": "stage_started", "stage": stage})
+        update.update(cached)
+        return self._finish({**state, **update}, stage, cached, update)
+
+    def _remember_answer(self, state: Memory) -> None:
+        if self.answer_cache is not None and state.get("step") not in ("answer_cache", "answer_store"):
+            self.answer_cache.set(state, kb_fingerprint())
+
+    def _finish(self, state: Memory, stage: str, output: Any, updates: Dict[str, Any],
+                role: str = None) -> Dict[str, Any]:
+        """Emit stage_finished and build the node's state update.
+
+        The transcript entry references the stage's output fields rather than
+        holding a second (stringified) copy of them.
+        """
+        emit({"type": "stage_finished", "stage": stage, "data": output})
+        updates["messages"] = with_message(state, role or f"agent/{stage}", STAGE_OUTPUTS[stage])
+        updates["step"] = stage
+        if self.checkpointer is not None and state.get("run_id"):
+            self.checkpointer.save(state["run_id"], {**state, **updates})
+        return updates
+
+def _question(state: Memory) -> str:
+    return state.get("normalized_question") or get_last_user_message(state)
+
+def _decision_basis(state: Memory) -> str:
+    if state.get("analysis") is not None:
+        return state["analysis"]
+    return "\n".join(f"- {fact}" for fact in state.get("research_facts", []))
+
+class ConsoleRenderer:
+    """Prints workflow events to the terminal, streaming tokens as they arrive."""
+
+    def __init__(self, display_limit: int = None):
+        self.display_limit = display_limit or DEFAULT_DISPLAY_LIMIT
+        self._streamed = 0
+
+    def __call__(self, event: WorkflowEvent) -> None:
+        handler = getattr(self, "_on_" + event["type"], None)
+        if handler is not None:
+            handler(event)
+
+    def _on_workflow_started(self, event: WorkflowEvent) -> None:
+        print(f"\n🤔 Processing: {event['data']}")
+        print("=" * 50)
+
+    def _on_stage_started(self, event: WorkflowEvent) -> None:
+        print(STAGE_BANNERS.get(event["stage"], f"\n▶ {event['stage']}"))
+        self._streamed = 0
+
+    def _on_fact(self, event: WorkflowEvent) -> None:
+        self._streamed += 1
+        self._print_fact(self._streamed, event["data"])
+
+    def _print_fact(self, i: int, fact: Any) -> None:
+        fact = str(fact)
+        if len(fact) > self.display_limit:
+            print(f"   {i}. {fact[:self.display_limit]}...")
+            print(f"      ... (truncated, full length: {len(fact)} chars)")
+        else:
+            print(f"   {i}. {fact}")
+
+    def _on_token(self, event: WorkflowEvent) -> None:
+        text = event["text"]
+        if self._streamed == 0:
+            label = "Analysis" if event["stage"] == "analysis" else "Decision"
+            print(f"   {label}: ", end="")
+            text = text.lstrip()
+        if self._streamed < self.display_limit:
+            print(text[:self.display_limit - self._streamed], end="", flush=True)
+        self._streamed += len(text)
+
+    def _on_stage_finished(self, event: WorkflowEvent) -> None:
+        stage, data = event["stage"], event["data"]
+        if stage == "fast":
+            if data is None:
+                print("   Could not parse fused output; running the full pipeline")
+            else:
+                print(f"   Intent: {data['intent']}")
+                print(f"   Entities: {data['entities']}")
+                print(f"   Facts: {len(data['research_facts'])}")
+                print(f"   Decision: {data['decision'][:self.display_limit]}")
+        elif stage in ("answer_cache", "answer_store"):
+            print(f"   Reusing {len(data['research_facts'] or [])} facts and the stored decision")
+            print(f"   Decision: {data['decision'][:self.display_limit]}")
+        elif stage == "perception":
+            print(f"   Intent: {data.get('intent')}")
+            print(f"   Entities: {data.get('entities')}")
+        elif stage == "research":
+            if self._streamed:
+                # Facts were already printed as they arrived
+                print(f"   Found {len(data)} facts")
+                return
+            print(f"   Found {len(data)} facts:")
+            for i, fact in enumerate(data, 1):
+                self._print_fact(i, fact)
+        elif self._streamed:
+            # Tokens were already printed; only close the line
+            print("..." if len(data) > self.display_limit else "")
+            if len(data) > self.display_limit:
+                print(f"   ... (truncated, full length: {len(data)} chars; full {stage} available in results)")
+        else:
+            label = "Analysis" if stage == "analysis" else "Decision"
+            if len(data) > self.display_limit:
+                print(f"   {label} (truncated, full length: {len(data)} chars):")
+                print(f"   {data[:self.display_limit]}...")
+                print(f"   ... (full {stage} available in results)")
+            else:
+                print(f"   {label}: {data}")
+
+    def _on_workflow_finished(self, event: WorkflowEvent) -> None:
+        print("\n" + "=" * 50)
+        print("🎉 Workflow Complete!")
+        print("=" * 50)
@@ -0,0 +1,52 @@
+"""
+LLM Wrappers - Base class for decorators layered around a chat model
+"""
+
+from typing import Any
+
+class LLMWrapper:
+    """Delegates to ``self.llm``; subclasses override the calls they decorate."""
+    def __init__(self, llm):
+        self.llm = llm
+
+    def invoke(self, messages, **kwargs):
+        return self.llm.invoke(messages, **kwargs)
+
+    async def ainvoke(self, messages, **kwargs):
+        return await self.llm.ainvoke(messages, **kwargs)
+
+    def stream(self, messages, **kwargs):
+        return self.llm.stream(messages, **kwargs)
+
+    async def astream(self, messages, **kwargs):
+        async for chunk in self.llm.astream(messages, **kwargs):
+            yield chunk
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for attributes not defined on the wrapper (model_name, ...)
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+class LLMResponse:
+    """Minimal stand-in for an AIMessage produced without calling the model."""
+    def __init__(self, content: str, **metadata):
+        self.content = content
+        self.response_metadata = metadata
+
+    def __repr__(self) -> str:
+        return f"LLMResponse(content={self.content!r})"
+
+def unwrap(llm):
+    """Return the chat model underneath any stack of LLMWrappers."""
+    while isinstance(llm, LLMWrapper):
+        llm = llm.llm
+    return llm
+
+def model_id(llm) -> str:
+    """Best-effort model name for a LangChain chat model, FakeLLM or wrapper."""
+    for attr in ("model_name", "model", "name"):
+        value = getattr(llm, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(llm).__name__
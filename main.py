@@ -3,22 +3,53 @@ Multi-Agent Cognitive Architecture - Main Entry Point
 """
 
 import os
+import time
+import asyncio
+import tempfile
 import argparse
-from dotenv import load_dotenv
+import json
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 
-# Load environment variables
-load_dotenv()
-
-# Import our modules
-from core.llm_factory import make_llm, make_reasoner
+# Import our modules (config.py loads .env on first import)
+from core.llm_factory import make_llm, make_reasoner, get_client, shutdown_clients, FakeLLM
 from core.workflow import MultiAgentWorkflow
-from config import DEFAULT_DISPLAY_LIMIT, FULL_OUTPUT_DISPLAY_LIMIT
+from core.cache import LLMCache
+from core.knowledge_base import KnowledgeBase, get_knowledge_base
+from core.embeddings import DenseIndex, build_dense_index, dense_index_path
+from agents.research import KNOWLEDGE_BASE, kb_fingerprint
+from agents.orchestrator import route_next_step
+from agents.fused import arun_fused, parse_fused, run_fused
+from core.batch import batch_run_id, load_batch, run_batch
+from core.answer_cache import AnswerCache, answer_cache_for
+from core.answer_store import AnswerStore, answer_store_for, canonical_questions, precompute_answers, write_answer_store
+from core.checkpoint import Checkpointer, checkpointer_for
+from core.context import DeadlineExceeded, current_stage, deadline_scope, stage_scope
+import core.routing as routing
+from core.routing import CascadeLLM, HedgedLLM, LatencyTracker
+from core.ratelimit import AIMDController, RateLimiter, RateLimitedLLM
+from core.tracing import configure_logging, metrics
+from core.simulated import SimulatedLLM, SimulatedLLMError
+from core.wrappers import LLMWrapper, unwrap
+from core.singleflight import CoalescingLLM, SingleFlight
+from core.gazetteer import Gazetteer
+from agents.perception import local_perception
+from core.json_stream import FactStreamParser
+from core.server import WorkflowServer
+from core.session import Session
+from core.replay import ReplayLLM, ReplayMiss, Trace, start_recording, stop_recording
+from config import DEFAULT_DISPLAY_LIMIT, FULL_OUTPUT_DISPLAY_LIMIT, BATCH_CONCURRENCY, KNOWLEDGE_BASE_PATH, WORKFLOW_MODE
+from config import METRICS_PROMETHEUS_PATH, METRICS_JSON_PATH, ADAPTIVE_CONCURRENCY, AIMD_LATENCY_TOLERANCE
+from config import SERVER_HOST, SERVER_PORT, SERVER_CONCURRENCY, SERVER_QUEUE_SIZE, SERVER_MAX_BATCH
+from config import MAX_RESEARCH_FACTS, RESEARCH_FANOUT_MAX_ENTITIES, ANSWER_STORE_PATH
+from config import MAX_ANALYSIS_LENGTH, MAX_DECISION_LENGTH
 
 def main():
     """Main entry point for the multi-agent system."""
     parser = argparse.ArgumentParser(description="Multi-Agent Cognitive Architecture")
     parser.add_argument("--question", help="User query to process")
-    parser.add_argument("--backend", choices=["groq", "fake"], 
+    parser.add_argument("--backend", choices=["groq", "fake", "sim", "replay"], 
                        default=os.getenv("BACKEND", "groq"),
                        help="LLM backend to use")
     parser.add_argument("--test", action="store_true", 
@@ -27,16 +58,72 @@ def main():
                        help="Run in interactive mode")
     parser.add_argument("--full-output", action="store_true",
                        help="Show full content without truncation")
+    parser.add_argument("--mode", choices=["standard", "fast"], default=WORKFLOW_MODE,
+                       help="standard: four agent calls; fast: one fused call with fallback")
+    parser.add_argument("--build-index", action="store_true",
+                       help="Build the knowledge base BM25 index and dense embedding matrix, then exit")
+    parser.add_argument("--precompute", nargs="?", const=ANSWER_STORE_PATH, metavar="STORE",
+                       help="Answer the canonical questions of every KB topic and write the answer store, then exit")
+    parser.add_argument("--batch", metavar="INPUT_JSONL",
+                       help="Process questions from a JSONL file ({\"id\": ..., \"question\": ...} per line)")
+    parser.add_argument("--output", default="batch_results.jsonl",
+                       help="JSONL file batch results are appended to")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                       help="Maximum questions in flight in batch mode")
+    parser.add_argument("--no-resume", action="store_true",
+                       help="Reprocess IDs that already have results in --output")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                       help="Continue a failed run from its last completed stage")
+    parser.add_argument("--serve", action="store_true",
+                       help="Serve /recommend, /batch, /metrics and /health over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST,
+                       help="Address to bind in --serve mode")
+    parser.add_argument("--port", type=int, default=SERVER_PORT,
+                       help="Port to bind in --serve mode")
+    parser.add_argument("--record", metavar="TRACE",
+                       help="Append every LLM call and workflow run to a trace file for --backend replay")
     
     args = parser.parse_args()
+    configure_logging()
+    if args.record:
+        start_recording(args.record)
     
+    try:
+        dispatch(parser, args)
+    finally:
+        metrics.export(METRICS_PROMETHEUS_PATH, METRICS_JSON_PATH)
+        shutdown_clients()
+        stop_recording()
+
+def dispatch(parser, args):
+    """Run the mode selected on the command line."""
     if args.test:
         print("🧪 Running tests with FakeLLM backend...")
         run_tests()
         return
     
+    if args.build_index:
+        build_indexes()
+        return
+    
+    if args.precompute:
+        run_precompute(args.precompute, args.backend, args.concurrency, args.mode)
+        return
+    
+    if args.serve:
+        run_server(args.backend, args.host, args.port, args.mode)
+        return
+    
+    if args.batch:
+        run_batch_mode(args.batch, args.output, args.backend, args.concurrency, not args.no_resume, args.mode)
+        return
+    
     if args.interactive:
-        run_interactive(args.backend, args.full_output)
+        run_interactive(args.backend, args.full_output, args.mode)
+        return
+    
+    if args.resume:
+        run_workflow(None, args.backend, args.full_output, args.mode, resume_id=args.resume)
         return
     
     if not args.question:
@@ -45,12 +132,17 @@ def main():
         return
     
     # Run the workflow
-    run_workflow(args.question, args.backend, args.full_output)
+    run_workflow(args.question, args.backend, args.full_output, args.mode)
 
-def run_workflow(question: str, backend: str, full_output: bool = False):
-    """Run the multi-agent workflow for a given question."""
+def run_workflow(question: str, backend: str, full_output: bool = False, mode: str = WORKFLOW_MODE,
+                 resume_id: str = None):
+    """Run the multi-agent workflow for a given question, or resume run ``resume_id``."""
+    checkpointer = checkpointer_for(backend)
+    run_id = resume_id or uuid.uuid4().hex[:12]
     try:
         print(f"🚀 Starting Multi-Agent Workflow with {backend} backend...")
+        if checkpointer is not None:
+            print(f"🆔 Run ID: {run_id}")
         
         # Create LLMs
         perception_llm = make_llm(backend)
@@ -58,8 +150,13 @@ def run_workflow(question: str, backend: str, full_output: bool = False):
         
         # Create and run workflow with appropriate display limit
         display_limit = FULL_OUTPUT_DISPLAY_LIMIT if full_output else DEFAULT_DISPLAY_LIMIT
-        workflow = MultiAgentWorkflow(perception_llm, reasoner_llm, display_limit)
-        result = workflow.run(question)
+        workflow = MultiAgentWorkflow(perception_llm, reasoner_llm, display_limit, mode=mode,
+                                      answer_cache=answer_cache_for(backend),
+                                      answer_store=answer_store_for(backend), checkpointer=checkpointer)
+        if resume_id:
+            result = workflow.resume(resume_id)
+        else:
+            result = workflow.run(question, run_id=run_id)
         
         # Display final results
         print("\n" + "=" * 60)
@@ -105,17 +202,130 @@ def run_workflow(question: str, backend: str, full_output: bool = False):
         
     except Exception as e:
         print(f"❌ Error running workflow: {e}")
+        if checkpointer is not None and checkpointer.load(run_id) is not None:
+            print(f"\n♻️  Completed stages were saved; continue with: python main.py --resume {run_id}")
         print("\n💡 Troubleshooting tips:")
         if backend == "groq":
             print("   - Make sure GROQ_API_KEY is set in .env file")
             print("   - Check your Groq API key is valid")
             print("   - Verify you have sufficient Groq credits")
 
-def run_interactive(backend: str, full_output: bool = False):
+def build_indexes():
+    """Build the BM25 index and the memory-mapped dense embedding matrix offline."""
+    try:
+        kb = get_knowledge_base()
+        if kb is None:
+            print(f"❌ Knowledge base disabled or not found at {KNOWLEDGE_BASE_PATH}")
+            return
+        print(f"📖 BM25 index ready: {len(kb)} facts, {len(kb.index)} terms")
+        
+        start = time.perf_counter()
+        path = build_dense_index(kb, dense_index_path())
+        print(f"🧮 Dense index written to {path} in {time.perf_counter() - start:.2f}s")
+        
+    except Exception as e:
+        print(f"❌ Index build failed: {e}")
+
+def run_precompute(store_path: str, backend: str, concurrency: int = BATCH_CONCURRENCY,
+                   mode: str = WORKFLOW_MODE):
+    """Answer the canonical questions of every KB topic offline and write the answer store."""
+    try:
+        kb = get_knowledge_base()
+        if kb is None:
+            print(f"❌ Knowledge base disabled or not found at {KNOWLEDGE_BASE_PATH}")
+            return
+        questions = canonical_questions(kb.topic_entities)
+        print(f"🗂️  Precomputing {len(questions)} questions over {len(kb.topic_entities)} topics "
+              f"({backend} backend, concurrency {concurrency})")
+        
+        # No answer cache or store: every answer is produced fresh from the current KB
+        workflow = MultiAgentWorkflow(make_llm(backend), make_reasoner(backend), mode=mode, coalesce=False)
+        start = time.perf_counter()
+        states, errors = asyncio.run(precompute_answers(workflow, questions, concurrency))
+        written = write_answer_store(store_path, states, kb_fingerprint(), backend)
+        print(f"📦 {written} answers written to {store_path} in {time.perf_counter() - start:.2f}s "
+              f"({errors} failed runs)")
+        
+    except Exception as e:
+        print(f"❌ Precompute failed: {e}")
+
+def run_batch_mode(input_path: str, output_path: str, backend: str,
+                   concurrency: int = BATCH_CONCURRENCY, resume: bool = True,
+                   mode: str = WORKFLOW_MODE):
+    """Run every question in a JSONL file through one shared workflow."""
+    try:
+        items = load_batch(input_path)
+        print(f"📦 Batch mode: {len(items)} questions from {input_path} "
+              f"({backend} backend, concurrency {concurrency})")
+        
+        # One set of LLM clients shared by every in-flight question
+        perception_llm = make_llm(backend)
+        reasoner_llm = make_reasoner(backend)
+        workflow = MultiAgentWorkflow(perception_llm, reasoner_llm, mode=mode,
+                                      answer_cache=answer_cache_for(backend),
+                                      answer_store=answer_store_for(backend),
+                                      checkpointer=checkpointer_for(backend))
+        
+        controller = AIMDController(concurrency, latency_tolerance=AIMD_LATENCY_TOLERANCE) if ADAPTIVE_CONCURRENCY else None
+        stats = asyncio.run(run_batch(workflow, items, output_path, concurrency, resume, controller=controller))
+        
+        print("\n" + "=" * 60)
+        print("📊 BATCH SUMMARY")
+        print("=" * 60)
+        print(f"Processed: {stats['processed']} ({stats['errors']} errors, {stats['skipped']} skipped as already done)")
+        print(f"Elapsed: {stats['elapsed_s']:.2f}s")
+        print(f"Throughput: {stats['throughput_qps']:.2f} questions/s")
+        print(f"Latency p50/p95/p99: {stats['p50_s']:.3f}s / {stats['p95_s']:.3f}s / {stats['p99_s']:.3f}s")
+        if controller is not None:
+            print(f"Adaptive concurrency: ended at {stats['final_concurrency']} of {concurrency} "
+                  f"({stats['throttles']} throttled calls)")
+        if hasattr(reasoner_llm, "cache"):
+            cache_stats = reasoner_llm.cache.stats()
+            print(f"LLM cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                  f"({cache_stats['hit_rate']:.0%} hit rate)")
+        if workflow.answer_store is not None:
+            store_stats = workflow.answer_store.stats()
+            print(f"Answer store: {store_stats['hits']} hits / {store_stats['misses']} misses "
+                  f"({store_stats['hit_rate']:.0%} hit rate, {store_stats['stale']} stale)")
+        if workflow.answer_cache is not None:
+            answer_stats = workflow.answer_cache.stats()
+            print(f"Answer cache: {answer_stats['hits']} hits / {answer_stats['misses']} misses "
+                  f"({answer_stats['hit_rate']:.0%} hit rate)")
+        print(f"Results: {output_path}")
+        
+    except Exception as e:
+        print(f"❌ Batch run failed: {e}")
+
+def run_server(backend: str, host: str = SERVER_HOST, port: int = SERVER_PORT,
+               mode: str = WORKFLOW_MODE):
+    """Serve one long-lived workflow over HTTP until interrupted."""
+    try:
+        # One workflow, one set of clients and caches for every request
+        workflow = MultiAgentWorkflow(make_llm(backend), make_reasoner(backend), mode=mode,
+                                      answer_cache=answer_cache_for(backend),
+                                      answer_store=answer_store_for(backend),
+                                      checkpointer=checkpointer_for(backend))
+        server = WorkflowServer(workflow, SERVER_CONCURRENCY, SERVER_QUEUE_SIZE, SERVER_MAX_BATCH)
+        
+        async def serve():
+            await server.start(host, port)
+            print(f"🌐 Serving on http://{host}:{server.port} ({backend} backend, "
+                  f"{SERVER_CONCURRENCY} concurrent, {SERVER_QUEUE_SIZE} queued)")
+            print("   POST /recommend, POST /batch, GET /metrics, GET /health (Ctrl+C to stop)")
+            await server.serve_forever()
+        
+        asyncio.run(serve())
+        
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
+    except Exception as e:
+        print(f"❌ Server failed: {e}")
+
+def run_interactive(backend: str, full_output: bool = False, mode: str = WORKFLOW_MODE):
     """Run the system in interactive mode."""
     try:
         print(f"🤖 Multi-Agent System Interactive Mode ({backend} backend)")
-        print("Type 'quit' or 'exit' to stop")
+        print("Type 'quit' or 'exit' to stop, 'new' to start a new conversation")
         if full_output:
             print("📋 Full output mode enabled")
         print("=" * 50)
@@ -124,7 +334,11 @@ def run_interactive(backend: str, full_output: bool = False):
         perception_llm = make_llm(backend)
         reasoner_llm = make_reasoner(backend)
         display_limit = FULL_OUTPUT_DISPLAY_LIMIT if full_output else DEFAULT_DISPLAY_LIMIT
-        workflow = MultiAgentWorkflow(perception_llm, reasoner_llm, display_limit)
+        workflow = MultiAgentWorkflow(perception_llm, reasoner_llm, display_limit, mode=mode,
+                                      answer_cache=answer_cache_for(backend),
+                                      answer_store=answer_store_for(backend))
+        # Follow-up questions see the earlier turns (bounded, older ones summarized)
+        session = Session(reasoner_llm)
         
         while True:
             try:
@@ -137,8 +351,13 @@ def run_interactive(backend: str, full_output: bool = False):
                 if not question:
                     continue
                 
+                if question.lower() == 'new':
+                    session.reset()
+                    print("🆕 New conversation")
+                    continue
+                
                 # Run workflow
-                workflow.run(question)
+                workflow.run(question, session=session)
                 
             except KeyboardInterrupt:
                 print("\n👋 Goodbye!")
@@ -172,21 +391,865 @@ def run_tests():
                 result = workflow.run(question, verbose=False)
                 
                 # Verify outputs
-                assert result.get("intent"), "Intent missing"
-                assert result.get("research_facts"), "Research facts missing"
-                assert result.get("analysis"), "Analysis missing"
-                assert result.get("decision"), "Decision missing"
+                _assert_complete(result)
                 
                 print(f"   ✅ Test {i} passed")
                 
             except Exception as e:
                 print(f"   ❌ Test {i} failed: {e}")
                 return
-        
+
+        extra_tests = [
+            ("async workflow (concurrent arun)", lambda: _test_async_workflow(workflow, test_questions)),
+            ("LLM response cache", lambda: _test_llm_cache(test_questions[0])),
+            ("knowledge base BM25 retrieval", _test_knowledge_base),
+            ("dense retrieval over memory-mapped embeddings", _test_dense_index),
+            ("streaming workflow events", lambda: _test_stream_events(workflow, test_questions[0])),
+            ("deterministic graph routing", _test_routing),
+            ("fast mode parsing and fallback", lambda: _test_fast_mode(test_questions[0])),
+            ("per-stage tracing and metrics export", lambda: _test_tracing(test_questions[0])),
+            ("simulated backend", lambda: _test_simulated_backend(test_questions[0])),
+            ("shared pooled client registry", _test_client_registry),
+            ("rate limiting, retries and adaptive concurrency", _test_rate_limiting),
+            ("singleflight coalescing", lambda: _test_coalescing(test_questions[0])),
+            ("semantic answer cache", _test_answer_cache),
+            ("precomputed answer store", _test_answer_store),
+            ("gazetteer perception fast path", _test_perception_fast_path),
+            ("incremental research fact parsing", _test_fact_stream),
+            ("stage checkpoints and resume", _test_checkpoint_resume),
+            ("hedged requests, deadlines and model cascade", _test_routing_layer),
+            ("HTTP service with SSE and backpressure", _test_http_server),
+            ("lazy imports and precompiled prompts", _test_lazy_startup),
+            ("multi-turn sessions with a rolling summary", _test_session),
+            ("per-entity research fan-out and KB prefetch", _test_research_fanout),
+            ("record/replay backend and trace driver", _test_record_replay),
+        ]
+        for i, (name, test) in enumerate(extra_tests, len(test_questions) + 1):
+            print(f"\n🧪 Test {i}: {name}")
+            try:
+                test()
+                print(f"   ✅ Test {i} passed")
+            except Exception as e:
+                print(f"   ❌ Test {i} failed: {e}")
+                return
+
         print("\n🎉 All tests passed! The multi-agent system is working correctly.")
         
     except Exception as e:
         print(f"❌ Tests failed: {e}")
 
+def _assert_complete(result):
+    assert result.get("intent"), "Intent missing"
+    assert result.get("research_facts"), "Research facts missing"
+    assert result.get("analysis"), "Analysis missing"
+    assert result.get("decision"), "Decision missing"
+
+def _research_calls(state):
+    """LLM calls the research stage made for ``state`` (one per entity when it fans out)."""
+    entities = state.get("entities") or []
+    return len(entities) if 2 <= len(entities) <= RESEARCH_FANOUT_MAX_ENTITIES else 1
+
+def _test_async_workflow(workflow, questions):
+    async def run_concurrently():
+        return await asyncio.gather(*(workflow.arun(q, verbose=False) for q in questions))
+
+    for result in asyncio.run(run_concurrently()):
+        _assert_complete(result)
+
+def _test_llm_cache(question):
+    cache = LLMCache(path=":memory:")
+    workflow = MultiAgentWorkflow(make_llm("fake", cache=cache), make_reasoner("fake", cache=cache))
+    first = workflow.run(question, verbose=False)
+    second = workflow.run(question, verbose=False)
+    _assert_complete(second)
+    assert second["decision"] == first["decision"], "Cached decision differs"
+    stats = cache.stats()
+    assert stats["misses"] == 4 and stats["hits"] == 4, f"Unexpected cache stats: {stats}"
+
+def _test_knowledge_base():
+    kb = KnowledgeBase.build(
+        {"text": fact, "topic": topic}
+        for topic, facts in KNOWLEDGE_BASE.items() for fact in facts
+    )
+    top = kb.search("Which Python web framework has an admin and ORM?", 1)
+    assert top and top[0].startswith("Django"), f"Unexpected top fact: {top}"
+    assert len(kb.search("python web frameworks", 6)) == 3, "Topic query should match every framework fact"
+
+def _test_dense_index():
+    kb = KnowledgeBase.build(
+        {"text": fact, "topic": topic}
+        for topic, facts in KNOWLEDGE_BASE.items() for fact in facts
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        dense = DenseIndex.load(build_dense_index(kb, os.path.join(tmp, "kb.dense.npy")))
+        assert dense.matrix.dtype == "float32" and dense.matrix.shape[0] == len(kb), "Bad matrix"
+        top = dense.search_scored("fanless quiet laptop", 1)
+        assert top and kb.facts[top[0][0]].startswith("MacBook Air"), f"Unexpected top fact: {top}"
+        del dense
+
+def _test_stream_events(workflow, question):
+    events = list(workflow.stream(question))
+    types = [e["type"] for e in events]
+    assert types[0] == "workflow_started" and types[-1] == "workflow_finished", f"Bad event order: {types}"
+    result = events[-1]["data"]
+    _assert_complete(result)
+    tokens = "".join(e["text"] for e in events if e["type"] == "token" and e["stage"] == "decision")
+    assert tokens.strip() == result["decision"], "Streamed tokens do not match decision"
+
+    async def collect():
+        return [e["type"] async for e in workflow.astream(question)]
+
+    assert asyncio.run(collect()) == types, "astream events differ from stream"
+
+def _test_routing():
+    assert route_next_step({"intent": "compare", "research_facts": []}) == "research"
+    assert route_next_step({"intent": "compare", "research_facts": ["f"], "step": "research"}) == "analysis"
+    assert route_next_step({"intent": "factual", "research_facts": ["f"], "step": "research"}) == "decision"
+    assert route_next_step({"intent": "compare", "research_facts": [], "step": "research"}) == "analysis"
+    assert route_next_step({"analysis": "a", "research_facts": ["f"]}) == "decision"
+    assert route_next_step({"analysis": "a", "decision": "d"}) == "done"
+
+def _test_fast_mode(question):
+    parsed = parse_fused('```json\n{"intent": "compare", "entities": ["MacBook Air"], '
+                         '"facts": ["f1"], "analysis": "a", "decision": "d"}\n```', question)
+    assert parsed and parsed["research_facts"] == ["f1"] and parsed["decision"] == "d", f"Bad parse: {parsed}"
+    assert parse_fused("not json", question) is None, "Unparseable output should return None"
+
+    # The fused call is capped like analysis plus decision, with room for the other fields
+    class CapSpy(FakeLLM):
+        def invoke(self, messages, **kwargs):
+            caps.append(kwargs.get("max_tokens"))
+            return super().invoke(messages, **kwargs)
+
+        async def ainvoke(self, messages, **kwargs):
+            caps.append(kwargs.get("max_tokens"))
+            return super().invoke(messages)
+
+    caps = []
+    run_fused(question, [], CapSpy())
+    asyncio.run(arun_fused(question, [], CapSpy()))
+    if MAX_ANALYSIS_LENGTH > 0 and MAX_DECISION_LENGTH > 0:
+        assert len(caps) == 2 and all(cap and cap > MAX_ANALYSIS_LENGTH + MAX_DECISION_LENGTH for cap in caps), f"Fused call not capped: {caps}"
+
+    # FakeLLM output is not JSON, so fast mode must fall back to the full pipeline
+    workflow = MultiAgentWorkflow(make_llm("fake"), make_reasoner("fake"), mode="fast")
+    result = workflow.run(question, verbose=False)
+    _assert_complete(result)
+    assert result.get("step") == "decision", "Fast mode did not fall back to the full pipeline"
+
+def _test_tracing(question):
+    metrics.reset()
+    workflow = MultiAgentWorkflow(make_llm("fake"), make_reasoner("fake"))
+    workflow.run(question, verbose=False)
+    summary = metrics.summary()
+    stages = {h["labels"].get("stage") for h in summary["histograms"] if h["name"] == "agent_stage_duration_seconds"}
+    assert {"workflow", "perception", "research", "analysis", "decision"} <= stages, f"Missing spans: {stages}"
+    counters = {(c["name"], c["labels"].get("stage"), c["labels"].get("kind")): c["value"] for c in summary["counters"]}
+    assert counters.get(("agent_llm_calls_total", "decision", None)) == 1, "Decision call not counted"
+    assert counters.get(("agent_prompt_tokens_total", "research", None), 0) > 0, "Prompt tokens not estimated"
+    # FakeLLM output is not JSON, so perception must record its fallback
+    assert counters.get(("agent_parse_fallbacks_total", "perception", "perception_json")) == 1, "Fallback not counted"
+    text = metrics.to_prometheus()
+    assert 'agent_stage_duration_seconds_bucket{stage="decision",le="+Inf"} 1' in text, "Bad Prometheus export"
+
+def _test_simulated_backend(question):
+    llm = SimulatedLLM("sim", seed=7, latency_ms=1, tokens_per_second=0)
+    state = MultiAgentWorkflow(llm, llm).run(question, verbose=False)
+    _assert_complete(state)
+    assert state["intent"] == "compare" and "MacBook Air" in state["entities"], "Perception JSON not parsed"
+    assert 3 <= len(state["research_facts"]) <= 6, "Research JSON not parsed"
+
+    messages = [("system", "You are Decision."), ("human", question)]
+    again = SimulatedLLM("sim", seed=7, latency_ms=1, tokens_per_second=0)
+    assert llm.invoke(messages).content == again.invoke(messages).content, "Output not seeded"
+    assert "".join(c.content for c in llm.stream(messages)) == llm.invoke(messages).content, "Stream differs"
+    samples = [SimulatedLLM(seed=3)._sample()[0] for _ in range(2)]
+    assert samples[0] == samples[1], "Latency not seeded"
+
+    failing = SimulatedLLM(error_rate=1.0, latency_ms=0)
+    try:
+        failing.invoke(messages)
+        raise AssertionError("Error injection did not raise")
+    except SimulatedLLMError as e:
+        assert e.status_code == 503
+
+def _test_client_registry():
+    import core.llm_factory as llm_factory
+    from benchmarks.stub_server import StubServer
+
+    saved = {name: os.environ.get(name) for name in ("GROQ_API_KEY", "GROQ_BASE_URL", "GROQ_REASONER_MODEL")}
+    server = StubServer().start()
+    try:
+        os.environ.update(GROQ_API_KEY="stub-key", GROQ_BASE_URL=server.base_url)
+        os.environ.pop("GROQ_REASONER_MODEL", None)
+        shutdown_clients()
+        llm, reasoner = make_llm("groq", cache=False), make_reasoner("groq", cache=False)
+        client = get_client("groq", llm_factory.GROQ_MODEL, llm_factory.TEMPERATURE)
+        assert unwrap(llm) is client and unwrap(reasoner) is client, "Client not shared"
+
+        for agent in (llm, reasoner, llm):
+            assert agent.invoke([("human", "ping")]).content == "Stub response"
+        assert server.requests == 3 and len(server.connections) == 1, f"Connections not reused: {server.connections}"
+
+        async def sequential_calls():
+            for agent in (llm, reasoner):
+                await agent.ainvoke([("human", "ping")])
+        asyncio.run(sequential_calls())
+        assert len(server.connections) == 2, "Async calls did not share one keep-alive connection"
+
+        # Each finished loop closes its pool and sockets
+        transport = llm_factory._http_pool._transport
+        open_before = server.open_connections
+        for _ in range(5):
+            asyncio.run(llm.ainvoke([("human", "ping")]))
+        deadline = time.monotonic() + 2
+        while server.open_connections > open_before and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not transport._pools and server.open_connections == open_before, \
+            f"Pools of finished loops leaked: {len(transport._pools)} pools, {server.open_connections} open"
+
+        pid = os.fork()
+        if pid == 0:
+            # A forked worker must not inherit the parent's clients or sockets
+            os._exit(0 if not llm_factory._clients and llm_factory._http_pool is None else 1)
+        assert os.waitpid(pid, 0)[1] == 0, "Registry survived fork"
+        assert llm_factory._clients, "Fork handler cleared the parent's registry"
+    finally:
+        shutdown_clients()
+        server.stop()
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def _test_rate_limiting():
+    class Flaky(FakeLLM):
+        """Throttles the first ``failures`` calls, asking for a short Retry-After."""
+        def __init__(self, failures, status_code=429):
+            super().__init__("flaky")
+            self.failures, self.status_code, self.calls = failures, status_code, 0
+
+        async def ainvoke(self, messages):
+            self.calls += 1
+            if self.calls <= self.failures:
+                error = SimulatedLLMError("rate limited", status_code=self.status_code)
+                error.retry_after = 0.01
+                raise error
+            return self.invoke(messages)
+
+    controller = AIMDController(max_limit=8)
+    flaky = Flaky(failures=2)
+    llm = RateLimitedLLM(flaky, RateLimiter(), max_retries=3, backoff_base=0.01)
+
+    async def one_question():
+        async with controller.slot():
+            return await llm.ainvoke([("human", "ping")])
+    assert asyncio.run(one_question()).content == "Mock response from flaky" and flaky.calls == 3
+    assert controller.throttles == 2 and controller.limit == 4, f"AIMD did not back off once: {controller.limit}"
+
+    try:
+        asyncio.run(RateLimitedLLM(Flaky(failures=1, status_code=400), RateLimiter()).ainvoke([("human", "x")]))
+        raise AssertionError("Non-retryable error was retried")
+    except SimulatedLLMError as e:
+        assert e.status_code == 400
+
+    # 120 RPM = 2 requests/s with a one-minute burst: request 121 waits ~0.5s
+    limiter = RateLimiter(rpm=120)
+    waits = [limiter.reserve(10) for _ in range(121)]
+    assert waits[119] == 0 and 0.45 < waits[120] <= 0.5, f"Bad bucket wait: {waits[120]}"
+
+    controller.on_success(1.0)
+    assert controller.limit > 4, "AIMD did not increase after a success"
+
+class CallCounter(LLMWrapper):
+    """Test helper counting the requests that reach the wrapped LLM."""
+    def __init__(self, llm):
+        super().__init__(llm)
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return self.llm.invoke(messages, **kwargs)
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        return await self.llm.ainvoke(messages, **kwargs)
+
+def _test_coalescing(question):
+    from concurrent.futures import ThreadPoolExecutor
+
+    variants = [question, question.upper(), f"  {question}?", question, question]
+
+    llm = CallCounter(SimulatedLLM(latency_ms=50, latency_sigma=0, tokens_per_second=0))
+    workflow = MultiAgentWorkflow(llm, llm, coalesce=True)
+    async def concurrent_runs():
+        return await asyncio.gather(*(workflow.arun(q, verbose=False) for q in variants))
+    states = asyncio.run(concurrent_runs())
+    expected = 3 + _research_calls(states[0])
+    assert llm.calls == expected, f"Async duplicates were not coalesced: {llm.calls} calls"
+    states[0]["research_facts"].append("mutated")
+    assert all(s["decision"] == states[0]["decision"] for s in states), "Callers got different answers"
+    assert "mutated" not in states[1]["research_facts"], "Callers share one Memory object"
+
+    llm.calls = 0
+    with ThreadPoolExecutor(len(variants)) as pool:
+        states = list(pool.map(lambda q: workflow.run(q, verbose=False), variants))
+    assert llm.calls == expected, f"Threaded duplicates were not coalesced: {llm.calls} calls"
+    assert len({id(s) for s in states}) == len(states), "Callers share one Memory object"
+
+    # Stage level: identical prompts from unrelated callers share one request
+    base = CallCounter(SimulatedLLM(latency_ms=50, latency_sigma=0, tokens_per_second=0))
+    coalescing = CoalescingLLM(base, SingleFlight())
+    async def same_prompt():
+        return await asyncio.gather(*(coalescing.ainvoke([("human", question)]) for _ in range(3)))
+    assert len({r.content for r in asyncio.run(same_prompt())}) == 1 and base.calls == 1, "Prompts not coalesced"
+
+def _test_answer_cache():
+    sim = SimulatedLLM(latency_ms=0, tokens_per_second=0)
+    cache = AnswerCache(threshold=0.5)
+    workflow = MultiAgentWorkflow(sim, sim, answer_cache=cache)
+
+    first = workflow.run("Compare MacBook Air vs Pro for development", verbose=False)
+    assert first["step"] == "decision" and cache.stats()["stores"] == 1
+
+    # Same intent and entities, similar wording: perception only
+    again = workflow.run("Compare MacBook Air vs Pro for development work", verbose=False)
+    assert again["step"] == "answer_cache", f"Expected a cache hit, got step {again['step']}"
+    assert again["decision"] == first["decision"] and again["research_facts"] == first["research_facts"]
+    assert again["messages"][-1]["role"] == "agent/answer_cache"
+
+    # Same entities but unrelated wording stays below the similarity threshold
+    other = workflow.run("Compare MacBook Air vs Pro battery life on flights", verbose=False)
+    assert other["step"] == "decision", "Dissimilar question was served from the cache"
+
+    # Entries built from another version of the knowledge base are dropped
+    key_state = dict(first, normalized_question="Compare MacBook Air vs Pro for development")
+    assert cache.get(key_state["intent"], key_state["entities"], key_state["normalized_question"], "old-kb") is None
+    assert cache.stats()["invalidations"] >= 1
+
+    ttl_cache = AnswerCache(ttl=0.01)
+    ttl_cache.set(first, "kb")
+    time.sleep(0.02)
+    assert ttl_cache.get(first["intent"], first["entities"], first["normalized_question"], "kb") is None, "TTL ignored"
+
+def _test_answer_store():
+    questions = canonical_questions({"web": ["FastAPI", "Django", "Flask"], "general": None}, max_entities=2)
+    assert "Compare FastAPI vs Django" in questions and "What is Flask?" in questions
+    assert len(questions) == 3 * 2 + 3 * 2, f"Unexpected canonical questions: {questions}"
+
+    sim = SimulatedLLM(latency_ms=0, tokens_per_second=0)
+    builder = MultiAgentWorkflow(sim, sim, coalesce=False)
+    states, errors = asyncio.run(precompute_answers(builder, ["Compare MacBook Air vs MacBook Pro",
+                                                              "What is FastAPI?"], concurrency=2))
+    assert errors == 0 and len(states) == 2
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "answers.store")
+        assert write_answer_store(path, states + [{"intent": "general_query", "entities": ["x"], "decision": "d"}],
+                                  kb_fingerprint(), "sim") == 2, "Unparsed run was stored"
+        store = AnswerStore(path, threshold=0.5)
+        assert len(store) == 2 and store.backend == "sim" and store.fresh(kb_fingerprint())
+
+        # Same intent and entities, similar wording: answered from the store after perception
+        llm = CallCounter(SimulatedLLM(latency_ms=0, tokens_per_second=0))
+        workflow = MultiAgentWorkflow(llm, llm, answer_store=store)
+        hit = workflow.run("Compare the MacBook Pro vs MacBook Air", verbose=False)
+        assert hit["step"] == "answer_store", f"Expected a store hit, got step {hit['step']}"
+        assert hit["decision"] == states[0]["decision"] and llm.calls == 0, f"{llm.calls} LLM calls on a store hit"
+        assert hit["messages"][-1]["role"] == "agent/answer_store"
+        miss = workflow.run("Is Django or Flask better for REST APIs?", verbose=False)
+        assert miss["step"] == "decision" and store.stats()["misses"] == 1
+
+        # Same key, different question: the wording check keeps the canned answer out
+        assert store.get("explain", ["FastAPI"], "What is FastAPI?", kb_fingerprint()) is not None
+        reworded = store.get("explain", ["FastAPI"], "How do FastAPI dependency overrides work in tests?",
+                             kb_fingerprint())
+        assert reworded is None and store.stats()["misses"] == 2, "Differently worded question hit the store"
+
+        # A changed knowledge base invalidates every entry
+        assert store.get("compare", ["MacBook Air", "MacBook Pro"], "Compare MacBook Air vs MacBook Pro", "other-kb") is None
+        assert store.stats()["stale"] == 1
+        store.close()
+
+        with open(path, "r+b") as f:
+            f.write(b"NOTSTORE")
+        try:
+            AnswerStore(path)
+            assert False, "Corrupt store was opened"
+        except ValueError:
+            pass
+
+def _test_perception_fast_path():
+    gazetteer = Gazetteer(["MacBook Air", "MacBook Pro", "Air", "Go"])
+    assert gazetteer.entities("macbook air or MacBook  Pro?") == ["MacBook Air", "MacBook Pro"], "Longest match not preferred"
+    assert gazetteer.entities("Good airflow") == [], "Matched inside a word"
+
+    result, confidence = local_perception("Is FastAPI or Django better for REST APIs?")
+    assert result["intent"] == "compare" and result["entities"] == ["FastAPI", "Django"] and confidence >= 0.75
+    assert set(result) == {"intent", "entities", "normalized_question"}
+    assert local_perception("How should I choose between different programming languages?")[1] < 0.75
+
+    llm = CallCounter(SimulatedLLM(latency_ms=0, tokens_per_second=0))
+    workflow = MultiAgentWorkflow(llm, llm)
+    before = metrics.counters.get(("agent_fast_path_total", (("outcome", "hit"), ("stage", "perception"))), 0)
+    state = workflow.run("MacBook Air vs MacBook Pro for development", verbose=False)
+    assert state["step"] == "decision" and state["entities"] == ["MacBook Air", "MacBook Pro"]
+    # Research fans out to one call per entity
+    assert llm.calls == 2 + _research_calls(state), f"Perception LLM was not skipped: {llm.calls} calls"
+    after = metrics.counters.get(("agent_fast_path_total", (("outcome", "hit"), ("stage", "perception"))), 0)
+    assert after == before + 1, "Fast path hit not counted"
+
+    # Low confidence falls through to the LLM
+    llm.calls = 0
+    workflow.run("What are the best Python web frameworks?", verbose=False)
+    assert llm.calls == 4, f"Expected the LLM perception call, got {llm.calls} calls"
+
+def _test_fact_stream():
+    parser = FactStreamParser()
+    output = '```json\n["Air is fanless, \\"quiet\\"", {"k": [1, 2]}, "Pro has fans"]\n```'
+    assert parser.feed(output[:8]) == [], "Fence was parsed as a fact"
+    first = parser.feed(output[8:36])
+    assert first == ['Air is fanless, "quiet"'], f"Fact not returned at its closing quote: {first}"
+    assert parser.feed(output[36:]) == [{"k": [1, 2]}, "Pro has fans"] and parser.done
+    assert parser.close() == [] and parser.feed('["ignored"]') == []
+
+    lines = FactStreamParser(max_line_facts=2)
+    assert lines.feed("Facts:\n- one\n") == ["one"] and not lines.in_array
+    assert lines.feed("- two\n- three") + lines.close() == ["two"], "Line facts not capped"
+    preamble = FactStreamParser()
+    assert preamble.feed('Here is the JSON array you asked for:\n["a", "b"') == ["a", "b"], "Preamble kept"
+    assert preamble.close() == [] and not preamble.done
+
+    sim = SimulatedLLM(latency_ms=0, tokens_per_second=0)
+    workflow = MultiAgentWorkflow(sim, sim, coalesce=False)
+    question = "Compare MacBook Air vs Pro for development"
+    events = list(workflow.stream(question))
+    facts = [e["data"] for e in events if e["type"] == "fact"]
+    state = events[-1]["data"]
+    assert facts and facts == state["research_facts"], "Fact events differ from the research facts"
+    assert facts == workflow.run(question, verbose=False)["research_facts"], "Streamed parse differs from invoke"
+
+    async def collect():
+        return [e["data"] async for e in workflow.astream(question) if e["type"] == "fact"]
+    assert asyncio.run(collect()) == facts, "astream facts differ from stream"
+
+def _test_checkpoint_resume():
+    class FailingDecision(CallCounter):
+        """Fails every decision call while ``fail`` is set."""
+        fail = True
+
+        def invoke(self, messages, **kwargs):
+            if self.fail and current_stage() == "decision":
+                raise SimulatedLLMError("decision unavailable")
+            return super().invoke(messages, **kwargs)
+
+        async def ainvoke(self, messages, **kwargs):
+            if self.fail and current_stage() == "decision":
+                raise SimulatedLLMError("decision unavailable")
+            return await super().ainvoke(messages, **kwargs)
+
+    question = "Compare MacBook Air vs Pro for development"
+    llm = FailingDecision(SimulatedLLM(latency_ms=0, tokens_per_second=0))
+    checkpoints = Checkpointer()
+    workflow = MultiAgentWorkflow(llm, llm, checkpointer=checkpoints)
+    try:
+        workflow.run(question, verbose=False, run_id="run-1")
+        raise AssertionError("Decision failure did not propagate")
+    except SimulatedLLMError:
+        pass
+    saved = checkpoints.load("run-1")
+    assert saved["step"] == "analysis" and saved["run_id"] == "run-1", f"Bad checkpoint: {saved.get('step')}"
+
+    llm.fail, llm.calls = False, 0
+    state = workflow.resume("run-1", verbose=False)
+    _assert_complete(state)
+    assert llm.calls == 1, f"Resume repeated completed stages: {llm.calls} calls"
+    assert state["research_facts"] == saved["research_facts"] and state["run_id"] == "run-1"
+    assert workflow.resume("run-1", verbose=False)["decision"] == state["decision"] and llm.calls == 1
+
+    llm.fail = True
+    try:
+        asyncio.run(workflow.arun(question, verbose=False, run_id="run-2"))
+    except SimulatedLLMError:
+        pass
+    llm.fail, llm.calls = False, 0
+    assert asyncio.run(workflow.aresume("run-2", verbose=False))["decision"] and llm.calls == 1
+    assert checkpoints.stats()["runs"] == 2
+
+    # --batch twice: the question whose decision failed continues from its checkpoint
+    items = [{"id": "q1", "question": question}]
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "results.jsonl")
+        llm.fail, llm.calls = True, 0
+        first = asyncio.run(run_batch(workflow, items, output))
+        assert first["errors"] == 1 and checkpoints.load(batch_run_id(items[0]))["step"] == "analysis"
+        llm.fail, llm.calls = False, 0
+        second = asyncio.run(run_batch(workflow, items, output))
+        assert second["errors"] == 0 and llm.calls == 1, f"Batch rerun repeated stages: {llm.calls} calls"
+
+    try:
+        workflow.resume("missing", verbose=False)
+        raise AssertionError("Unknown run resumed")
+    except ValueError:
+        pass
+
+def _test_routing_layer():
+    class SlowFirst(FakeLLM):
+        """Takes ``delay`` seconds on its first call and answers instantly afterwards."""
+        def __init__(self, delay):
+            super().__init__("slow-first")
+            self.delay, self.calls = delay, 0
+
+        def invoke(self, messages, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                time.sleep(self.delay)
+            return super().invoke(messages)
+
+        async def ainvoke(self, messages, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                await asyncio.sleep(self.delay)
+            return super().invoke(messages)
+
+    tracker = LatencyTracker(min_samples=1)
+    tracker.observe(("slow-first", "unscoped"), 0.01)
+    start = time.perf_counter()
+    hedged = HedgedLLM(SlowFirst(1.0), min_delay=0.05, tracker=tracker)
+    assert hedged.invoke([("human", "ping")]).content == "Mock response from slow-first"
+    assert time.perf_counter() - start < 0.5 and hedged.llm.calls == 2, "Slow call was not hedged"
+    start = time.perf_counter()
+    hedged = HedgedLLM(SlowFirst(1.0), min_delay=0.05, tracker=tracker)
+    asyncio.run(hedged.ainvoke([("human", "ping")]))
+    assert time.perf_counter() - start < 0.5 and hedged.llm.calls == 2, "Slow async call was not hedged"
+
+    unhedged = HedgedLLM(SlowFirst(1.0), hedge=False)
+    for call in (lambda: unhedged.invoke([("human", "ping")]),
+                 lambda: asyncio.run(unhedged.ainvoke([("human", "ping")]))):
+        unhedged.llm.calls, start = 0, time.perf_counter()
+        try:
+            with deadline_scope(0.1):
+                call()
+            raise AssertionError("Deadline not enforced")
+        except DeadlineExceeded:
+            assert time.perf_counter() - start < 0.5, "Deadline enforced late"
+
+    class StalledStream(FakeLLM):
+        def stream(self, messages, **kwargs):
+            time.sleep(1.0)
+            yield from super().stream(messages)
+
+    start = time.perf_counter()
+    try:
+        with deadline_scope(0.1):
+            list(HedgedLLM(StalledStream("stalled"), hedge=False).stream([("human", "ping")]))
+        raise AssertionError("Stream deadline not enforced")
+    except DeadlineExceeded:
+        assert time.perf_counter() - start < 0.5, "Stalled stream overran its deadline"
+    with deadline_scope(5):
+        assert "".join(c.content for c in HedgedLLM(FakeLLM("s")).stream([("human", "ping")])) == "Mock response from s"
+
+    # Time spent queued for a worker does not start the hedge timer
+    saved_executor, routing._executor = routing._executor, ThreadPoolExecutor(max_workers=1)
+    try:
+        routing._executor.submit(time.sleep, 0.3)
+        counted = HedgedLLM(CallCounter(FakeLLM("slow-first")), min_delay=0.05, tracker=tracker)
+        counted.invoke([("human", "ping")])
+        assert counted.llm.calls == 1, "Queue time triggered a hedge"
+    finally:
+        routing._executor.shutdown()
+        routing._executor = saved_executor
+
+    sim = SimulatedLLM(latency_ms=0, tokens_per_second=0)
+    cheap, strong = CallCounter(FakeLLM("cheap")), CallCounter(sim)
+    cascade = CascadeLLM(strong, cheap, strong, ["perception"])
+    with stage_scope("perception"):
+        content = cascade.invoke([("system", "You are Perception."), ("human", "MacBook Air vs Pro")]).content
+    assert json.loads(content)["intent"] and cheap.calls == 1 and strong.calls == 1, "Invalid output not escalated"
+    cascade = CascadeLLM(strong, CallCounter(sim), strong, ["perception"])
+    strong.calls = 0
+    with stage_scope("perception"):
+        cascade.invoke([("system", "You are Perception."), ("human", "MacBook Air vs Pro")])
+    assert cascade.cheap.calls == 1 and strong.calls == 0, "Valid cheap output was escalated"
+    cascade.invoke([("human", "ping")])
+    assert strong.calls == 1 and cascade.cheap.calls == 1, "Non-cascade stage did not use the default model"
+
+def _test_http_server():
+    from benchmarks.serve import HTTPClient, sse_events
+
+    question = "Compare MacBook Air vs Pro for development"
+
+    async def exercise():
+        workflow = MultiAgentWorkflow(make_llm("fake"), make_reasoner("fake"))
+        server = await WorkflowServer(workflow, concurrency=2, queue_size=0, max_batch=4).start("127.0.0.1", 0)
+        client = HTTPClient("127.0.0.1", server.port)
+        try:
+            status, headers, body = await client.request("POST", "/recommend", {"question": question})
+            assert status == 200 and headers["connection"] == "keep-alive", f"/recommend returned {status}"
+            _assert_complete(json.loads(body))
+
+            status, headers, body = await client.request("POST", "/recommend?stream=1", {"question": question})
+            events = sse_events(body)
+            assert headers["content-type"] == "text/event-stream", "Stream not sent as SSE"
+            assert events[0][0] == "workflow_started" and events[-1][0] == "workflow_finished", "SSE events incomplete"
+            _assert_complete(events[-1][1]["data"])
+
+            status, _, body = await client.request("POST", "/batch", {"questions": [question, "Best Python web frameworks?"]})
+            results = json.loads(body)["results"]
+            assert status == 200 and [r["id"] for r in results] == ["1", "2"] and all(r["decision"] for r in results)
+            assert (await client.request("POST", "/batch", {"questions": [question] * 5}))[0] == 413
+            assert (await client.request("POST", "/recommend", {}))[0] == 400
+            assert (await client.request("GET", "/recommend"))[0] == 405
+            assert (await client.request("GET", "/missing"))[0] == 404
+            assert json.loads((await client.request("GET", "/health"))[2])["status"] == "ok"
+            status, headers, _ = await client.request("GET", "/metrics")
+            assert status == 200 and headers["content-type"].startswith("text/plain")
+
+            # Two slots and no queue: a third concurrent question is rejected at once
+            sim = SimulatedLLM(latency_ms=200, latency_sigma=0, tokens_per_second=0)
+            server.workflow = MultiAgentWorkflow(sim, sim)
+            clients = [HTTPClient("127.0.0.1", server.port) for _ in range(3)]
+            responses = await asyncio.gather(*(c.request("POST", "/recommend", {"question": f"{question} {i}"})
+                                               for i, c in enumerate(clients)))
+            assert sorted(r[0] for r in responses) == [200, 200, 503], "Full server did not reject"
+            assert all(r[1].get("retry-after") for r in responses if r[0] == 503), "503 without Retry-After"
+            assert server.admitted == 0, "Admission slots leaked"
+            for c in clients:
+                await c.close()
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(exercise())
+
+def _test_lazy_startup():
+    import subprocess
+    import sys
+    from langchain_core.prompts import ChatPromptTemplate
+    from core.prompts import ChatPrompt
+
+    # Importing the CLI must not pay for the LangChain stack or numpy
+    heavy = ["langchain_groq", "langgraph", "langchain_core", "numpy"]
+    code = f"import sys, main; print([m for m in {heavy!r} if m in sys.modules])"
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]", f"import main loaded {out.strip()}"
+
+    messages = [("system", "Be {tone!s}. Braces: {{x}}"), ("user", "Q: {question}\nScore: {score:.2f}")]
+    fields = {"tone": "brief", "question": "Which laptop?", "score": 0.5}
+    ours = ChatPrompt.from_messages(messages)
+    theirs = ChatPromptTemplate.from_messages(messages)
+    assert ours.input_variables == sorted(theirs.input_variables), "Input variables differ"
+    assert [(m.type, m.content) for m in ours.format_messages(**fields)] == \
+           [(m.type, m.content) for m in theirs.format_messages(**fields)], "Formatted prompt differs from LangChain"
+    try:
+        ours.format_messages(tone="brief")
+        raise AssertionError("Missing prompt variable not reported")
+    except KeyError:
+        pass
+
+def _test_session():
+    from core.memory import message_content
+    from core.tokens import estimate_tokens
+
+    class PromptSpy(FakeLLM):
+        def __init__(self):
+            super().__init__()
+            self.prompts = []
+
+        def invoke(self, messages, **kwargs):
+            self.prompts.append(messages[-1].content)
+            return super().invoke(messages, **kwargs)
+
+    perception = PromptSpy()
+    workflow = MultiAgentWorkflow(perception, make_reasoner("fake"), coalesce=False)
+    session = Session(None, budget=80, summary_budget=40)
+    first = workflow.run("Compare MacBook Air vs Pro for development", verbose=False, session=session)
+    assert "context" not in first, "First turn carried context"
+    # Transcript entries reference the stage outputs instead of copying them
+    assert all("content" not in m for m in first["messages"] if m["role"] != "user"), "Stage output copied into messages"
+    decision_entry = next(m for m in first["messages"] if m["role"] == "agent/decision")
+    assert message_content(first, decision_entry) == {"decision": first["decision"]}
+
+    followup = workflow.run("and for battery life?", verbose=False, session=session)
+    assert followup["context"].startswith("User: Compare MacBook Air vs Pro"), "Follow-up lost the earlier turn"
+    assert "Conversation so far" in perception.prompts[-1], "Perception did not see the session"
+
+    # A follow-up naming KB entities still goes to the LLM when it refers back ("that")
+    calls = len(perception.prompts)
+    workflow.run("how do Flask and FastAPI compare on that?", verbose=False, session=session)
+    assert len(perception.prompts) == calls + 1 and "Conversation so far" in perception.prompts[-1], \
+        "Anaphoric follow-up took the local fast path"
+    # Without a reference back, the fast path still answers
+    calls = len(perception.prompts)
+    workflow.run("Compare Flask vs FastAPI", verbose=False, session=session)
+    assert len(perception.prompts) == calls, "Standalone follow-up skipped the fast path"
+
+    for i in range(20):
+        workflow.run(f"Which is better for beginners, option {i}?", verbose=False, session=session)
+    assert session.turn_count == 24 and len(session.turns) < 24, "Old turns were not folded"
+    assert session.summary, "No rolling summary"
+    # Bounded: the context stays within both budgets (plus the "Summary: " prefix and newlines)
+    assert estimate_tokens(session.context()) <= 80 + 40 + 10, "Session context grew past its budget"
+
+    # With an LLM, folding calls the summarizer once per overflow and caps its output
+    sim = SimulatedLLM(latency_ms=0, latency_sigma=0, tokens_per_second=0)
+    summarized = Session(sim, budget=60, summary_budget=30)
+    for i in range(6):
+        summarized.record({"normalized_question": f"Question {i} about FastAPI and Django",
+                           "decision": "Pick FastAPI for async APIs. Django suits full sites. " * 3})
+    assert summarized.summary and estimate_tokens(summarized.summary) <= 30, "Summary exceeded its budget"
+    summarized.reset()
+    assert summarized.context() == ""
+
+def _test_research_fanout():
+    import agents.research as research
+    from agents.research import gather_research, agather_research, merge_facts, prefetch_kb_facts
+
+    merged = merge_facts([["Django has an ORM.", "Django ships an admin."],
+                          ["Flask is minimal.", "django has an ORM"],
+                          ["FastAPI is async."]], "Django vs Flask vs FastAPI", limit=4)
+    assert merged == ["Django has an ORM.", "Flask is minimal.", "FastAPI is async.", "Django ships an admin."], merged
+
+    class PerEntityLatency(FakeLLM):
+        """Takes ``delay`` seconds per entity the prompt asks about."""
+        def __init__(self, delay, failing=()):
+            super().__init__()
+            self.delay, self.failing, self.prompts = delay, failing, []
+
+        def _answer(self, messages):
+            prompt = messages[-1].content
+            self.prompts.append(prompt)
+            entity = prompt.split("Entity: ", 1)[1].split("\n", 1)[0] if "Entity: " in prompt else None
+            if entity in self.failing:
+                raise SimulatedLLMError(f"{entity} unavailable")
+            return entity, 1 if entity else prompt.count("'") // 2, json.dumps([f"{entity or 'All'} fact {i}" for i in range(3)])
+
+        def invoke(self, messages, **kwargs):
+            entity, n, content = self._answer(messages)
+            time.sleep(self.delay * n)
+            return type("MockResponse", (), {"content": content})()
+
+        async def ainvoke(self, messages, **kwargs):
+            entity, n, content = self._answer(messages)
+            await asyncio.sleep(self.delay * n)
+            return type("MockResponse", (), {"content": content})()
+
+    question, entities = "Django vs Flask vs FastAPI vs Starlette for APIs", ["Django", "Flask", "FastAPI", "Starlette"]
+    llm = PerEntityLatency(0.1)
+    start = time.perf_counter()
+    facts = gather_research(question, entities, llm)
+    elapsed = time.perf_counter() - start
+    # One entity's latency, not four
+    assert elapsed < 0.25 and len(llm.prompts) == 4, f"Fan-out took {elapsed:.2f}s over {len(llm.prompts)} calls"
+    assert len(facts) == MAX_RESEARCH_FACTS and {f.split()[0] for f in facts[:4]} == set(entities), facts
+    start = time.perf_counter()
+    assert asyncio.run(agather_research(question, entities, llm)) == facts
+    assert time.perf_counter() - start < 0.25, "Async fan-out ran serially"
+
+    # A failed entity is left out; all failing raises
+    partial = gather_research(question, entities, PerEntityLatency(0, failing=("Flask",)))
+    assert partial and not any(f.startswith("Flask") for f in partial)
+    try:
+        gather_research(question, entities[:2], PerEntityLatency(0, failing=tuple(entities)))
+        raise AssertionError("Research with every entity failing did not raise")
+    except SimulatedLLMError:
+        pass
+    # One entity keeps the single call
+    llm = PerEntityLatency(0)
+    gather_research("Is Django good for APIs?", ["Django"], llm)
+    assert len(llm.prompts) == 1 and "Entities: " in llm.prompts[0]
+
+    # KB lookup started during perception is reused when research asks for the same query
+    key = ("agent_fast_path_total", (("outcome", "hit"), ("stage", "kb_prefetch")))
+    before = metrics.counters.get(key, 0)
+    research._prefetched.clear()
+    prefetch_kb_facts("Compare  MacBook Air vs Pro for development?")
+    assert len(research._prefetched) == 1, "Prefetch not started"
+    gather_research("compare MacBook Air vs Pro for development", ["MacBook Air"], PerEntityLatency(0))
+    assert metrics.counters.get(key, 0) == before + 1 and not research._prefetched, "Prefetched lookup not reused"
+
+    # Each fan-out call gets a KB slice built for its own entity
+    llm = PerEntityLatency(0)
+    gather_research("Compare Django, Flask and FastAPI", ["Django", "Flask", "FastAPI"], llm)
+    slices = {p.split("Entity: ", 1)[1].split("\n", 1)[0]: p.split("KB you may use:", 1)[1] for p in llm.prompts}
+    assert len(set(slices.values())) == 3, "Fan-out entities got identical KB facts"
+    assert "Flask is minimal" not in slices["Django"] and "Django is batteries-included" not in slices["Flask"]
+
+    # A fanning-out question prefetches one lookup per entity, and research uses them
+    before = metrics.counters.get(key, 0)
+    research._prefetched.clear()
+    prefetch_kb_facts("Compare Django vs Flask vs FastAPI")
+    assert len(research._prefetched) == 3, f"{len(research._prefetched)} prefetched lookups"
+    gather_research("Compare Django vs Flask vs FastAPI", ["Django", "Flask", "FastAPI"], PerEntityLatency(0))
+    assert metrics.counters.get(key, 0) == before + 3 and not research._prefetched, "Per-entity prefetch not reused"
+
+    # The async path waits for a pending prefetch without blocking the event loop
+    pending = Future()
+    research._prefetched[research._query_key(research._kb_query("Is Django good?", ["Django"]))] = pending
+    threading.Timer(0.1, pending.set_result, (["Prefetched Django fact."],)).start()
+    async def research_while_ticking():
+        ticks = 0
+        task = asyncio.ensure_future(agather_research("Is Django good?", ["Django"], llm))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks
+    assert asyncio.run(research_while_ticking()) >= 5, "Prefetch wait blocked the event loop"
+    assert "Prefetched Django fact." in llm.prompts[-1]
+
+    # End to end (perception takes the fast path): one research call per entity
+    sim = CallCounter(SimulatedLLM(latency_ms=0, tokens_per_second=0))
+    state = MultiAgentWorkflow(sim, sim).run("Compare Django vs Flask vs FastAPI", verbose=False)
+    _assert_complete(state)
+    assert state["entities"] == ["Django", "Flask", "FastAPI"] and sim.calls == 2 + 3, f"{sim.calls} calls"
+
+def _test_record_replay():
+    from benchmarks.replay import replay
+    from core.replay import RecordingLLM
+
+    questions = ["Compare MacBook Air vs Pro for development", "How should I choose between different programming languages?"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trace.llmt")
+        writer = start_recording(path)
+        try:
+            sim = RecordingLLM(SimulatedLLM(latency_ms=20, latency_sigma=0, tokens_per_second=0), writer)
+            recorded = [MultiAgentWorkflow(sim, sim).run(q, verbose=False) for q in questions]
+        finally:
+            stop_recording()
+
+        trace = Trace(path)
+        calls = list(trace.calls())
+        assert [r["question"] for r in trace.runs()] == questions, "Workflow arrivals not recorded"
+        assert len(trace) == len(calls) >= 7 and all(c["latency"] >= 0.02 and c["stage"] for c in calls)
+
+        # Served by prompt hash: the same answers, with the recorded latency (or none)
+        llm = ReplayLLM(trace, speed=0, strict=True)
+        replayed = [MultiAgentWorkflow(llm, llm).run(q, verbose=False) for q in questions]
+        assert [r["decision"] for r in replayed] == [r["decision"] for r in recorded], "Replay changed the answers"
+        timed = ReplayLLM(trace, speed=1, strict=True)
+        start = time.perf_counter()
+        MultiAgentWorkflow(timed, timed).run(questions[1], verbose=False)
+        assert time.perf_counter() - start >= 0.02 * 4, "Recorded latencies not reproduced"
+
+        prompt = [("human", "never recorded")]
+        try:
+            llm.invoke(prompt)
+            raise AssertionError("Strict replay served an unknown prompt")
+        except ReplayMiss:
+            pass
+        lenient = ReplayLLM(trace, speed=0, fallback=SimulatedLLM(latency_ms=0, tokens_per_second=0))
+        assert lenient.invoke(prompt).content, "Miss fallback returned nothing"
+        assert "".join(c.content for c in lenient.stream(prompt)) == lenient.invoke(prompt).content
+
+        # A record torn by a crash mid-write is ignored
+        with open(path, "ab") as f:
+            f.write(b"\x40\x00\x00")
+        assert len(Trace(path)) == len(calls), "Torn tail corrupted the index"
+
+        # N x driver: arrivals compressed, every run answered from the trace
+        report = asyncio.run(replay(MultiAgentWorkflow(llm, llm, coalesce=False), trace.runs(), 100, 1))
+        assert report["runs"] == 2 and report["errors"] == 0 and report["queue_delay"]["p99_s"] >= 0
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 